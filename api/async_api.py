@@ -0,0 +1,172 @@
+#!/usr/bin/python3
+#
+# async_api.py: contains the asyncio version of the API class, for running
+# many Binance API requests concurrently.
+#
+# Andrew Bishop
+# 2026/10/18
+#
+
+import asyncio
+import logging
+import time
+from typing import Iterable, List
+from urllib.parse import urlencode
+
+import aiohttp
+
+from api.general_api import API
+from api.rate_limit import classify_request, current_lane, rate_limiter, request_lane
+
+logger = logging.getLogger("main")
+
+
+# requests in flight at the same time per client
+DEFAULT_CONCURRENCY = 20
+
+
+class AsyncAPI:
+    """
+    Description:
+        Asynchronous Binance API client with the same request signing as
+        API. Every request is a coroutine so many can be awaited together
+        with asyncio.gather, at most max_concurrency of them are in flight at
+        once over one keep-alive connection pool. Use it as an async context
+        manager (or call close()) inside the event loop it is used on.
+        Requests wait for the process wide rate limiter like those of API.
+    Args:
+        api_key (str): api key
+        api_secret (str): api secret
+        base_url (str): REST base url
+        max_concurrency (int, optional): requests in flight at the same time
+        (defaults to DEFAULT_CONCURRENCY)
+        lane (int, optional): rate limiter lane of the market data requests
+        (defaults to the lane of the creating thread)
+    """
+
+    def __init__(self, api_key: str, api_secret: str, base_url: str,
+                 max_concurrency: int = DEFAULT_CONCURRENCY, lane: int = None):
+        self._api = API(api_key, api_secret, base_url)
+        self.max_concurrency = max_concurrency
+        self.lane = current_lane() if (lane is None) else lane
+        self._session = None
+        self._semaphore = None
+
+    async def __aenter__(self) -> "AsyncAPI":
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    # ----------------------------------------------------------
+    #                      Helper Functions
+    # ----------------------------------------------------------
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """
+        Description:
+            Returns the session of the running event loop, creating it on the
+            first request.
+        """
+        if self._session is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=self.max_concurrency),
+                headers={
+                    'Content-Type': 'application/json;charset=utf-8',
+                    'X-MBX-APIKEY': self._api.API_KEY
+                })
+        return self._session
+
+    def _acquire(self, http_method: str, url: str) -> float:
+        with request_lane(self.lane):
+            return rate_limiter.acquire(*classify_request(http_method, url))
+
+    async def _dispatch_request(self, http_method: str, url: str) -> dict:
+        """
+        Description:
+            Sends a request once fewer than max_concurrency are in flight and
+            the rate limiter has room for it.
+        Args:
+            http_method (str): http method for request
+            url (str): full url of the request
+        Raises:
+            ConnectionError: incase of a network connection error
+        Returns:
+            dict: api request response
+        """
+        session = self._get_session()
+        async with self._semaphore:
+            # the limiter blocks, so it is waited for on the default executor
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._acquire, http_method, url)
+            sent = time.time()
+            try:
+                async with session.request(http_method, url) as response:
+                    rate_limiter.update(response.status, response.headers, sent)
+                    return await response.json(content_type=None)
+            except aiohttp.ClientConnectionError:
+                # the query is left out of the log, it holds the signature
+                logger.error(f"Could not establish a connection ({http_method} "
+                             f"{url.split('?')[0]}).", exc_info=True)
+                raise ConnectionError
+
+    # ----------------------------------------------------------
+    #                     Main API Functions
+    # ----------------------------------------------------------
+
+    async def send_signed_request(self, http_method: str, url_path: str, payload: dict = None) -> dict:
+        """
+        Description:
+            Sends a signed API request for specified parameters.
+        Args:
+            http_method (str): http method used in api call
+            url_path (str): api url path specifying request
+            payload (dict, optional): dictionary of all request attributes
+            (defaults to None)
+        Raises:
+            ConnectionError: incase of a network connection error
+        Returns:
+            dict: api request response
+        """
+        url = self._api.signed_url(url_path, payload)
+        return await self._dispatch_request(http_method, url)
+
+    async def send_public_request(self, url_path: str, payload: dict = None) -> dict:
+        """
+        Description:
+            Sends a public API request for specified parameters.
+        Args:
+            url_path (str): api url path specifying request
+            payload (dict, optional): dictionary of all request attributes
+            (defaults to None)
+        Raises:
+            ConnectionError: incase of a network connection error
+        Returns:
+            dict: api request response
+        """
+        query_string = urlencode(payload or {}, True)
+        url = self._api.BASE_URL + url_path
+        if query_string:
+            url = url + '?' + query_string
+        return await self._dispatch_request('GET', url)
+
+    async def gather_public_requests(self, url_path: str, payloads: Iterable[dict]) -> List[dict]:
+        """
+        Description:
+            Sends one public request per payload concurrently.
+        Args:
+            url_path (str): api url path specifying request
+            payloads (Iterable[dict]): request attributes of every request
+        Returns:
+            List[dict]: responses in the order of the payloads, a request that
+            raised returns its exception
+        """
+        return await asyncio.gather(
+            *[self.send_public_request(url_path, payload) for payload in payloads],
+            return_exceptions=True)
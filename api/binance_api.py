@@ -6,7 +6,7 @@ from dataclasses import dataclass
 
 from classes.config import MethodType
 from api.general_api import API
-from functions.setup.setup import retrieve_keys
+from functions.setup.setup import retrieve_api_url, retrieve_keys
 
 
 @dataclass
@@ -15,7 +15,7 @@ class BinanceAPI:
     def __init__(self, method_type):
         self._method_type = method_type
 
-        base_url = "https://api.binance.com"
+        base_url = retrieve_api_url()
         api_key, api_secret = retrieve_keys()
 
         self._api = API(api_key, api_secret, base_url)
@@ -11,10 +11,12 @@ import requests
 import hashlib
 import hmac
 from dataclasses import dataclass
+from functools import partial
 from urllib.parse import urlencode
 from rich.pretty import pprint
 
 
+from api.http_transport import shared_session
 from functions.setup.setup import get_timestamp
 
 
@@ -55,17 +57,44 @@ class API:
         Returns:
             dict: api request status
         """
-        session = requests.Session()
-        session.headers.update({
+        # one pooled keep-alive session is shared by every API instance, so
+        # the headers of this instance are sent per request
+        session = shared_session(self.BASE_URL)
+        headers = {
             'Content-Type': 'application/json;charset=utf-8',
             'X-MBX-APIKEY': self.API_KEY
-        })
-        return {
+        }
+        return partial({
             'GET': session.get,
             'DELETE': session.delete,
             'PUT': session.put,
             'POST': session.post,
-        }.get(http_method, 'GET')
+        }.get(http_method, session.get), headers=headers)
+
+
+    def signed_url(self, url_path: str, payload: dict = None) -> str:
+        """
+        Description:
+            Returns the full url of a signed API request, with the timestamp
+            and signature added to the query string.
+        Args:
+            url_path (str): api url path specifying request
+            payload (dict, optional): dictionary of all request attributes 
+            (defaults to None)
+        Returns:
+            str: signed request url
+        """
+        if (payload == None):
+            payload = {}
+        query_string = urlencode(payload)
+        # replace single quote to double quote
+        query_string = query_string.replace('%27', '%22')
+        if query_string:
+            query_string = "{}&timestamp={}".format(query_string, get_timestamp())
+        else:
+            query_string = 'timestamp={}'.format(get_timestamp())
+
+        return self.BASE_URL + url_path + '?' + query_string + '&signature=' + self._hashing(query_string)
 
 
     # ----------------------------------------------------------
@@ -87,17 +116,7 @@ class API:
         Returns:
             dict: api request response
         """
-        if (payload == None):
-            payload = {}
-        query_string = urlencode(payload)
-        # replace single quote to double quote
-        query_string = query_string.replace('%27', '%22')
-        if query_string:
-            query_string = "{}&timestamp={}".format(query_string, get_timestamp())
-        else:
-            query_string = 'timestamp={}'.format(get_timestamp())
-
-        url = self.BASE_URL + url_path + '?' + query_string + '&signature=' + self._hashing(query_string)
+        url = self.signed_url(url_path, payload)
         params = {'url': url, 'params': {}}
         try:
             response = self._dispatch_request(http_method)(**params)
@@ -123,7 +142,7 @@ class API:
         if (payload == None):
             payload = {}
         query_string = urlencode(payload, True)
-        url = BASE_URL + url_path
+        url = self.BASE_URL + url_path
 
         if query_string:
             url = url + '?' + query_string
@@ -0,0 +1,132 @@
+"""
+Process wide pooled HTTP transport shared by every REST client.
+"""
+
+import threading
+import time
+from typing import Dict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from api.rate_limit import classify_request, rate_limiter
+
+
+# keep-alive connections held open per host, enough for the kline download
+# and resync thread pools plus the trading threads
+DEFAULT_POOL_SIZE = 32
+
+# hosts with their own connection pool
+MAX_HOSTS = 8
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """
+    Description:
+        Pooled adapter passing every request through the process wide rate
+        limiter: the request waits for its weight (and order count) before it
+        is sent and the limiter is synced with the usage headers of the
+        response.
+    """
+
+    def send(self, request, **kwargs):
+        weight, orders, lane = classify_request(request.method, request.url, request.body)
+        rate_limiter.acquire(weight, orders, lane)
+        sent = time.time()
+        response = super().send(request, **kwargs)
+        rate_limiter.update(response.status_code, response.headers, sent)
+        return response
+
+
+_adapters: Dict[str, HTTPAdapter] = {}  # 'scheme://host' to its adapter
+_pool_sizes: Dict[str, int] = {}
+_session = None
+_lock = threading.RLock()
+
+
+def _host_prefix(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def set_pool_size(url: str, pool_size: int):
+    """
+    Description:
+        Sets the keep-alive connections held open for the host of url, used
+        by sessions created or mounted afterwards.
+    Args:
+        url (str): any url of the host (ie. the api base url)
+        pool_size (int): connections kept open to the host
+    """
+    with _lock:
+        _pool_sizes[_host_prefix(url)] = pool_size
+
+
+def host_adapter(url: str) -> HTTPAdapter:
+    """
+    Description:
+        Returns the adapter holding the connection pool of the host of url.
+        Every session the adapter is mounted on reuses the same connections
+        and shares the rate limiter.
+    Args:
+        url (str): any url of the host
+    Returns:
+        HTTPAdapter: pooled adapter of the host
+    """
+    prefix = _host_prefix(url)
+    adapter = _adapters.get(prefix)
+    if adapter is None:
+        with _lock:
+            adapter = _adapters.get(prefix)
+            if adapter is None:
+                pool_size = _pool_sizes.get(prefix, DEFAULT_POOL_SIZE)
+                adapter = _adapters[prefix] = RateLimitedAdapter(
+                    pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+    return adapter
+
+
+def mount_pooled_adapter(session: requests.Session, url: str) -> requests.Session:
+    """
+    Description:
+        Sends the requests a session makes to the host of url through the
+        shared connection pool of the host (ie. a python-binance client
+        session).
+    Args:
+        session (requests.Session): session to mount the adapter on
+        url (str): any url of the host
+    Returns:
+        requests.Session: the session
+    """
+    session.mount(_host_prefix(url) + '/', host_adapter(url))
+    return session
+
+
+def shared_session(url: str) -> requests.Session:
+    """
+    Description:
+        Returns the process wide session, with the pooled adapter of the
+        host of url mounted. Headers that differ per client (ie. the api key)
+        are passed per request.
+    Args:
+        url (str): any url of the host the session is used for
+    Returns:
+        requests.Session: shared session
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                session = requests.Session()
+                # fall back to one shared pool for hosts that were not mounted
+                session.mount('https://', HTTPAdapter(
+                    pool_connections=MAX_HOSTS, pool_maxsize=DEFAULT_POOL_SIZE))
+                session.mount('http://', HTTPAdapter(
+                    pool_connections=MAX_HOSTS, pool_maxsize=DEFAULT_POOL_SIZE))
+                _session = session
+    prefix = _host_prefix(url) + '/'
+    if prefix not in _session.adapters:
+        with _lock:
+            if prefix not in _session.adapters:
+                _session.mount(prefix, host_adapter(url))
+    return _session
@@ -0,0 +1,417 @@
+"""
+Client side rate limiting for the Binance REST API.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger("main")
+
+
+# exchange limits per IP/account (see rateLimits of /api/v3/exchangeInfo)
+EXCHANGE_WEIGHT_PER_MINUTE = 6000
+EXCHANGE_ORDERS_PER_10_SECONDS = 50
+EXCHANGE_ORDERS_PER_DAY = 160000
+
+REQUEST_WEIGHT = 'REQUEST_WEIGHT'
+ORDERS = 'ORDERS'
+
+# usage headers of every response, followed by the interval (ie. 1M, 10S)
+USED_WEIGHT_HEADER = 'X-MBX-USED-WEIGHT-'
+ORDER_COUNT_HEADER = 'X-MBX-ORDER-COUNT-'
+
+# 429: over a limit, 418: banned for sending requests after a 429
+RATE_LIMIT_STATUSES = (429, 418)
+
+# seconds to hold requests after a 429/418 without a Retry-After header
+DEFAULT_RETRY_AFTER = 60
+
+# priority lanes, waiting callers of a lane go before every later lane
+ORDER_LANE = 0  # placing and cancelling orders
+ACCOUNT_LANE = 1  # balances and order status
+MARKET_LANE = 2  # live market data
+BACKFILL_LANE = 3  # bulk and historical downloads
+LANES = (ORDER_LANE, ACCOUNT_LANE, MARKET_LANE, BACKFILL_LANE)
+
+# share of the request weight per minute a lane leaves unused, so a backfill
+# that uses up its share still leaves room for orders and live data
+LANE_RESERVES = {
+    ORDER_LANE: 0.0,
+    ACCOUNT_LANE: 0.05,
+    MARKET_LANE: 0.15,
+    BACKFILL_LANE: 0.3,
+}
+
+# request weight of the endpoints used (with symbol, without symbol)
+ENDPOINT_WEIGHTS = {
+    '/api/v3/ping': (1, 1),
+    '/api/v3/time': (1, 1),
+    '/api/v3/klines': (2, 2),
+    '/api/v3/avgPrice': (2, 2),
+    '/api/v3/aggTrades': (4, 4),
+    '/api/v3/ticker/24hr': (2, 80),
+    '/api/v3/ticker/price': (2, 4),
+    '/api/v3/ticker/bookTicker': (2, 4),
+    '/api/v3/exchangeInfo': (20, 20),
+    '/api/v3/account': (20, 20),
+    '/api/v3/myTrades': (20, 20),
+    '/api/v3/openOrders': (6, 80),
+    '/api/v3/order': (4, 4),
+    '/api/v3/userDataStream': (2, 2),
+}
+
+# orders counted by a request to place them
+ORDER_ENDPOINTS = {
+    '/api/v3/order': 1,
+    '/api/v3/order/cancelReplace': 1,
+    '/api/v3/order/oco': 2,
+    '/api/v3/orderList/oco': 2,
+}
+
+# requests about the account rather than the market
+ACCOUNT_ENDPOINTS = {
+    '/api/v3/account', '/api/v3/myTrades', '/api/v3/openOrders',
+    '/api/v3/allOrders', '/api/v3/order', '/api/v3/userDataStream',
+}
+
+_INTERVAL_UNITS = {'S': 1, 'M': 60, 'H': 3600, 'D': 86400}
+_INTERVAL_NAMES = {'SECOND': 1, 'MINUTE': 60, 'HOUR': 3600, 'DAY': 86400}
+
+
+def _interval_seconds(suffix: str) -> int:
+    """
+    Description:
+        Returns the seconds of a usage header interval (ie. '1M', '10S'),
+        None if it is not an interval.
+    """
+    unit = _INTERVAL_UNITS.get(suffix[-1:])
+    if (unit is None) or (not suffix[:-1].isdigit()):
+        return None
+    return int(suffix[:-1])*unit
+
+
+def depth_request_weight(limit: int) -> int:
+    """
+    Description:
+        Returns the request weight of a /api/v3/depth request.
+    """
+    if limit <= 100:
+        return 5
+    if limit <= 500:
+        return 25
+    if limit <= 1000:
+        return 50
+    return 250
+
+
+def classify_request(http_method: str, url: str, body=None) -> Tuple[int, int, int]:
+    """
+    Description:
+        Returns the request weight, order count and lane of a request.
+    Args:
+        http_method (str): http method of the request
+        url (str): full url of the request
+        body (str, optional): url encoded body of the request (defaults to
+        None)
+    Returns:
+        Tuple[int, int, int]: request weight, orders placed and lane
+    """
+    parts = urlsplit(url)
+    path = parts.path
+    params = parse_qs(parts.query)
+    if isinstance(body, bytes):
+        body = body.decode(errors='ignore')
+    if isinstance(body, str):
+        params.update(parse_qs(body))
+
+    orders = ORDER_ENDPOINTS.get(path, 0) if (http_method == 'POST') else 0
+    if orders or ((http_method == 'DELETE') and path.startswith('/api/v3/order')):
+        return 1, orders, ORDER_LANE
+    if path == '/api/v3/depth':
+        weight = depth_request_weight(int(params.get('limit', ['100'])[0]))
+    else:
+        with_symbol, without_symbol = ENDPOINT_WEIGHTS.get(path, (1, 1))
+        weight = with_symbol if ('symbol' in params) else without_symbol
+    lane = ACCOUNT_LANE if (path in ACCOUNT_ENDPOINTS) else current_lane(MARKET_LANE)
+    return weight, 0, lane
+
+
+class TokenBucket:
+    """
+    Description:
+        Token bucket of one exchange limit (ie. 6000 request weight per
+        minute). Tokens refill evenly at limit/interval per second up to the
+        limit, so short bursts are allowed and sustained use is paced. The
+        exchange counts usage in fixed windows, so the usage of the current
+        window is also kept under the limit, counted locally and raised to
+        the usage headers the exchange sends back.
+    Args:
+        limit (int): usage allowed per interval
+        interval (int): seconds per interval
+    """
+
+    def __init__(self, limit: int, interval: int):
+        self.interval = interval
+        self.limit = limit
+        self.tokens = float(limit)
+        self.updated = time.monotonic()
+        self.window = int(time.time() // interval)
+        self.window_used = 0
+
+    @property
+    def rate(self) -> float:
+        return self.limit / self.interval
+
+    def set_limit(self, limit: int):
+        self.tokens = min(self.tokens + limit - self.limit, limit)
+        self.limit = limit
+
+    def advance(self, wall: float, now: float):
+        """
+        Description:
+            Refills the tokens up to now and starts a new window if the
+            current one ended.
+        Args:
+            wall (float): time.time() of now
+            now (float): time.monotonic() of now
+        """
+        self.tokens = min(self.limit, self.tokens + (now - self.updated)*self.rate)
+        self.updated = now
+        window = int(wall // self.interval)
+        if window != self.window:
+            self.window, self.window_used = window, 0
+
+    def wait_time(self, amount: int, reserve: float, wall: float) -> float:
+        """
+        Description:
+            Returns the seconds until amount can be taken with reserve left
+            over, 0 if it can be taken now.
+        """
+        amount = min(amount, self.limit)
+        reserve = min(reserve, self.limit - amount)
+        wait = 0.0
+        if self.tokens < amount + reserve:
+            wait = (amount + reserve - self.tokens) / self.rate
+        if self.window_used + amount + reserve > self.limit:
+            wait = max(wait, (self.window + 1)*self.interval - wall)
+        return wait
+
+    def take(self, amount: int):
+        self.tokens -= amount
+        self.window_used += amount
+
+    def sync(self, used: int, sent: float = None):
+        """
+        Description:
+            Raises the usage of the current window to the usage the exchange
+            reported, which includes requests of other programs on the same
+            IP/account. Reports of requests sent in an earlier window are
+            ignored.
+        Args:
+            used (int): usage of the window reported by the exchange
+            sent (float, optional): time.time() the request was sent
+            (defaults to None)
+        """
+        if (sent is not None) and (int(sent // self.interval) != self.window):
+            return
+        self.window_used = max(self.window_used, used)
+
+
+class RateLimiter:
+    """
+    Description:
+        Thread safe process wide limiter of request weight and order counts.
+        Callers block in acquire() exactly until their request fits in every
+        bucket, and waiting callers of a lane go before every later lane, so
+        orders are never starved by backfills. Each lane also leaves a share
+        of the request weight unused for the earlier lanes (LANE_RESERVES).
+        After a 429 or 418 response no request is sent until its Retry-After
+        has passed.
+    Args:
+        weight_per_minute (int, optional): request weight allowed per minute
+        (defaults to EXCHANGE_WEIGHT_PER_MINUTE)
+        orders_per_10_seconds (int, optional): orders allowed per 10 seconds
+        (defaults to EXCHANGE_ORDERS_PER_10_SECONDS)
+        orders_per_day (int, optional): orders allowed per day (defaults to
+        EXCHANGE_ORDERS_PER_DAY)
+        lane_reserves (Dict[int, float], optional): share of the weight each
+        lane leaves unused (defaults to LANE_RESERVES)
+    """
+
+    def __init__(self, weight_per_minute: int = EXCHANGE_WEIGHT_PER_MINUTE,
+                 orders_per_10_seconds: int = EXCHANGE_ORDERS_PER_10_SECONDS,
+                 orders_per_day: int = EXCHANGE_ORDERS_PER_DAY,
+                 lane_reserves: Dict[int, float] = None):
+        self._buckets = {
+            (REQUEST_WEIGHT, 60): TokenBucket(weight_per_minute, 60),
+            (ORDERS, 10): TokenBucket(orders_per_10_seconds, 10),
+            (ORDERS, 86400): TokenBucket(orders_per_day, 86400),
+        }
+        self.lane_reserves = dict(LANE_RESERVES if (lane_reserves is None) else lane_reserves)
+        self._condition = threading.Condition()
+        self._waiting = [0]*len(LANES)  # callers of each lane waiting for weight
+        self._retry_at = 0.0  # time.monotonic() requests are held until
+        self.waited = [0.0]*len(LANES)  # seconds waited by the callers of each lane
+
+    def set_limits(self, rate_limits: Iterable[dict]):
+        """
+        Description:
+            Sets the limits from the rateLimits of /api/v3/exchangeInfo.
+        Args:
+            rate_limits (Iterable[dict]): 'rateLimitType', 'interval',
+            'intervalNum' and 'limit' of every limit
+        """
+        with self._condition:
+            for rate_limit in rate_limits:
+                kind = rate_limit['rateLimitType']
+                if kind not in (REQUEST_WEIGHT, ORDERS):
+                    continue
+                interval = _INTERVAL_NAMES[rate_limit['interval']]*rate_limit.get('intervalNum', 1)
+                bucket = self._buckets.get((kind, interval))
+                if bucket is None:
+                    self._buckets[(kind, interval)] = TokenBucket(rate_limit['limit'], interval)
+                else:
+                    bucket.set_limit(rate_limit['limit'])
+            self._condition.notify_all()
+
+    def used_weight(self) -> int:
+        """
+        Description:
+            Returns the request weight used in the current minute.
+        """
+        with self._condition:
+            bucket = self._buckets[(REQUEST_WEIGHT, 60)]
+            bucket.advance(time.time(), time.monotonic())
+            return bucket.window_used
+
+    def retry_after(self) -> float:
+        """
+        Description:
+            Returns the seconds requests are held for after a 429/418.
+        """
+        return max(0.0, self._retry_at - time.monotonic())
+
+    def acquire(self, weight: int = 1, orders: int = 0, lane: int = MARKET_LANE) -> float:
+        """
+        Description:
+            Blocks until the request fits in every limit and records it.
+        Args:
+            weight (int, optional): request weight (defaults to 1)
+            orders (int, optional): orders the request places (defaults to 0)
+            lane (int, optional): priority lane of the request (defaults to
+            MARKET_LANE)
+        Returns:
+            float: seconds waited
+        """
+        start = time.monotonic()
+        queued = False
+        with self._condition:
+            try:
+                while True:
+                    wall, now = time.time(), time.monotonic()
+                    held = self._retry_at - now
+                    weight_wait = order_wait = 0.0
+                    for (kind, _), bucket in self._buckets.items():
+                        bucket.advance(wall, now)
+                        if kind == REQUEST_WEIGHT:
+                            reserve = bucket.limit*self.lane_reserves.get(lane, 0.0)
+                            weight_wait = max(weight_wait, bucket.wait_time(weight, reserve, wall))
+                        elif orders:
+                            order_wait = max(order_wait, bucket.wait_time(orders, 0, wall))
+                    ahead = any(self._waiting[:lane])
+                    if (held <= 0) and (weight_wait <= 0) and (order_wait <= 0) and (not ahead):
+                        for (kind, _), bucket in self._buckets.items():
+                            if kind == REQUEST_WEIGHT:
+                                bucket.take(weight)
+                            elif orders:
+                                bucket.take(orders)
+                        waited = time.monotonic() - start
+                        self.waited[lane] += waited
+                        return waited
+
+                    # only callers waiting for weight hold back later lanes,
+                    # an order waiting on the order count does not
+                    waiting_for_weight = (held > 0) or (weight_wait > 0) or ahead
+                    if waiting_for_weight != queued:
+                        queued = waiting_for_weight
+                        self._waiting[lane] += 1 if queued else -1
+                        if not queued:
+                            self._condition.notify_all()
+                    timeout = max(held, weight_wait, order_wait)
+                    self._condition.wait(timeout if (timeout > 0) else None)
+            finally:
+                if queued:
+                    self._waiting[lane] -= 1
+                    self._condition.notify_all()
+
+    def update(self, status: int, headers, sent: float = None):
+        """
+        Description:
+            Syncs the limiter with the usage headers of a response and holds
+            every request after a 429/418 until its Retry-After has passed.
+        Args:
+            status (int): http status of the response
+            headers (Mapping[str, str]): headers of the response
+            sent (float, optional): time.time() the request was sent
+            (defaults to None)
+        """
+        with self._condition:
+            wall, now = time.time(), time.monotonic()
+            for key, value in headers.items():
+                key = key.upper()
+                if key.startswith(USED_WEIGHT_HEADER):
+                    kind, suffix = REQUEST_WEIGHT, key[len(USED_WEIGHT_HEADER):]
+                elif key.startswith(ORDER_COUNT_HEADER):
+                    kind, suffix = ORDERS, key[len(ORDER_COUNT_HEADER):]
+                else:
+                    continue
+                bucket = self._buckets.get((kind, _interval_seconds(suffix)))
+                if bucket is not None:
+                    bucket.advance(wall, now)
+                    bucket.sync(int(value), sent)
+
+            if status in RATE_LIMIT_STATUSES:
+                retry_after = headers.get('Retry-After')
+                retry_after = int(retry_after) if retry_after else DEFAULT_RETRY_AFTER
+                self._retry_at = max(self._retry_at, now + retry_after)
+                if status == 418:
+                    logger.error(f"IP banned by the exchange, holding requests for {retry_after}s.")
+                else:
+                    logger.warning(f"Rate limited by the exchange, holding requests for {retry_after}s.")
+
+
+# limiter shared by every REST client of the process
+rate_limiter = RateLimiter()
+
+_lane = threading.local()
+
+
+def current_lane(default: int = MARKET_LANE) -> int:
+    """
+    Description:
+        Returns the lane set by request_lane on this thread, default if none.
+    """
+    lane = getattr(_lane, 'lane', None)
+    return default if (lane is None) else lane
+
+
+@contextmanager
+def request_lane(lane: int):
+    """
+    Description:
+        Sends the market data requests made on this thread inside the with
+        block through a lane (ie. BACKFILL_LANE for bulk downloads). Order
+        and account requests keep their own lanes.
+    Args:
+        lane (int): lane of the requests
+    """
+    previous = getattr(_lane, 'lane', None)
+    _lane.lane = lane
+    try:
+        yield
+    finally:
+        _lane.lane = previous
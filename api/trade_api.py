@@ -8,7 +8,7 @@ from typing import Dict
 from classes.config import MethodType, MethodConfig 
 from classes.trade import TradeType, TradeSide, TradeInfo 
 from api.general_api import API
-from functions.setup.setup import convert_time, retrieve_keys
+from functions.setup.setup import convert_time, retrieve_api_url, retrieve_keys
 from functions.trade.trade import get_profit_quantity, normalize_time
 
 @dataclass
@@ -28,7 +28,7 @@ class TradeAPI:
     def __init__(self, method_type):
         self._method_type = method_type
 
-        base_url = "https://api.binance.com"
+        base_url = retrieve_api_url()
         api_key, api_secret = retrieve_keys()
 
         self._api = API(api_key, api_secret, base_url)
@@ -22,6 +22,11 @@ class KlineInterval(Enum):
     _5m = 60 * 5
     _1m = 60
 
+    @classmethod
+    def from_string(cls, interval: str) -> "KlineInterval":
+        """Returns the member for a binance interval string (ie. '5m')."""
+        return cls[f"_{interval}"]
+
 
 # ----------------------------------------------------------
 #                       Dataclasses 
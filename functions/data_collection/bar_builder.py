@@ -0,0 +1,320 @@
+#!/usr/bin/python3
+#
+# bar_builder.py: contains the bar builders that turn the aggTrade stream of a
+# symbol into sub-minute time bars, tick bars, volume bars and dollar bars.
+#
+# Andrew Bishop
+# 2026/10/18
+#
+
+# modules imported
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List
+
+from functions.data_collection.kline_buffer import KlineBuffer, get_kline_buffer
+from functions.data_collection.kline_events import publish_candle
+from functions.data_collection.stream_multiplexer import StreamMultiplexer, register_stream_handler
+
+logger = logging.getLogger("main")
+
+
+# ----------------------------------constants-----------------------------------
+
+TIME_BAR = 'time'
+TICK_BAR = 'tick'
+VOLUME_BAR = 'volume'
+DOLLAR_BAR = 'dollar'
+
+# seconds between checks for time bars that ended without a newer trade
+BAR_FLUSH_INTERVAL = 1
+
+# seconds a time bar stays open after its end for trades still in flight
+BAR_CLOSE_DELAY = 0.25
+
+
+# -----------------------------------classes------------------------------------
+
+@dataclass(frozen=True)
+class BarSpec:
+    """
+    Description:
+        Kind and size of a bar, parsed from its name: '5s' is a 5 second time
+        bar, 'tick_100' closes every 100 trades, 'volume_50' every 50 base
+        asset traded and 'dollar_100000' every 100000 quote asset traded.
+    Args:
+        kind (str): 'time', 'tick', 'volume' or 'dollar'
+        size (float): seconds, trades, base quantity or quote quantity per bar
+    """
+    kind: str
+    size: float
+
+    @classmethod
+    def from_string(cls, name: str) -> "BarSpec":
+        if name.endswith('s') and name[:-1].isdigit():
+            seconds = int(name[:-1])
+            if (seconds < 1) or (60 % seconds):
+                raise ValueError(f"Time bars must divide a minute, got {name}.")
+            return cls(TIME_BAR, seconds)
+        kind, _, size = name.partition('_')
+        if (kind not in (TICK_BAR, VOLUME_BAR, DOLLAR_BAR)) or (not size):
+            raise ValueError(f"Unknown bar {name}.")
+        if float(size) <= 0:
+            raise ValueError(f"Bar size must be positive, got {name}.")
+        return cls(kind, float(size))
+
+    @property
+    def time_unit(self) -> str:
+        """
+        Description:
+            Returns the unit of the open times of the bars: unix seconds for
+            time bars like klines, unix ms for the other bars, which can open
+            several times a second.
+        """
+        return 's' if (self.kind == TIME_BAR) else 'ms'
+
+
+class BarBuilder:
+    """
+    Description:
+        Builds one kind of bar of a symbol from its trades, O(1) per trade.
+        The open bar is written to its kline buffer on every trade (same
+        columns as the klines: t, o, c, h, l, n, v) and a candle event is
+        published under the bar name, so bars are read with update_klines
+        and waited for with wait_for_candle like klines.
+
+        Time bars open at multiples of their size in unix seconds and close
+        once a trade of a later bar arrives or the flush thread sees their
+        time ran out, seconds without trades have no bar. Tick, volume and
+        dollar bars close with the trade that reaches their size (the trade
+        is not split) and their t is the open trade time in unix ms, bumped
+        by 1 if two bars open in the same ms. The unit of t is kept in the
+        time_unit of the buffer (and the attrs of its snapshots).
+    Args:
+        symbol (str): symbol of the trades
+        name (str): name of the bar (see BarSpec)
+        buffer (KlineBuffer): buffer the bars are written to
+    """
+
+    def __init__(self, symbol: str, name: str, buffer: KlineBuffer):
+        self.symbol = symbol.upper()
+        self.name = name
+        self.spec = BarSpec.from_string(name)
+        if buffer.time_unit != self.spec.time_unit:
+            raise ValueError(f"{name} bars need a buffer with times in {self.spec.time_unit}.")
+        self.buffer = buffer
+        self.lock = threading.Lock()
+        self.t = None  # open time of the open bar, None between bars
+        self.o = self.c = self.h = self.l = 0.0
+        self.n = self.v = 0.0
+        self.filled = 0.0  # trades, volume or quote volume of the open bar
+        self.last_t = buffer.last_time()
+
+    def _write(self):
+        self.buffer.update(self.t, self.o, self.c, self.h, self.l, self.n, self.v)
+
+    def _open(self, t: int, price: float):
+        if (self.last_t is not None) and (t <= self.last_t):
+            t = self.last_t + 1
+        self.t = self.last_t = t
+        self.o = self.c = self.h = self.l = price
+        self.n = self.v = self.filled = 0.0
+
+    def _close(self):
+        t = self.t
+        self.t = None
+        publish_candle(self.symbol, self.name, t, True)
+
+    def add_trade(self, trade_ms: int, price: float, quantity: float, trades: int = 1):
+        """
+        Description:
+            Adds one (aggregated) trade to the open bar.
+        Args:
+            trade_ms (int): trade time in unix ms
+            price (float): trade price
+            quantity (float): base quantity traded
+            trades (int, optional): trades aggregated in it (defaults to 1)
+        """
+        spec = self.spec
+        with self.lock:
+            if spec.kind == TIME_BAR:
+                seconds = trade_ms // 1000
+                t = seconds - seconds % spec.size
+                if (self.t is not None) and (t > self.t):
+                    self._close()
+                if self.t is None:
+                    if (self.last_t is not None) and (t <= self.last_t):
+                        return  # late trade of a closed bar
+                    self.t = self.last_t = t
+                    self.o = self.c = self.h = self.l = price
+                    self.n = self.v = 0.0
+                elif t < self.t:
+                    return
+            elif self.t is None:
+                self._open(trade_ms, price)
+
+            self.c = price
+            if price > self.h:
+                self.h = price
+            elif price < self.l:
+                self.l = price
+            self.n += trades
+            self.v += quantity
+            self._write()
+
+            if spec.kind == TIME_BAR:
+                publish_candle(self.symbol, self.name, self.t, False)
+                return
+            if spec.kind == TICK_BAR:
+                self.filled += trades
+            elif spec.kind == VOLUME_BAR:
+                self.filled += quantity
+            else:
+                self.filled += price*quantity
+            if self.filled >= spec.size:
+                self._close()
+            else:
+                publish_candle(self.symbol, self.name, self.t, False)
+
+    def flush(self, now: float = None) -> bool:
+        """
+        Description:
+            Closes the open time bar if its time ran out.
+        Args:
+            now (float, optional): unix time in seconds (defaults to now)
+        Returns:
+            bool: True if a bar was closed
+        """
+        if self.spec.kind != TIME_BAR:
+            return False
+        now = time.time() if (now is None) else now
+        with self.lock:
+            if (self.t is None) or (now < self.t + self.spec.size + BAR_CLOSE_DELAY):
+                return False
+            self._close()
+            return True
+
+
+# ----------------------------------functions-----------------------------------
+
+# symbol to its bar builders, lists are replaced instead of mutated so the
+# stream handler iterates them unlocked
+_builders: Dict[str, List[BarBuilder]] = {}
+_builders_lock = threading.Lock()
+_flush_thread = None
+
+
+def agg_trade_stream_name(symbol: str) -> str:
+    """
+    Description:
+        Returns the combined stream name of an aggTrade stream.
+    """
+    return f"{symbol.lower()}@aggTrade"
+
+
+def _handle_agg_trade(stream_name: str, data: dict):
+    """
+    Description:
+        Stream handler of aggTrade messages.
+    """
+    builders = _builders.get(data['s'])
+    if not builders:
+        return
+    price, quantity = float(data['p']), float(data['q'])
+    trades = data['l'] - data['f'] + 1
+    for builder in builders:
+        builder.add_trade(data['T'], price, quantity, trades)
+
+
+register_stream_handler('aggTrade', _handle_agg_trade)
+
+
+def flush_bars(now: float = None):
+    """
+    Description:
+        Closes the time bars of every symbol whose time ran out.
+    """
+    now = time.time() if (now is None) else now
+    for builders in list(_builders.values()):
+        for builder in builders:
+            builder.flush(now)
+
+
+def _flush_forever():
+    while True:
+        time.sleep(BAR_FLUSH_INTERVAL)
+        try:
+            flush_bars()
+        except Exception:
+            logger.error("Could not flush bars.", exc_info=True)
+
+
+def _start_flush_thread():
+    global _flush_thread
+    with _builders_lock:
+        if _flush_thread is None:
+            _flush_thread = threading.Thread(
+                target=_flush_forever, name="Bar_Flush_Thread", daemon=True)
+            _flush_thread.start()
+
+
+def add_bar_builders(symbol: str, bars: Iterable[str],
+                     limit: int = 500) -> Dict[str, KlineBuffer]:
+    """
+    Description:
+        Starts building bars of a symbol from the trades handed to the
+        aggTrade stream handler.
+    Args:
+        symbol (str): symbol of the trades
+        bars (Iterable[str]): names of the bars to build (see BarSpec)
+        limit (int, optional): bars held per buffer (defaults to 500)
+    Returns:
+        Dict[str, KlineBuffer]: bar name to its buffer
+    """
+    symbol = symbol.upper()
+    buffers = {}
+    with _builders_lock:
+        builders = list(_builders.get(symbol, []))
+        names = {builder.name for builder in builders}
+        for name in bars:
+            buffers[name] = get_kline_buffer(
+                symbol, name, capacity=limit, time_unit=BarSpec.from_string(name).time_unit)
+            if name not in names:
+                builders.append(BarBuilder(symbol, name, buffers[name]))
+                names.add(name)
+        _builders[symbol] = builders
+    _start_flush_thread()
+    return buffers
+
+
+def subscribe_bars(multiplexer: StreamMultiplexer, symbol: str,
+                   bars: Iterable[str] = ('1s', '5s', '15s'),
+                   limit: int = 500) -> Dict[str, KlineBuffer]:
+    """
+    Description:
+        Builds bars of a symbol from its aggTrade stream, added to the
+        multiplexer.
+    Args:
+        multiplexer (StreamMultiplexer): multiplexer carrying the stream
+        symbol (str): symbol of the trades
+        bars (Iterable[str], optional): names of the bars to build (defaults
+        to 1s, 5s and 15s time bars)
+        limit (int, optional): bars held per buffer (defaults to 500)
+    Returns:
+        Dict[str, KlineBuffer]: bar name to its buffer
+    """
+    buffers = add_bar_builders(symbol, bars, limit)
+    multiplexer.add_streams([agg_trade_stream_name(symbol)])
+    return buffers
+
+
+def unsubscribe_bars(multiplexer: StreamMultiplexer, symbol: str):
+    """
+    Description:
+        Removes the aggTrade stream of a symbol and stops building its bars.
+    """
+    multiplexer.remove_streams([agg_trade_stream_name(symbol)])
+    with _builders_lock:
+        _builders.pop(symbol.upper(), None)
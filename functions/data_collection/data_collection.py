@@ -8,16 +8,164 @@
 
 from binance.client import Client as ExternalClient 
 import binance
+import asyncio
+import json
 import os
 import requests
 import logging
-from random import randint
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 from functions.setup.setup import *
+from api.async_api import AsyncAPI
+from api.http_transport import mount_pooled_adapter
+from api.rate_limit import BACKFILL_LANE, RATE_LIMIT_STATUSES, request_lane
+from functions.data_collection.kline_buffer import get_kline_buffer
+from functions.data_collection.kline_events import wait_for_candle
+from functions.data_collection.kline_store import KlineStore
+from functions.data_collection.kline_archive import archive_klines, read_archived_klines, \
+    archived_ranges, add_archived_range, missing_ranges
+
+logger = logging.getLogger("main")
+
+# seconds to wait before retrying a request the exchange failed for a reason
+# other than rate limits (rate limited requests wait for the rate limiter)
+API_ERROR_WAIT = 5
 
 # ----------------------------------functions-----------------------------------
 
 
+@lru_cache(maxsize=None)
+def _client_class(api_url: str) -> type:
+    """
+    Description:
+        Returns a python-binance client class sending its requests to api_url.
+    """
+    return type("Client", (ExternalClient,), {'API_URL': f"{api_url}/api"})
+
+
+# (api url, api key, api secret) to the python-binance client of them
+_clients: Dict[Tuple[str, str, str], ExternalClient] = {}
+_clients_lock = threading.Lock()
+
+
+def _shared_client(api_url: str, api_key: str, api_secret: str) -> ExternalClient:
+    """
+    Description:
+        Returns the process wide python-binance client of api_url and the
+        keys, sending its requests through the pooled connections of the
+        host. The client pings the exchange once when it is created (after
+        the pooled adapter is mounted, so the ping is rate limited too),
+        which is done under a lock so threads starting together share one
+        client.
+    """
+    key = (api_url, api_key, api_secret)
+    client = _clients.get(key)  # lock free once the client exists
+    if client is not None:
+        return client
+    with _clients_lock:
+        if key not in _clients:
+            client = _client_class(api_url)(api_key, api_secret, ping=False)
+            mount_pooled_adapter(client.session, api_url)
+            client.ping()
+            _clients[key] = client
+        return _clients[key]
+
+
+def binance_client() -> ExternalClient:
+    """
+    Description:
+        Returns the shared python-binance client for the configured REST base
+        url (see retrieve_api_url) and keys, so downloads reuse keep-alive
+        connections instead of building a client per call.
+    Returns:
+        ExternalClient: python-binance client
+    """
+    return _shared_client(retrieve_api_url(), *retrieve_keys())
+
+
+def interval_seconds(interval: str) -> int:
+    """
+    Description:
+        Returns the length of a kline interval in seconds.
+    Args:
+        interval (str): interval of klines (ie. '5m', '1h')
+    Returns:
+        int: seconds per kline
+    """
+    return decode_interval(interval)*60
+
+
+def last_closed_open_time(interval: str, now: float = None) -> int:
+    """
+    Description:
+        Returns the open time (unix seconds) of the candle that is currently
+        open, which is the exclusive end of all closed candles.
+    Args:
+        interval (str): interval of klines
+        now (float, optional): unix timestamp in seconds (defaults to now)
+    Returns:
+        int: open time of the currently open candle
+    """
+    now = int(time.time() if (now is None) else now)
+    return now - now % interval_seconds(interval)
+
+
+def _fetch_klines_page(client: ExternalClient, symbol: str, interval: str,
+                       start_ms: int, end_ms: int) -> list:
+    """
+    Description:
+        Downloads one page of at most 1000 klines with start_ms <= open time
+        < end_ms.
+    """
+    with request_lane(BACKFILL_LANE):
+        return client.get_klines(
+            symbol=symbol,
+            interval=interval,
+            startTime=start_ms,
+            endTime=end_ms-1,
+            limit=1000)
+
+
+def fetch_klines_range(symbol: str, interval: str, start: int, end: int,
+                       max_workers: int = 8) -> pd.DataFrame:
+    """
+    Description:
+        Downloads all klines with start <= open time < end. The range is split
+        into 1000 kline pages with exact millisecond bounds which are
+        downloaded concurrently through the backfill lane of the rate
+        limiter, then put back together in order.
+    Args:
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+        start (int): first open time in unix seconds
+        end (int): open time in unix seconds to stop before
+        max_workers (int, optional): maximum concurrent requests (defaults
+        to 8)
+    Returns:
+        pd.DataFrame: downloaded klines in chronological order
+    """
+    page_ms = interval_seconds(interval)*1000*1000
+    start_ms, end_ms = start*1000, end*1000
+    pages = [(page_start, min(page_start + page_ms, end_ms))
+             for page_start in range(start_ms, end_ms, page_ms)]
+    if not pages:
+        return format_binance_klines([])
+
+    client = binance_client()
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(pages))) as pool:
+        results = pool.map(
+            lambda page: _fetch_klines_page(
+                client, symbol, interval, page[0], page[1]),
+            pages)
+        klines = [kline for page in results for kline in page]
+
+    klines = format_binance_klines(klines)
+    # pages can overlap if the exchange returns klines outside the bounds
+    return klines[~klines.index.duplicated(keep='last')].sort_index()
+
+
 def historical_klines(symbol: str, interval: str, limit: int, start_time: int = None) -> pd.DataFrame:
     """
     Description:
@@ -27,51 +175,53 @@ def historical_klines(symbol: str, interval: str, limit: int, start_time: int =
         interval (str): interval of klines to return
         limit (int): number of klines to download
         start_time (int, optional): start time in form of unix timestamp 
-        (defaults to None)
+        (defaults to the limit klines before the current candle)
     Raises:
         ValueError: incase no candles were downloaded
     Returns:
         pd.DataFrame: requested candles in chronological order (-1 item is 
         most recent)
     """
-    try:
-        interval = decode_interval(interval)
-        client = ExternalClient(*retrieve_keys())
-        if start_time:
-            start_time = kline_start_time(interval, limit)
-        if limit > 1000:
-            remainder = limit % 1000
-            if remainder:
-                klines = client.get_historical_klines(
-                    symbol=symbol,
-                    interval=encode_interval(interval),
-                    limit=remainder,
-                    start_str=str(start_time)
-                )[:remainder]
-                start_time += remainder*60*interval
-            else:
-                klines = []
-            factors = int((limit-remainder)/1000)
-            for index in range(factors):
-                klines += client.get_historical_klines(
-                    symbol=symbol,
-                    interval=encode_interval(interval),
-                    limit=1000,
-                    start_str=str(start_time)
-                )[:1000]
-                start_time += 1000*60*interval
-        else:
-            klines = client.get_historical_klines(
-                symbol=symbol,
-                interval=encode_interval(interval),
-                limit=limit,
-                start_str=str(start_time)
-            )[:limit]
-        return format_binance_klines(klines)
-    except:
-        if not len(klines):
-            raise ValueError
-        return format_binance_klines(klines)
+    step = interval_seconds(interval)
+    if start_time is None:
+        end = last_closed_open_time(interval) + step
+        start = end - limit*step
+    else:
+        start = int(start_time) - int(start_time) % step
+        end = start + limit*step
+    klines = fetch_klines_range(symbol, interval, start, end)
+    if not len(klines):
+        raise ValueError
+    return klines.iloc[-limit:]
+
+
+def sync_historical_klines(symbol: str, interval: str, start: int,
+                           end: int) -> int:
+    """
+    Description:
+        Makes sure the archive holds every closed kline with start <= open
+        time < end. Only the ranges missing from the archive coverage are
+        downloaded, so syncing an already archived range makes no requests.
+    Args:
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+        start (int): first open time in unix seconds
+        end (int): open time in unix seconds to stop before
+    Returns:
+        int: amount of klines downloaded
+    """
+    step = interval_seconds(interval)
+    start = start - start % step
+    # only closed candles are cached, the open candle is still changing
+    end = min(end - end % step, last_closed_open_time(interval))
+    downloaded = 0
+    for gap_start, gap_end in missing_ranges(
+            archived_ranges(symbol, interval), start, end):
+        klines = fetch_klines_range(symbol, interval, gap_start, gap_end)
+        archive_klines(symbol, interval, klines)
+        add_archived_range(symbol, interval, gap_start, gap_end)
+        downloaded += len(klines)
+    return downloaded
 
 
 def candle_data_file_path(symbol: str, interval: str, historical: bool = False) -> str:
@@ -94,10 +244,57 @@ def candle_data_file_path(symbol: str, interval: str, historical: bool = False)
                             f"{symbol}_{interval}.csv")
 
 
+def kline_store_file_path(symbol: str, interval: str) -> str:
+    """
+    Description:
+        Returns the file path of the memory mapped live kline store.
+    Args:
+        symbol (str): symbol of coin data
+        interval (str): interval of coin data
+    Returns:
+        str: file path for the kline store
+    """
+    return os.path.join('data', 'live_data', str(interval),
+                        f"{symbol.upper()}_{interval}.klines")
+
+
+def open_kline_store(symbol: str, interval: str,
+                     capacity: int = None) -> KlineStore:
+    """
+    Description:
+        Opens the memory mapped live kline store of a symbol/interval. Passing
+        a capacity creates the store for writing (ingest process only),
+        otherwise it is opened read only.
+    Args:
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+        capacity (int, optional): capacity of the store to create (defaults
+        to None)
+    Returns:
+        KlineStore: kline store of the symbol/interval
+    """
+    path = kline_store_file_path(symbol, interval)
+    if capacity:
+        return KlineStore.create(path, capacity)
+    return KlineStore(path)
+
+
 def download_for_backtest(symbol: str, interval: str, limit: int = 1000):
-    klines = historical_klines(symbol, interval, limit)
-    klines_to_csv(klines, symbol, interval, historical=True)
-    return klines
+    """
+    Description:
+        Returns the last X closed candles where X is the limit parameter,
+        only downloading the candles missing from the historical archive.
+    Args:
+        symbol (str): symbol of candles
+        interval (str): interval of candles
+        limit (int, optional): amount of candles (defaults to 1000)
+    Returns:
+        pd.DataFrame: candles indexed by open time
+    """
+    end = last_closed_open_time(interval)
+    start = end - limit*interval_seconds(interval)
+    sync_historical_klines(symbol, interval, start, end)
+    return read_archived_klines(symbol, interval, start, end).set_index('t')
 
 
 def download_to_csv(symbol: str, interval: str,
@@ -117,6 +314,73 @@ def download_to_csv(symbol: str, interval: str,
     return klines
 
 
+async def _download_recent_klines_async(api: AsyncAPI, symbol: str, interval: str,
+                                       limit: int) -> pd.DataFrame:
+    """
+    Description:
+        Downloads the most recent candles of a symbol without blocking the
+        event loop.
+    """
+    klines = await api.send_public_request('/api/v3/klines', {
+        'symbol': symbol, 'interval': interval, 'limit': min(limit, 1000)})
+    if isinstance(klines, dict):  # error response ie. {'code': -1121, 'msg': ...}
+        raise binance.exceptions.BinanceAPIException(None, 400, json.dumps(klines))
+    return format_binance_klines(klines)
+
+
+async def download_recent_klines_async(symbols: List[str], interval: str, limit: int = 500,
+                                       max_concurrency: int = 20) -> Dict[str, pd.DataFrame]:
+    """
+    Description:
+        Downloads the most recent candles of many symbols concurrently, so a
+        scan over the symbols takes about one round trip instead of one per
+        symbol. The requests go through the backfill lane of the rate
+        limiter.
+    Args:
+        symbols (List[str]): symbols of candles to download
+        interval (str): interval of candles to download
+        limit (int, optional): amount of candles to download per symbol, at
+        most 1000 (defaults to 500)
+        max_concurrency (int, optional): requests in flight at the same time
+        (defaults to 20)
+    Returns:
+        Dict[str, pd.DataFrame]: symbol to its candles, symbols whose download
+        failed are left out
+    """
+    async with AsyncAPI(*retrieve_keys(), retrieve_api_url(), max_concurrency,
+                        lane=BACKFILL_LANE) as api:
+        results = await asyncio.gather(
+            *[_download_recent_klines_async(api, symbol, interval, limit)
+              for symbol in symbols],
+            return_exceptions=True)
+    klines = {}
+    for symbol, result in zip(symbols, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Could not download {symbol} {interval} klines. {result}")
+            continue
+        klines[symbol] = result
+    return klines
+
+
+def download_many_to_csv(symbols: List[str], interval: str,
+                         limit: int = 500) -> Dict[str, pd.DataFrame]:
+    """
+    Description:
+        Downloads the specified candles of many symbols concurrently and
+        saves them to their csv files.
+    Args:
+        symbols (List[str]): symbols of currencies to download
+        interval (str): interval of candles to download
+        limit (int, optional): amount of candles to download (defaults to 500)
+    Returns:
+        Dict[str, pd.DataFrame]: symbol to the candles that were saved
+    """
+    klines = asyncio.run(download_recent_klines_async(list(symbols), interval, limit))
+    for symbol, symbol_klines in klines.items():
+        klines_to_csv(symbol_klines, symbol, interval)
+    return klines
+
+
 def klines_to_csv(klines: pd.DataFrame, symbol: str, interval: str,
                   historical: bool = False):
     """
@@ -136,20 +400,31 @@ def klines_to_csv(klines: pd.DataFrame, symbol: str, interval: str,
 
 
 def get_saved_klines(symbol: str, interval: str, limit: int = None,
-                     historical: bool = False) -> pd.DataFrame:
+                     historical: bool = False, *, start: int = None,
+                     end: int = None) -> pd.DataFrame:
     """
     Description:
-        Returns locally saved klines for specified parameters.
+        Returns locally saved klines for specified parameters. Historical
+        klines are read from the monthly archive, only opening the partitions
+        between start and end.
     Args:
         symbol (str): symbol of klines
         interval (str): interval of klines
-        limit (int, optional): amount of candles to return (defaults to 1000)
+        limit (int, optional): amount of candles to return, the newest of the
+            range for historical klines (defaults to None, every candle)
         historical (bool, optional): True if historical data, false otherwise 
-            (defaults to False)
+            (defaults to False, True if start or end is given)
+        start (int, optional): keyword only, first open time in unix seconds
+            of historical klines (defaults to None)
+        end (int, optional): keyword only, open time in unix seconds to stop
+            before of historical klines (defaults to None)
     Returns:
         pd.DataFrame: klines specified by parameters
     """
-    klines = pd.read_csv(candle_data_file_path(symbol, interval, historical))
+    if historical or (start is not None) or (end is not None):
+        klines = read_archived_klines(symbol, interval, start, end)
+        return klines if (limit == None) else klines.iloc[-limit:]
+    klines = pd.read_csv(candle_data_file_path(symbol, interval))
     if (limit == None):
         return klines
     else:
@@ -173,13 +448,15 @@ def download_recent_klines(symbol: str, interval: str,
         try:
             if (limit > 1000):  # this func cant do over 1000 func but other func can
                 return historical_klines(symbol, interval, limit)
-            client = ExternalClient(*retrieve_keys())
+            client = binance_client()
             klines = client.get_klines(
                 symbol=symbol, interval=interval, limit=limit)
-        except binance.exceptions.BinanceAPIException:
-            # use random to stagger incase multiple api errors are raised simultaneously
-            wait_time = randint(30, 90)
-            time.sleep(wait_time)
+        except binance.exceptions.BinanceAPIException as e:
+            # rate limited requests are retried right away, the rate limiter
+            # holds them until the Retry-After of the exchange has passed
+            if e.status_code not in RATE_LIMIT_STATUSES:
+                logger.warning(f"Could not download {symbol} {interval} klines. {e}")
+                time.sleep(API_ERROR_WAIT)
         except requests.exceptions.ConnectionError:
             time.sleep(20)
         else:
@@ -191,7 +468,9 @@ def get_klines(symbol: str, limit: int, interval: str = '1m',
                offset: int = -1) -> pd.DataFrame:
     """
     Description:
-        Returns candles specified by parameters.
+        Returns candles specified by parameters from the klines held in
+        memory, waiting for a stream to publish them (or downloading them if
+        none does).
     Args:
         symbol (str): symbol of candles to return
         limit (int): amount of candles to return
@@ -204,25 +483,17 @@ def get_klines(symbol: str, limit: int, interval: str = '1m',
     Returns:
         pd.DataFrame: candles specified by input parameters
     """
-    klines = []
+    buffer = get_kline_buffer(symbol, interval)
     count = 0
-    while True:
-        try:
-            klines = pd.read_csv(os.path.join(
-                "data",
-                "live_data",
-                f"{interval}",
-                f"{symbol.upper()}_{interval}.csv"))
-
-            if len(klines):
-                break
-            else:
-                download_to_csv(symbol, interval)
-        except:
-            pass
+    while not len(buffer):
+        if count and (count % 3 == 0):
+            # no stream filled the buffer, seed it from the exchange
+            buffer.load(download_recent_klines(symbol, interval, buffer.capacity))
+        else:
+            # wake up as soon as a stream publishes a candle for the symbol
+            wait_for_candle(symbol, interval, timeout=2)
         count += 1
-        color = SECONDARY_COLOR if count < 3 else RED
-        time.sleep(2)
+    klines = buffer.snapshot()
     if offset == -1:
         return klines.iloc[-int(limit):]
     elif offset != -1:
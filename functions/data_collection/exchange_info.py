@@ -0,0 +1,294 @@
+#!/usr/bin/python3
+#
+# exchange_info.py: contains the symbol filter cache, which keeps the parsed
+# filters of every symbol from /api/v3/exchangeInfo in memory, persisted to
+# disk and refreshed in the background.
+#
+# Andrew Bishop
+# 2026/10/18
+#
+
+# modules imported
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict
+
+import binance
+import requests
+
+from api.rate_limit import rate_limiter
+from functions.data_collection.data_collection import binance_client
+
+logger = logging.getLogger("main")
+
+
+# ----------------------------------constants-----------------------------------
+
+# file the last download is persisted to, so a restart starts without one
+EXCHANGE_INFO_FILE = os.path.join('data', 'exchange_info.json')
+
+# seconds between background refreshes
+EXCHANGE_INFO_REFRESH_INTERVAL = 60*60
+
+# seconds before the cache is too old to use without downloading it first
+# (ie. a file persisted before a long downtime)
+EXCHANGE_INFO_TTL = 24*60*60
+
+# seconds before a failed background refresh is retried
+EXCHANGE_INFO_RETRY_INTERVAL = 60
+
+# seconds the cache must be old before a lookup of an unknown symbol (ie. a
+# symbol listed since the last refresh) downloads it again
+UNKNOWN_SYMBOL_REFRESH_INTERVAL = 60
+
+
+# -----------------------------------classes------------------------------------
+
+@dataclass(frozen=True)
+class SymbolFilters:
+    """
+    Description:
+        Trading rules of one symbol, parsed from its exchangeInfo entry.
+    """
+    symbol: str
+    status: str
+    base_asset: str
+    quote_asset: str
+    base_asset_precision: int
+    tick_size: float
+    min_price: float
+    max_price: float
+    step_size: float
+    min_qty: float
+    max_qty: float
+    min_notional: float
+    max_notional: float
+
+    @classmethod
+    def from_symbol_info(cls, info: dict) -> "SymbolFilters":
+        filters = {item['filterType']: item for item in info['filters']}
+        price = filters.get('PRICE_FILTER', {})
+        lot_size = filters.get('LOT_SIZE', {})
+        # MIN_NOTIONAL was replaced by NOTIONAL on the exchange
+        notional = filters.get('MIN_NOTIONAL') or filters.get('NOTIONAL', {})
+        return cls(
+            symbol=info['symbol'],
+            status=info.get('status', 'TRADING'),
+            base_asset=info.get('baseAsset', ''),
+            quote_asset=info.get('quoteAsset', ''),
+            base_asset_precision=int(info.get('baseAssetPrecision', 8)),
+            tick_size=float(price.get('tickSize', 0)),
+            min_price=float(price.get('minPrice', 0)),
+            max_price=float(price.get('maxPrice', 0)),
+            step_size=float(lot_size.get('stepSize', 0)),
+            min_qty=float(lot_size.get('minQty', 0)),
+            max_qty=float(lot_size.get('maxQty', 0)),
+            min_notional=float(notional.get('minNotional', 0)),
+            max_notional=float(filters.get('NOTIONAL', {}).get('maxNotional', 0)))
+
+
+class ExchangeInfoCache:
+    """
+    Description:
+        Symbol keyed index of the exchangeInfo filters. Lookups only read
+        memory: the first one loads the persisted download (or downloads it
+        if there is none or it is older than the ttl) and starts a thread
+        that refreshes it in the background. The index is replaced (never
+        mutated) on refresh so it is read without a lock.
+    Args:
+        path (str, optional): file the download is persisted to (defaults to
+        EXCHANGE_INFO_FILE)
+        refresh_interval (float, optional): seconds between background
+        refreshes (defaults to EXCHANGE_INFO_REFRESH_INTERVAL)
+        ttl (float, optional): seconds before the cache must be downloaded
+        before it is used (defaults to EXCHANGE_INFO_TTL)
+    """
+
+    def __init__(self, path: str = EXCHANGE_INFO_FILE,
+                 refresh_interval: float = EXCHANGE_INFO_REFRESH_INTERVAL,
+                 ttl: float = EXCHANGE_INFO_TTL):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.ttl = ttl
+        self.updated = 0.0  # unix time of the download
+        self.refreshes = 0
+        self._response = None
+        self._info: Dict[str, dict] = {}  # symbol to its exchangeInfo entry
+        self._filters: Dict[str, SymbolFilters] = {}
+        self._lock = threading.Lock()  # held while loading or downloading
+        self._thread = None
+
+    def age(self) -> float:
+        """
+        Description:
+            Returns the seconds since the cached exchangeInfo was downloaded.
+        """
+        return time.time() - self.updated
+
+    def _index(self, response: dict, updated: float):
+        symbols = response['symbols']
+        self._info = {info['symbol']: info for info in symbols}
+        self._filters = {info['symbol']: SymbolFilters.from_symbol_info(info)
+                         for info in symbols}
+        self._response = response
+        self.updated = updated
+        rate_limiter.set_limits(response.get('rateLimits', []))
+
+    def load(self) -> bool:
+        """
+        Description:
+            Loads the persisted download.
+        Returns:
+            bool: True if it was loaded
+        """
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+            self._index(saved['exchangeInfo'], saved['updated'])
+        except (OSError, ValueError, KeyError):
+            return False
+        return True
+
+    def save(self):
+        """
+        Description:
+            Persists the current download, replacing the file atomically.
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({'updated': self.updated, 'exchangeInfo': self._response}, f)
+        os.replace(temp_path, self.path)
+
+    def refresh(self):
+        """
+        Description:
+            Downloads exchangeInfo, indexes it and persists it.
+        Raises:
+            binance.exceptions.BinanceAPIException, requests.exceptions.
+            ConnectionError: if the download fails
+        """
+        response = binance_client().get_exchange_info()
+        self._index(response, time.time())
+        self.refreshes += 1
+        try:
+            self.save()
+        except OSError:
+            logger.warning(f"Could not save exchange info to {self.path}.", exc_info=True)
+
+    def _refresh_forever(self):
+        while True:
+            time.sleep(max(self.refresh_interval - self.age(), 0))
+            try:
+                with self._lock:
+                    self.refresh()
+            except (binance.exceptions.BinanceAPIException,
+                    requests.exceptions.ConnectionError):
+                logger.warning("Could not refresh exchange info.", exc_info=True)
+                time.sleep(EXCHANGE_INFO_RETRY_INTERVAL)
+            except Exception:
+                # anything else (ie. a timeout or a malformed response) must
+                # not end the thread, or the filters go stale for good
+                logger.error("Exchange info refresh failed.", exc_info=True)
+                time.sleep(EXCHANGE_INFO_RETRY_INTERVAL)
+
+    def start(self) -> "ExchangeInfoCache":
+        """
+        Description:
+            Loads the cache (see ensure_loaded) and starts refreshing it in the
+            background.
+        """
+        self.ensure_loaded()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._refresh_forever, name="Exchange_Info_Thread", daemon=True)
+                self._thread.start()
+        return self
+
+    def ensure_loaded(self):
+        """
+        Description:
+            Loads the persisted download, downloading it if there is none or
+            it is older than the ttl.
+        """
+        if self._response is not None and (self.age() < self.ttl):
+            return
+        with self._lock:
+            if self._response is None:
+                self.load()
+            if (self._response is None) or (self.age() >= self.ttl):
+                self.refresh()
+
+    def _prepare(self, symbol: str) -> str:
+        """
+        Description:
+            Makes sure the cache is loaded before a lookup, downloading it
+            again if the symbol is not in it and the cache is older than
+            UNKNOWN_SYMBOL_REFRESH_INTERVAL. Returns the symbol in upper case.
+        """
+        if self._thread is None:
+            self.start()
+        elif self.age() >= self.ttl:
+            self.ensure_loaded()
+        symbol = symbol.upper()
+        if (symbol not in self._info) and (self.age() > UNKNOWN_SYMBOL_REFRESH_INTERVAL):
+            with self._lock:
+                if self.age() > UNKNOWN_SYMBOL_REFRESH_INTERVAL:
+                    self.refresh()
+        return symbol
+
+    def filters(self, symbol: str) -> SymbolFilters:
+        """
+        Description:
+            Returns the parsed filters of a symbol.
+        Raises:
+            KeyError: if the exchange does not list the symbol
+        """
+        symbol = self._prepare(symbol)
+        return self._filters[symbol]
+
+    def symbol_info(self, symbol: str) -> dict:
+        """
+        Description:
+            Returns the exchangeInfo entry of a symbol.
+        Raises:
+            KeyError: if the exchange does not list the symbol
+        """
+        symbol = self._prepare(symbol)
+        return self._info[symbol]
+
+    def exchange_info(self) -> dict:
+        """
+        Description:
+            Returns the whole cached exchangeInfo response.
+        """
+        if self._thread is None:
+            self.start()
+        return self._response
+
+
+# ----------------------------------functions-----------------------------------
+
+# cache shared by the whole process
+exchange_info_cache = ExchangeInfoCache()
+
+
+def symbol_filters(symbol: str) -> SymbolFilters:
+    """
+    Description:
+        Returns the trading rules of a symbol from memory.
+    Args:
+        symbol (str): symbol of the filters
+    Returns:
+        SymbolFilters: parsed filters of the symbol
+    Raises:
+        KeyError: if the exchange does not list the symbol
+    """
+    return exchange_info_cache.filters(symbol)
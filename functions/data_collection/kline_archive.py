@@ -0,0 +1,292 @@
+#!/usr/bin/python3
+#
+# kline_archive.py: contains all functions for the historical kline archive,
+# which is partitioned into one columnar kline file per symbol/interval/month.
+#
+# Andrew Bishop
+# 2026/10/18
+#
+
+# modules imported
+import json
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from functions.data_collection.kline_buffer import KLINE_COLUMNS, KLINE_DTYPES, klines_to_arrays
+from functions.data_collection.kline_store import read_kline_file, write_kline_file
+
+
+# ----------------------------------functions-----------------------------------
+
+def archive_directory(symbol: str, interval: str) -> str:
+    """
+    Description:
+        Returns the directory holding the archive partitions of a
+        symbol/interval.
+    Args:
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+    Returns:
+        str: directory of the archive partitions
+    """
+    return os.path.join('data', 'historical_data', str(interval),
+                        symbol.upper())
+
+
+def archive_partition_path(symbol: str, interval: str, month: str) -> str:
+    """
+    Description:
+        Returns the file path of one monthly archive partition.
+    Args:
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+        month (str): month of partition in 'YYYY-MM' form
+    Returns:
+        str: file path of the partition
+    """
+    return os.path.join(archive_directory(symbol, interval),
+                        f"{symbol.upper()}_{interval}_{month}.klines")
+
+
+def archive_coverage_path(symbol: str, interval: str) -> str:
+    """
+    Description:
+        Returns the file path of the coverage manifest, which lists the time
+        ranges that have already been downloaded into the archive.
+    Args:
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+    Returns:
+        str: file path of the coverage manifest
+    """
+    return os.path.join(archive_directory(symbol, interval), "coverage.json")
+
+
+def _months(t: np.ndarray) -> np.ndarray:
+    """
+    Description:
+        Returns the 'YYYY-MM' partition month of every open time.
+    Args:
+        t (np.ndarray): open times in unix seconds
+    Returns:
+        np.ndarray: partition month of every open time
+    """
+    return np.asarray(t, dtype='datetime64[s]').astype(
+        'datetime64[M]').astype(str)
+
+
+def _merge_arrays(old: Dict[str, np.ndarray],
+                  new: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    Description:
+        Merges two sets of kline columns, sorted by open time. Klines in new
+        replace klines in old with the same open time.
+    """
+    merged = {column: np.concatenate([new[column], old[column]])
+              for column in KLINE_COLUMNS}
+    # np.unique keeps the first occurrence, which is the newer kline
+    _, index = np.unique(merged['t'], return_index=True)
+    return {column: values[index] for column, values in merged.items()}
+
+
+def archive_klines(symbol: str, interval: str, klines):
+    """
+    Description:
+        Writes klines into the monthly archive partitions, merging them with
+        any klines already archived. Writing the same klines twice does not
+        change the archive.
+    Args:
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+        klines (pd.DataFrame | dict): klines formatted like
+        format_binance_klines or binance_klines_to_arrays
+    """
+    arrays = klines_to_arrays(klines)
+    if not len(arrays['t']):
+        return
+    months = _months(arrays['t'])
+    for month in np.unique(months):
+        mask = (months == month)
+        partition = {column: values[mask] for column, values in arrays.items()}
+        path = archive_partition_path(symbol, interval, month)
+        if os.path.isfile(path):
+            partition = _merge_arrays(
+                {column: np.array(values)
+                 for column, values in read_kline_file(path).items()},
+                partition)
+        else:
+            partition = _merge_arrays(
+                {column: partition[column][:0] for column in KLINE_COLUMNS},
+                partition)
+        write_kline_file(path, partition)
+
+
+def archived_months(symbol: str, interval: str) -> List[str]:
+    """
+    Description:
+        Returns the months that have an archive partition, oldest first.
+    Args:
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+    Returns:
+        List[str]: partition months in 'YYYY-MM' form
+    """
+    directory = archive_directory(symbol, interval)
+    if not os.path.isdir(directory):
+        return []
+    prefix = f"{symbol.upper()}_{interval}_"
+    return sorted(
+        file_name[len(prefix):-len('.klines')]
+        for file_name in os.listdir(directory)
+        if file_name.startswith(prefix) and file_name.endswith('.klines'))
+
+
+def read_archived_arrays(symbol: str, interval: str, start: int = None,
+                         end: int = None) -> Dict[str, np.ndarray]:
+    """
+    Description:
+        Returns the archived klines with start <= t < end as numpy columns.
+        Only the partitions overlapping the range are opened and the row
+        bounds are found by binary search on the open time column.
+    Args:
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+        start (int, optional): first open time in unix seconds (defaults to
+        the oldest archived kline)
+        end (int, optional): open time to stop before in unix seconds
+        (defaults to after the newest archived kline)
+    Returns:
+        Dict[str, np.ndarray]: column name to array of values
+    """
+    months = archived_months(symbol, interval)
+    if start is not None:
+        first_month = str(_months([start])[0])
+        months = [month for month in months if month >= first_month]
+    if end is not None:
+        last_month = str(_months([end-1])[0])
+        months = [month for month in months if month <= last_month]
+
+    parts = []
+    for month in months:
+        columns = read_kline_file(archive_partition_path(symbol, interval, month))
+        lower = 0 if (start is None) else \
+            np.searchsorted(columns['t'], start, side='left')
+        upper = len(columns['t']) if (end is None) else \
+            np.searchsorted(columns['t'], end, side='left')
+        if upper > lower:
+            parts.append({column: values[lower:upper]
+                          for column, values in columns.items()})
+
+    if not parts:
+        return {column: np.zeros(0, dtype=KLINE_DTYPES[column])
+                for column in KLINE_COLUMNS}
+    return {column: np.concatenate([part[column] for part in parts])
+            for column in KLINE_COLUMNS}
+
+
+def read_archived_klines(symbol: str, interval: str, start: int = None,
+                         end: int = None) -> pd.DataFrame:
+    """
+    Description:
+        Returns the archived klines with start <= t < end (see
+        read_archived_arrays) as a dataframe with an open time column 't'.
+    Args:
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+        start (int, optional): first open time in unix seconds
+        end (int, optional): open time to stop before in unix seconds
+    Returns:
+        pd.DataFrame: archived klines in chronological order
+    """
+    return pd.DataFrame(read_archived_arrays(symbol, interval, start, end),
+                        columns=list(KLINE_COLUMNS))
+
+
+# -----------------------------------coverage-----------------------------------
+
+def merge_ranges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    Description:
+        Merges overlapping or touching [start, end) ranges.
+    Args:
+        ranges (List[Tuple[int, int]]): ranges to merge
+    Returns:
+        List[Tuple[int, int]]: sorted, non overlapping ranges
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def missing_ranges(covered: List[Tuple[int, int]], start: int,
+                   end: int) -> List[Tuple[int, int]]:
+    """
+    Description:
+        Returns the parts of [start, end) that are not in the covered ranges
+        (the missing head, tail and interior gaps).
+    Args:
+        covered (List[Tuple[int, int]]): merged covered ranges
+        start (int): start of requested range
+        end (int): end of requested range (exclusive)
+    Returns:
+        List[Tuple[int, int]]: missing ranges in chronological order
+    """
+    missing = []
+    cursor = start
+    for covered_start, covered_end in covered:
+        if covered_end <= cursor:
+            continue
+        if covered_start >= end:
+            break
+        if covered_start > cursor:
+            missing.append((cursor, covered_start))
+        cursor = max(cursor, covered_end)
+    if cursor < end:
+        missing.append((cursor, end))
+    return missing
+
+
+def archived_ranges(symbol: str, interval: str) -> List[Tuple[int, int]]:
+    """
+    Description:
+        Returns the [start, end) open time ranges (unix seconds) that have
+        already been downloaded into the archive.
+    Args:
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+    Returns:
+        List[Tuple[int, int]]: merged downloaded ranges
+    """
+    path = archive_coverage_path(symbol, interval)
+    if not os.path.isfile(path):
+        return []
+    with open(path, 'r') as f:
+        return merge_ranges([tuple(item) for item in json.load(f)])
+
+
+def add_archived_range(symbol: str, interval: str, start: int, end: int):
+    """
+    Description:
+        Marks [start, end) as downloaded in the coverage manifest. The range
+        is recorded even if the exchange had no klines in it, so gaps in the
+        exchange data are not downloaded again.
+    Args:
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+        start (int): start of downloaded range in unix seconds
+        end (int): end of downloaded range in unix seconds (exclusive)
+    """
+    ranges = merge_ranges(archived_ranges(symbol, interval) + [(start, end)])
+    path = archive_coverage_path(symbol, interval)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump([list(item) for item in ranges], f)
+    os.replace(tmp_path, path)
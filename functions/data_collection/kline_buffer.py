@@ -0,0 +1,243 @@
+#!/usr/bin/python3
+#
+# kline_buffer.py: contains the in-memory ring buffer used to hold live klines.
+#
+# Andrew Bishop
+# 2026/10/18
+#
+
+# modules imported
+import threading
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# ----------------------------------constants-----------------------------------
+
+# column order matches the dataframes returned by format_binance_klines
+KLINE_COLUMNS = ('t', 'o', 'c', 'h', 'l', 'n', 'v')
+KLINE_DTYPES = {
+    't': np.int64,
+    'o': np.float64,
+    'c': np.float64,
+    'h': np.float64,
+    'l': np.float64,
+    'n': np.float64,
+    'v': np.float64,
+}
+
+# units of the open times 't' of a buffer: unix seconds for klines and time
+# bars, unix ms for bars that can open several times a second (ie. tick bars)
+TIME_UNITS = ('s', 'ms')
+
+
+# ----------------------------------functions-----------------------------------
+
+def klines_to_arrays(klines) -> Dict[str, np.ndarray]:
+    """
+    Description:
+        Returns the kline columns as typed numpy arrays. Accepts either a
+        dataframe (indexed or keyed by open time 't') or the dict returned by
+        binance_klines_to_arrays, which is passed through without copying.
+    Args:
+        klines (pd.DataFrame | dict): klines to convert
+    Returns:
+        Dict[str, np.ndarray]: column name to array of values
+    """
+    if isinstance(klines, pd.DataFrame):
+        if 't' not in klines.columns:
+            klines = klines.reset_index()
+        return {column: klines[column].to_numpy(dtype=KLINE_DTYPES[column])
+                for column in KLINE_COLUMNS}
+    return {column: np.asarray(klines[column], dtype=KLINE_DTYPES[column])
+            for column in KLINE_COLUMNS}
+
+
+# -----------------------------------classes------------------------------------
+
+class KlineBuffer:
+    """
+    Description:
+        Fixed size OHLCV ring buffer for a single symbol/interval. Every update
+        is done in place in O(1) and readers get a consistent copy through
+        snapshot().
+    Args:
+        capacity (int): maximum amount of klines held in the buffer
+        time_unit (str, optional): unit of the open times, 's' or 'ms'
+        (defaults to 's')
+    """
+
+    def __init__(self, capacity: int, time_unit: str = 's'):
+        if capacity < 1:
+            raise ValueError(f"Buffer capacity must be positive, got {capacity}.")
+        if time_unit not in TIME_UNITS:
+            raise ValueError(f"Unknown time unit {time_unit}.")
+        self.capacity = capacity
+        self.time_unit = time_unit
+        self.lock = threading.Lock()
+        self._columns = {
+            column: np.zeros(capacity, dtype=KLINE_DTYPES[column])
+            for column in KLINE_COLUMNS}
+        self._head = 0  # index of the next slot to be written
+        self._count = 0
+        self._last_t = None  # open time of the newest kline, kept as an int
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _last_index(self) -> int:
+        return (self._head - 1) % self.capacity
+
+    def _write(self, index: int, t: int, o: float, c: float, h: float,
+               l: float, n: float, v: float):
+        columns = self._columns
+        columns['t'][index] = t
+        columns['o'][index] = o
+        columns['c'][index] = c
+        columns['h'][index] = h
+        columns['l'][index] = l
+        columns['n'][index] = n
+        columns['v'][index] = v
+
+    def update(self, t: int, o: float, c: float, h: float, l: float,
+               n: float, v: float) -> bool:
+        """
+        Description:
+            Writes the newest kline into the buffer. If the kline has the same
+            open time as the last kline it replaces it, otherwise it is
+            appended and the oldest kline is dropped once the buffer is full.
+            Klines older than the last kline are ignored.
+        Args:
+            t (int): open time of kline
+            o (float): open price
+            c (float): close price
+            h (float): high price
+            l (float): low price
+            n (float): number of trades
+            v (float): volume
+        Returns:
+            bool: True if a new kline was appended, False if the last kline
+            was updated in place (or the kline was stale)
+        """
+        with self.lock:
+            last_t = self._last_t
+            if last_t is not None:
+                if t == last_t:
+                    self._write(self._last_index(), t, o, c, h, l, n, v)
+                    return False
+                if t < last_t:
+                    return False
+            self._write(self._head, t, o, c, h, l, n, v)
+            self._head = (self._head + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+            self._last_t = t
+            return True
+
+    def load(self, klines):
+        """
+        Description:
+            Replaces the contents of the buffer with the klines passed as
+            argument (formatted like format_binance_klines or
+            binance_klines_to_arrays).
+        Args:
+            klines (pd.DataFrame | dict): klines to load
+        """
+        arrays = klines_to_arrays(klines)
+        count = min(len(arrays['t']), self.capacity)
+        with self.lock:
+            for column in KLINE_COLUMNS:
+                values = arrays[column]
+                self._columns[column][:count] = values[len(values)-count:]
+            self._count = count
+            self._head = count % self.capacity
+            self._last_t = int(self._columns['t'][count-1]) if count else None
+
+    def last_time(self) -> int:
+        """
+        Description:
+            Returns the open time of the most recent kline, None if empty.
+        """
+        with self.lock:
+            return self._last_t
+
+    def arrays(self, limit: int = None) -> Dict[str, np.ndarray]:
+        """
+        Description:
+            Returns a chronological copy of the klines as numpy columns.
+        Args:
+            limit (int, optional): amount of most recent klines to return
+            (defaults to all klines in the buffer)
+        Returns:
+            Dict[str, np.ndarray]: column name to array of values
+        """
+        with self.lock:
+            count = self._count if (limit is None) else min(limit, self._count)
+            start = (self._head - count) % self.capacity
+            order = (start + np.arange(count)) % self.capacity
+            return {column: self._columns[column][order]
+                    for column in KLINE_COLUMNS}
+
+    def snapshot(self, limit: int = None) -> pd.DataFrame:
+        """
+        Description:
+            Returns a consistent chronological copy of the klines in the same
+            layout as the old live data csv files (column 't' and a range
+            index), with the unit of 't' in attrs['time_unit'].
+        Args:
+            limit (int, optional): amount of most recent klines to return
+            (defaults to all klines in the buffer)
+        Returns:
+            pd.DataFrame: copy of the klines in the buffer
+        """
+        klines = pd.DataFrame(self.arrays(limit), columns=list(KLINE_COLUMNS))
+        klines.attrs['time_unit'] = self.time_unit
+        return klines
+
+
+# ----------------------------------functions-----------------------------------
+
+_buffers: Dict[Tuple[str, str], KlineBuffer] = {}
+_buffers_lock = threading.Lock()
+
+
+def get_kline_buffer(symbol: str, interval: str,
+                     capacity: int = 500, time_unit: str = 's') -> KlineBuffer:
+    """
+    Description:
+        Returns the process wide kline buffer of the symbol/interval, creating
+        it if it does not exist yet.
+    Args:
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+        capacity (int, optional): capacity used if the buffer is created
+        (defaults to 500)
+        time_unit (str, optional): unit of the open times used if the buffer
+        is created (defaults to 's')
+    Returns:
+        KlineBuffer: buffer for the symbol/interval
+    """
+    key = (symbol.upper(), interval)
+    buffer = _buffers.get(key)  # lock free once the buffer exists
+    if buffer is not None:
+        return buffer
+    with _buffers_lock:
+        if key not in _buffers:
+            _buffers[key] = KlineBuffer(capacity, time_unit)
+        return _buffers[key]
+
+
+def register_kline_buffer(symbol: str, interval: str, buffer):
+    """
+    Description:
+        Replaces the process wide kline buffer of the symbol/interval, for
+        example with a KlineStore so the klines are shared with other
+        processes.
+    Args:
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+        buffer: buffer with the same interface as KlineBuffer
+    """
+    with _buffers_lock:
+        _buffers[(symbol.upper(), interval)] = buffer
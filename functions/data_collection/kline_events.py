@@ -0,0 +1,363 @@
+#!/usr/bin/python3
+#
+# kline_events.py: contains the publish/subscribe surface of the kline feed,
+# which tells consumers when a candle was updated or closed.
+#
+# Andrew Bishop
+# 2026/10/18
+#
+
+# modules imported
+import asyncio
+import logging
+import queue
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Tuple
+
+logger = logging.getLogger("main")
+
+
+# ----------------------------------constants-----------------------------------
+
+CANDLE_UPDATED = 'updated'
+CANDLE_CLOSED = 'closed'
+
+# threads delivering candle events to the subscribed callbacks
+DELIVERY_WORKERS = 4
+
+
+# -----------------------------------classes------------------------------------
+
+@dataclass(frozen=True)
+class CandleEvent:
+    """
+    Description:
+        Candle update of a symbol/interval.
+    Args:
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+        t (int): open time of the candle in unix seconds
+        closed (bool): True if the candle is final (the kline 'x' flag)
+    """
+    symbol: str
+    interval: str
+    t: int
+    closed: bool
+
+    @property
+    def kind(self) -> str:
+        return CANDLE_CLOSED if self.closed else CANDLE_UPDATED
+
+
+class _CandleSubscription:
+    """
+    Description:
+        Delivers the candle events of one callback on the delivery threads.
+        Updates of the open candle published while the callback is busy
+        collapse into the latest one, closed candles are always delivered in
+        order, so a slow callback never builds up a backlog.
+    """
+
+    def __init__(self, topic: "_CandleTopic",
+                 callback: Callable[["CandleEvent"], None], closed_only: bool):
+        self.topic = topic
+        self.callback = callback
+        self.closed_only = closed_only
+        self.lock = threading.Lock()
+        self.closed = deque()  # closed candle events waiting for delivery
+        self.latest = None  # latest open candle event waiting for delivery
+        self.queued = False  # True while waiting for or being delivered
+        self.active = True
+
+    def offer(self, event: "CandleEvent"):
+        """
+        Description:
+            Adds an event to the pending events and queues the subscription
+            for delivery.
+        """
+        coalesced = 0
+        with self.lock:
+            if not self.active:
+                return
+            if self.latest is not None:
+                # the pending update is superseded by this event
+                coalesced, self.latest = 1, None
+            if event.closed:
+                self.closed.append(event)
+            else:
+                self.latest = event
+            queue_it = not self.queued
+            self.queued = True
+        if coalesced:
+            self.topic.count(coalesced=coalesced)
+        if queue_it:
+            _delivery_queue.put(self)
+
+    def deliver(self):
+        """
+        Description:
+            Calls the callback with the pending events, then queues the
+            subscription again if events were published meanwhile.
+        """
+        with self.lock:
+            events = list(self.closed)
+            self.closed.clear()
+            if self.latest is not None:
+                events.append(self.latest)
+                self.latest = None
+        for event in events:
+            try:
+                self.callback(event)
+            except Exception:
+                logger.error(f"Candle callback failed for "
+                             f"{event.symbol}/{event.interval}.", exc_info=True)
+        self.topic.count(delivered=len(events))
+        with self.lock:
+            self.queued = bool(self.closed) or (self.latest is not None)
+            requeue = self.queued and self.active
+        if requeue:
+            _delivery_queue.put(self)
+
+
+class _CandleTopic:
+    """
+    Description:
+        Subscribers and waiters of the candle events of one symbol/interval.
+        The versions count the events published so far, waiters compare them
+        so an event published between two waits is not missed.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.updates = 0  # every published event
+        self.closes = 0  # closed candle events
+        self.subscriptions: List[_CandleSubscription] = []
+        self.futures: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future, bool]] = []
+        self.delivered = 0  # events handed to a consumer
+        self.coalesced = 0  # updates a consumer skipped for a newer one
+
+    def version(self, closed_only: bool) -> int:
+        return self.closes if closed_only else self.updates
+
+    def count(self, delivered: int = 0, coalesced: int = 0):
+        with self.condition:
+            self.delivered += delivered
+            self.coalesced += coalesced
+
+
+# ----------------------------------functions-----------------------------------
+
+# candle topics, keys are (SYMBOL, interval)
+_topics: Dict[Tuple[str, str], _CandleTopic] = {}
+_topics_lock = threading.Lock()
+
+
+def _topic(symbol: str, interval: str) -> _CandleTopic:
+    key = (symbol.upper(), interval)
+    topic = _topics.get(key)
+    if topic is None:
+        with _topics_lock:
+            topic = _topics.setdefault(key, _CandleTopic())
+    return topic
+
+
+def _resolve(future: asyncio.Future, version: int):
+    if not future.done():
+        future.set_result(version)
+
+
+# subscriptions with events waiting for delivery
+_delivery_queue: "queue.Queue[_CandleSubscription]" = queue.Queue()
+_delivery_threads: List[threading.Thread] = []
+_delivery_lock = threading.Lock()
+
+
+def _deliver_forever():
+    while True:
+        _delivery_queue.get().deliver()
+
+
+def _start_delivery_threads():
+    with _delivery_lock:
+        while len(_delivery_threads) < DELIVERY_WORKERS:
+            thread = threading.Thread(
+                target=_deliver_forever, daemon=True,
+                name=f"Candle_Delivery_Thread_{len(_delivery_threads)}")
+            thread.start()
+            _delivery_threads.append(thread)
+
+
+def publish_candle(symbol: str, interval: str, t: int, closed: bool):
+    """
+    Description:
+        Publishes a candle event after the kline buffer was updated. Wakes the
+        threads and coroutines waiting for it and hands it to the subscribed
+        callbacks, which are called on the delivery threads.
+    Args:
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+        t (int): open time of the candle in unix seconds
+        closed (bool): True if the candle is final
+    """
+    topic = _topic(symbol, interval)
+    with topic.condition:
+        topic.updates += 1
+        if closed:
+            topic.closes += 1
+        topic.condition.notify_all()
+        updates, closes = topic.updates, topic.closes
+        subscriptions = topic.subscriptions
+        futures = topic.futures
+        if futures:
+            # waiters that were cancelled or whose loop closed are dropped
+            futures = [(loop, future, closed_only) for loop, future, closed_only in futures
+                       if not (future.done() or loop.is_closed())]
+            topic.futures = [
+                waiter for waiter in futures if waiter[2] and not closed]
+    for loop, future, closed_only in futures:
+        if closed or not closed_only:
+            try:
+                loop.call_soon_threadsafe(
+                    _resolve, future, closes if closed_only else updates)
+            except RuntimeError:
+                # the loop closed since it was checked
+                pass
+
+    event = None
+    for subscription in subscriptions:
+        if closed or not subscription.closed_only:
+            if event is None:
+                event = CandleEvent(symbol.upper(), interval, int(t), closed)
+            subscription.offer(event)
+
+
+def subscribe_candles(symbol: str, interval: str,
+                      callback: Callable[[CandleEvent], None],
+                      closed_only: bool = False) -> Callable[[], None]:
+    """
+    Description:
+        Calls callback with the candle events of the symbol/interval on the
+        delivery threads, one event at a time per callback. If the callback
+        falls behind, updates of the open candle collapse into the latest one,
+        closed candles are always delivered.
+    Args:
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+        callback (Callable[[CandleEvent], None]): called with every event
+        closed_only (bool, optional): only call back when a candle closed
+        (defaults to False)
+    Returns:
+        Callable[[], None]: removes the subscription
+    """
+    _start_delivery_threads()
+    topic = _topic(symbol, interval)
+    subscription = _CandleSubscription(topic, callback, closed_only)
+    with topic.condition:
+        # lists are replaced instead of mutated so publishers can iterate
+        # them unlocked
+        topic.subscriptions = topic.subscriptions + [subscription]
+
+    def unsubscribe():
+        with subscription.lock:
+            subscription.active = False
+        with topic.condition:
+            topic.subscriptions = [item for item in topic.subscriptions
+                                   if item is not subscription]
+    return unsubscribe
+
+
+def candle_version(symbol: str, interval: str, closed_only: bool = False) -> int:
+    """
+    Description:
+        Returns the number of candle events published so far for the
+        symbol/interval (see wait_for_candle).
+    """
+    topic = _topic(symbol, interval)
+    with topic.condition:
+        return topic.version(closed_only)
+
+
+def wait_for_candle(symbol: str, interval: str, since: int = None,
+                    closed_only: bool = False, timeout: float = None) -> int:
+    """
+    Description:
+        Blocks until a candle event newer than since is published. Pass the
+        returned version back as since so events published while the caller
+        was busy wake it up straight away.
+    Args:
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+        since (int, optional): version already seen (defaults to waiting for
+        the next event)
+        closed_only (bool, optional): only wake up when a candle closed
+        (defaults to False)
+        timeout (float, optional): maximum seconds to wait (defaults to no
+        limit)
+    Returns:
+        int: version of the latest event, equal to since on timeout
+    """
+    topic = _topic(symbol, interval)
+    with topic.condition:
+        if since is None:
+            since = topic.version(closed_only)
+        topic.condition.wait_for(
+            lambda: topic.version(closed_only) > since, timeout)
+        version = topic.version(closed_only)
+        if version > since:
+            # the caller only sees the latest of the events it missed
+            topic.delivered += 1
+            topic.coalesced += version - since - 1
+        return version
+
+
+def candle_counters(symbol: str, interval: str) -> Dict[str, int]:
+    """
+    Description:
+        Returns the event counters of the symbol/interval stream: events
+        published, events delivered to consumers (callbacks and waiters) and
+        open candle updates that were coalesced into a newer update because
+        the consumer was behind.
+    Args:
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+    Returns:
+        Dict[str, int]: 'published', 'closed', 'delivered' and 'coalesced'
+        counts
+    """
+    topic = _topic(symbol, interval)
+    with topic.condition:
+        return {
+            'published': topic.updates,
+            'closed': topic.closes,
+            'delivered': topic.delivered,
+            'coalesced': topic.coalesced}
+
+
+async def wait_for_candle_async(symbol: str, interval: str,
+                                closed_only: bool = False) -> int:
+    """
+    Description:
+        Waits for the next candle event of the symbol/interval without
+        blocking the event loop.
+    Args:
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+        closed_only (bool, optional): only wake up when a candle closed
+        (defaults to False)
+    Returns:
+        int: version of the event
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    topic = _topic(symbol, interval)
+    waiter = (loop, future, closed_only)
+    with topic.condition:
+        topic.futures = topic.futures + [waiter]
+    try:
+        return await future
+    finally:
+        # a cancelled waiter must not outlive its loop
+        with topic.condition:
+            topic.futures = [other for other in topic.futures if other is not waiter]
@@ -0,0 +1,305 @@
+#!/usr/bin/python3
+#
+# kline_store.py: contains the memory mapped columnar kline files that are
+# shared between processes.
+#
+# Andrew Bishop
+# 2026/10/18
+#
+
+# modules imported
+import os
+import threading
+import time
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from functions.data_collection.kline_buffer import KLINE_COLUMNS, KLINE_DTYPES, klines_to_arrays
+
+
+# ----------------------------------constants-----------------------------------
+
+STORE_MAGIC = b'KLN1'
+STORE_VERSION = 1
+
+# flag set when every row is written twice so any window is contiguous
+FLAG_MIRRORED = 1
+
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S4'),
+    ('version', '<u4'),
+    ('rows', '<i8'),        # allocated rows per column
+    ('capacity', '<i8'),    # maximum amount of klines held
+    ('count', '<i8'),       # amount of klines currently held
+    ('head', '<i8'),        # index of the next slot to be written
+    ('seq', '<u8'),         # odd while the writer is updating the file
+    ('flags', '<u4'),
+    ('reserved', 'V20'),
+])
+HEADER_SIZE = HEADER_DTYPE.itemsize
+
+
+# ----------------------------------functions-----------------------------------
+
+def _map_file(path: str, mode: str, rows: int = None) -> tuple:
+    """
+    Description:
+        Memory maps a kline file and returns its header and column views.
+    Args:
+        path (str): file path of kline file
+        mode (str): numpy memmap mode ('r', 'r+' or 'w+')
+        rows (int, optional): rows per column, only needed when creating
+    Returns:
+        tuple: memmap, header record and dict of column arrays
+    """
+    if mode == 'w+':
+        size = HEADER_SIZE + rows*len(KLINE_COLUMNS)*8
+        mm = np.memmap(path, dtype=np.uint8, mode='w+', shape=(size,))
+    else:
+        mm = np.memmap(path, dtype=np.uint8, mode=mode)
+    header = mm[:HEADER_SIZE].view(HEADER_DTYPE)
+    if mode == 'w+':
+        header['magic'] = STORE_MAGIC
+        header['version'] = STORE_VERSION
+        header['rows'] = rows
+    elif header['magic'][0] != STORE_MAGIC:
+        raise ValueError(f"{path} is not a kline store file.")
+    rows = int(header['rows'][0])
+    columns = {}
+    for index, column in enumerate(KLINE_COLUMNS):
+        start = HEADER_SIZE + index*rows*8
+        columns[column] = mm[start:start+rows*8].view(KLINE_DTYPES[column])
+    return mm, header, columns
+
+
+def write_kline_file(path: str, arrays: Dict[str, np.ndarray]):
+    """
+    Description:
+        Writes chronological kline columns to a flat (non ring) kline file.
+        The file is written next to the destination and moved into place so
+        readers never see a partially written file.
+    Args:
+        path (str): file path of kline file
+        arrays (Dict[str, np.ndarray]): column name to array of values
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    count = len(arrays['t'])
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    mm, header, columns = _map_file(tmp_path, 'w+', rows=max(count, 1))
+    for column in KLINE_COLUMNS:
+        columns[column][:count] = arrays[column]
+    header['capacity'] = count
+    header['count'] = count
+    header['head'] = count
+    mm.flush()
+    del mm, header, columns
+    os.replace(tmp_path, path)
+
+
+def read_kline_file(path: str) -> Dict[str, np.ndarray]:
+    """
+    Description:
+        Memory maps a flat kline file written by write_kline_file.
+    Args:
+        path (str): file path of kline file
+    Returns:
+        Dict[str, np.ndarray]: zero-copy read only column arrays
+    """
+    _, header, columns = _map_file(path, 'r')
+    count = int(header['count'][0])
+    return {column: values[:count] for column, values in columns.items()}
+
+
+# -----------------------------------classes------------------------------------
+
+class KlineStore:
+    """
+    Description:
+        Memory mapped ring buffer of klines for a single symbol/interval.
+        One process creates the store and writes into it with the same
+        interface as KlineBuffer, any number of processes open it read only
+        and read the columns without copying or parsing.
+
+        Every row is written twice (at i and i + capacity) so the most recent
+        klines are always one contiguous slice of each column.
+    Args:
+        path (str): file path of the store
+        writer (bool): True if this process writes to the store
+    """
+
+    time_unit = 's'  # stores hold klines, their open times are unix seconds
+
+    def __init__(self, path: str, writer: bool = False):
+        self.path = path
+        self.writer = writer
+        self.lock = threading.Lock()
+        self._mm, header, self._columns = _map_file(
+            path, 'r+' if writer else 'r')
+        self._header = header
+        self.capacity = int(header['capacity'][0])
+
+    @classmethod
+    def create(cls, path: str, capacity: int) -> "KlineStore":
+        """
+        Description:
+            Creates (or truncates) the store file and opens it for writing.
+        Args:
+            path (str): file path of the store
+            capacity (int): maximum amount of klines held in the store
+        Returns:
+            KlineStore: writable store
+        """
+        if capacity < 1:
+            raise ValueError(f"Store capacity must be positive, got {capacity}.")
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        mm, header, _ = _map_file(path, 'w+', rows=2*capacity)
+        header['capacity'] = capacity
+        header['flags'] = FLAG_MIRRORED
+        mm.flush()
+        del mm, header
+        return cls(path, writer=True)
+
+    # ----------------------------------------------------------
+    #                      Helper Functions
+    # ----------------------------------------------------------
+
+    def _get(self, field: str) -> int:
+        return int(self._header[field][0])
+
+    def _set(self, field: str, value: int):
+        self._header[field] = value
+
+    def _write(self, index: int, values: tuple):
+        for column, value in zip(KLINE_COLUMNS, values):
+            self._columns[column][index] = value
+            self._columns[column][index+self.capacity] = value
+
+    def _begin_write(self):
+        self._set('seq', self._get('seq') + 1)
+
+    def _end_write(self):
+        self._set('seq', self._get('seq') + 1)
+
+    # ----------------------------------------------------------
+    #                      Writer Functions
+    # ----------------------------------------------------------
+
+    def __len__(self) -> int:
+        return self._get('count')
+
+    def update(self, t: int, o: float, c: float, h: float, l: float,
+               n: float, v: float) -> bool:
+        """
+        Description:
+            Writes the newest kline into the store (see KlineBuffer.update).
+        Returns:
+            bool: True if a new kline was appended, False otherwise
+        """
+        with self.lock:
+            count, head = self._get('count'), self._get('head')
+            values = (t, o, c, h, l, n, v)
+            if count:
+                last = (head - 1) % self.capacity
+                last_t = self._columns['t'][last]
+                if t < last_t:
+                    return False
+                if t == last_t:
+                    self._begin_write()
+                    self._write(last, values)
+                    self._end_write()
+                    return False
+            self._begin_write()
+            self._write(head, values)
+            self._set('head', (head + 1) % self.capacity)
+            self._set('count', min(count + 1, self.capacity))
+            self._end_write()
+            return True
+
+    def load(self, klines):
+        """
+        Description:
+            Replaces the contents of the store with the klines passed as
+            argument (see KlineBuffer.load).
+        Args:
+            klines (pd.DataFrame | dict): klines to load
+        """
+        arrays = klines_to_arrays(klines)
+        count = min(len(arrays['t']), self.capacity)
+        with self.lock:
+            self._begin_write()
+            for column in KLINE_COLUMNS:
+                values = arrays[column][len(arrays[column])-count:]
+                self._columns[column][:count] = values
+                self._columns[column][self.capacity:self.capacity+count] = values
+            self._set('count', count)
+            self._set('head', count % self.capacity)
+            self._end_write()
+
+    # ----------------------------------------------------------
+    #                      Reader Functions
+    # ----------------------------------------------------------
+
+    def last_time(self) -> int:
+        """
+        Description:
+            Returns the open time of the most recent kline, None if empty.
+        """
+        columns = self.columns(1)
+        return int(columns['t'][0]) if len(columns['t']) else None
+
+    def columns(self, limit: int = None) -> Dict[str, np.ndarray]:
+        """
+        Description:
+            Returns zero-copy chronological views of the most recent klines.
+            The views keep pointing into the file, so the newest kline keeps
+            updating and the oldest kline can be replaced once the store is
+            full. Use arrays() for a consistent copy.
+        Args:
+            limit (int, optional): amount of most recent klines to return
+            (defaults to all klines in the store)
+        Returns:
+            Dict[str, np.ndarray]: column name to array of values
+        """
+        count, head = self._get('count'), self._get('head')
+        count = count if (limit is None) else min(limit, count)
+        end = head + self.capacity
+        return {column: values[end-count:end]
+                for column, values in self._columns.items()}
+
+    def arrays(self, limit: int = None) -> Dict[str, np.ndarray]:
+        """
+        Description:
+            Returns a consistent chronological copy of the most recent klines.
+            Retries while the writer is in the middle of an update.
+        Args:
+            limit (int, optional): amount of most recent klines to return
+            (defaults to all klines in the store)
+        Returns:
+            Dict[str, np.ndarray]: column name to array of values
+        """
+        while True:
+            seq = self._get('seq')
+            if seq % 2:
+                time.sleep(0)
+                continue
+            arrays = {column: np.array(values)
+                      for column, values in self.columns(limit).items()}
+            if self._get('seq') == seq:
+                return arrays
+
+    def snapshot(self, limit: int = None) -> pd.DataFrame:
+        """
+        Description:
+            Returns a consistent copy of the klines in the same layout as
+            KlineBuffer.snapshot.
+        Args:
+            limit (int, optional): amount of most recent klines to return
+            (defaults to all klines in the store)
+        Returns:
+            pd.DataFrame: copy of the klines in the store
+        """
+        klines = pd.DataFrame(self.arrays(limit), columns=list(KLINE_COLUMNS))
+        klines.attrs['time_unit'] = self.time_unit
+        return klines
@@ -0,0 +1,445 @@
+#!/usr/bin/python3
+#
+# order_book.py: contains the local order books kept in sync from a REST
+# depth snapshot and the depth diff streams, and the liquidity queries
+# (best bid/ask, depth, expected fill price) answered from them.
+#
+# Andrew Bishop
+# 2026/10/18
+#
+
+# modules imported
+import bisect
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from functions.data_collection.data_collection import binance_client
+from functions.data_collection.stream_multiplexer import StreamMultiplexer, register_stream_handler, \
+    register_reconnect_handler
+
+logger = logging.getLogger("main")
+
+
+# ----------------------------------constants-----------------------------------
+
+# price levels per side of the REST snapshot
+SNAPSHOT_LIMIT = 1000
+
+# threads downloading snapshots of books that lost sync
+RESYNC_WORKERS = 4
+
+# snapshots tried before a resync gives up until the next diff arrives
+RESYNC_ATTEMPTS = 5
+
+# diff events buffered while waiting for a snapshot, older ones are dropped
+PENDING_LIMIT = 1000
+
+BUY = 'BUY'
+SELL = 'SELL'
+
+
+# ----------------------------------functions-----------------------------------
+
+def depth_stream_name(symbol: str, speed: str = '100ms') -> str:
+    """
+    Description:
+        Returns the combined stream name of a depth diff stream.
+    Args:
+        symbol (str): symbol of the order book
+        speed (str, optional): update speed, '100ms' or '1000ms' (defaults
+        to '100ms')
+    Returns:
+        str: stream name (ie. 'btcusdt@depth@100ms')
+    """
+    if speed == '1000ms':
+        return f"{symbol.lower()}@depth"
+    return f"{symbol.lower()}@depth@{speed}"
+
+
+def fetch_depth_snapshot(symbol: str, limit: int = SNAPSHOT_LIMIT) -> dict:
+    """
+    Description:
+        Downloads the order book of a symbol from the REST api.
+    Args:
+        symbol (str): symbol of the order book
+        limit (int, optional): price levels per side (defaults to
+        SNAPSHOT_LIMIT)
+    Returns:
+        dict: 'lastUpdateId', 'bids' and 'asks' ([price, quantity] strings)
+    """
+    return binance_client().get_order_book(symbol=symbol.upper(), limit=limit)
+
+
+# -----------------------------------classes------------------------------------
+
+class OrderBook:
+    """
+    Description:
+        Local order book of one symbol. Depth diff events are applied in
+        update id order on top of a REST snapshot, events received before the
+        snapshot is loaded are buffered and a gap in the update ids drops the
+        book until it is resynced. Queries only read memory and take the book
+        lock, so they answer in microseconds.
+    Args:
+        symbol (str): symbol of the order book
+    """
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol.upper()
+        self.lock = threading.Lock()
+        self._bids: Dict[float, float] = {}  # price to quantity
+        self._asks: Dict[float, float] = {}
+        self._bid_prices: List[float] = []  # negated, best bid first
+        self._ask_prices: List[float] = []  # best ask first
+        self.last_update_id = None  # None while the book is out of sync
+        self._pending = deque(maxlen=PENDING_LIMIT)  # diff events waiting for the snapshot
+        self.synced = threading.Event()
+        self.resyncing = False
+        self.resyncs = 0
+        self.last_update = None  # time.monotonic() of the last applied update
+
+    # ----------------------------------------------------------
+    #                      Synchronization
+    # ----------------------------------------------------------
+
+    @staticmethod
+    def _set_level(levels: Dict[float, float], prices: List[float],
+                   price: float, quantity: float, key: float):
+        if quantity == 0:
+            if levels.pop(price, None) is not None:
+                del prices[bisect.bisect_left(prices, key)]
+        else:
+            if price not in levels:
+                bisect.insort(prices, key)
+            levels[price] = quantity
+
+    def _apply_levels(self, bids: list, asks: list):
+        for price, quantity in bids:
+            price = float(price)
+            self._set_level(self._bids, self._bid_prices, price, float(quantity), -price)
+        for price, quantity in asks:
+            price = float(price)
+            self._set_level(self._asks, self._ask_prices, price, float(quantity), price)
+
+    def _apply_diff(self, event: dict) -> bool:
+        """
+        Description:
+            Applies a diff event to the synced book, returns False on a gap.
+        """
+        if event['u'] <= self.last_update_id:
+            return True  # already part of the snapshot
+        if event['U'] > self.last_update_id + 1:
+            return False
+        self._apply_levels(event['b'], event['a'])
+        self.last_update_id = event['u']
+        return True
+
+    def _drop(self):
+        self.last_update_id = None
+        self.synced.clear()
+
+    def apply_snapshot(self, snapshot: dict) -> bool:
+        """
+        Description:
+            Replaces the book with a REST snapshot and applies the buffered
+            diff events newer than it.
+        Args:
+            snapshot (dict): response of /api/v3/depth
+        Returns:
+            bool: False if the buffered events start after the snapshot, in
+            which case a newer snapshot is needed
+        """
+        with self.lock:
+            self._bids, self._asks = {}, {}
+            self._bid_prices, self._ask_prices = [], []
+            self.last_update_id = snapshot['lastUpdateId']
+            self._apply_levels(snapshot['bids'], snapshot['asks'])
+            while self._pending:
+                if not self._apply_diff(self._pending[0]):
+                    self._drop()
+                    return False
+                self._pending.popleft()
+            self.last_update = time.monotonic()
+            self.synced.set()
+            return True
+
+    def apply_event(self, event: dict) -> bool:
+        """
+        Description:
+            Applies a depth diff event, or buffers it while the book is out of
+            sync.
+        Args:
+            event (dict): depthUpdate event data
+        Returns:
+            bool: False if the book is out of sync and needs a snapshot
+        """
+        with self.lock:
+            if self.last_update_id is None:
+                self._pending.append(event)
+                return False
+            if not self._apply_diff(event):
+                logger.warning(f"{self.symbol} order book missed updates "
+                               f"{self.last_update_id + 1}-{event['U'] - 1}. Resyncing.")
+                self._drop()
+                self._pending.append(event)
+                return False
+            self.last_update = time.monotonic()
+            return True
+
+    def reset(self):
+        """
+        Description:
+            Drops the book and the buffered events (ie. after the stream
+            disconnected), the next snapshot starts it over.
+        """
+        with self.lock:
+            self._drop()
+            self._pending.clear()
+
+    # ----------------------------------------------------------
+    #                         Queries
+    # ----------------------------------------------------------
+
+    def is_synced(self) -> bool:
+        return self.last_update_id is not None
+
+    def age(self) -> float:
+        """
+        Description:
+            Returns the seconds since the last update, None if never synced.
+        """
+        if self.last_update is None:
+            return None
+        return time.monotonic() - self.last_update
+
+    def best_bid(self) -> Tuple[float, float]:
+        """
+        Description:
+            Returns the price and quantity of the best bid, None if empty.
+        """
+        with self.lock:
+            if not self._bid_prices:
+                return None
+            price = -self._bid_prices[0]
+            return price, self._bids[price]
+
+    def best_ask(self) -> Tuple[float, float]:
+        """
+        Description:
+            Returns the price and quantity of the best ask, None if empty.
+        """
+        with self.lock:
+            if not self._ask_prices:
+                return None
+            price = self._ask_prices[0]
+            return price, self._asks[price]
+
+    def mid_price(self) -> float:
+        """
+        Description:
+            Returns the price halfway between the best bid and ask, None if
+            either side is empty.
+        """
+        with self.lock:
+            if not (self._bid_prices and self._ask_prices):
+                return None
+            return (self._ask_prices[0] - self._bid_prices[0]) / 2
+
+    def depth_within(self, percent: float) -> Tuple[float, float]:
+        """
+        Description:
+            Returns the quote quantity resting within percent of the mid price
+            on each side of the book.
+        Args:
+            percent (float): distance from the mid price in percent (ie. 1
+            for the bids down to 1% below the mid price)
+        Returns:
+            Tuple[float, float]: bid and ask quote quantity, None if the book
+            has an empty side
+        """
+        with self.lock:
+            if not (self._bid_prices and self._ask_prices):
+                return None
+            mid = (self._ask_prices[0] - self._bid_prices[0]) / 2
+            low, high = mid*(1 - percent/100), mid*(1 + percent/100)
+            bid_depth = 0.0
+            for key in self._bid_prices:
+                if -key < low:
+                    break
+                bid_depth -= key*self._bids[-key]
+            ask_depth = 0.0
+            for price in self._ask_prices:
+                if price > high:
+                    break
+                ask_depth += price*self._asks[price]
+            return bid_depth, ask_depth
+
+    def expected_fill_price(self, quote_quantity: float, side: str = BUY) -> float:
+        """
+        Description:
+            Returns the average price a market order for quote_quantity would
+            fill at, walking the asks for a buy and the bids for a sell.
+        Args:
+            quote_quantity (float): quote quantity of the order
+            side (str, optional): 'BUY' or 'SELL' (defaults to 'BUY')
+        Returns:
+            float: volume weighted fill price, None if the book does not hold
+            enough quantity
+        """
+        with self.lock:
+            if side == BUY:
+                levels, keys, sign = self._asks, self._ask_prices, 1
+            else:
+                levels, keys, sign = self._bids, self._bid_prices, -1
+            remaining = quote_quantity
+            filled = 0.0  # base quantity
+            for key in keys:
+                price = sign*key
+                level_quote = price*levels[price]
+                if remaining <= level_quote:
+                    filled += remaining/price
+                    return quote_quantity/filled
+                filled += levels[price]
+                remaining -= level_quote
+            return None
+
+    def estimated_slippage(self, quote_quantity: float, side: str = BUY) -> float:
+        """
+        Description:
+            Returns how far the expected fill price of a market order is from
+            the mid price, as a fraction (ie. 0.001 for 0.1% worse).
+        Args:
+            quote_quantity (float): quote quantity of the order
+            side (str, optional): 'BUY' or 'SELL' (defaults to 'BUY')
+        Returns:
+            float: estimated slippage, None if the book cannot fill the order
+        """
+        fill_price = self.expected_fill_price(quote_quantity, side)
+        mid = self.mid_price()
+        if (fill_price is None) or (not mid):
+            return None
+        return (fill_price/mid - 1) if (side == BUY) else (1 - fill_price/mid)
+
+
+# symbol to its order book
+_order_books: Dict[str, OrderBook] = {}
+_order_books_lock = threading.Lock()
+
+_resync_pool = ThreadPoolExecutor(max_workers=RESYNC_WORKERS,
+                                  thread_name_prefix="Order_Book_Resync")
+
+
+def get_order_book(symbol: str) -> OrderBook:
+    """
+    Description:
+        Returns the order book of a symbol, creating an empty one if needed.
+    """
+    symbol = symbol.upper()
+    book = _order_books.get(symbol)
+    if book is None:
+        with _order_books_lock:
+            book = _order_books.setdefault(symbol, OrderBook(symbol))
+    return book
+
+
+def resync_order_book(book: OrderBook, limit: int = SNAPSHOT_LIMIT) -> bool:
+    """
+    Description:
+        Loads REST snapshots into the book until one lines up with the
+        buffered diff events.
+    Args:
+        book (OrderBook): order book to resync
+        limit (int, optional): price levels per side of the snapshot
+        (defaults to SNAPSHOT_LIMIT)
+    Returns:
+        bool: True if the book is in sync
+    """
+    try:
+        for attempt in range(RESYNC_ATTEMPTS):
+            if book.apply_snapshot(fetch_depth_snapshot(book.symbol, limit)):
+                book.resyncs += 1
+                return True
+            # the snapshot is older than the first buffered event
+            time.sleep(0.25*(attempt + 1))
+        logger.warning(f"Could not resync {book.symbol} order book.")
+        return False
+    except Exception:
+        logger.error(f"Could not download {book.symbol} depth snapshot.", exc_info=True)
+        return False
+    finally:
+        with book.lock:
+            book.resyncing = False
+
+
+def _request_resync(book: OrderBook):
+    with book.lock:
+        if book.resyncing:
+            return
+        book.resyncing = True
+    _resync_pool.submit(resync_order_book, book)
+
+
+def _handle_depth_message(stream_name: str, data: dict):
+    """
+    Description:
+        Stream handler of depth diff messages (runs on the multiplexer event
+        loop, snapshots are downloaded on the resync threads).
+    """
+    book = get_order_book(data['s'])
+    if not book.apply_event(data):
+        _request_resync(book)
+
+
+def _handle_depth_reconnect(stream_name: str):
+    """
+    Description:
+        Drops the order book of a depth stream whose connection dropped, the
+        diff events missed meanwhile can not be recovered so it is resynced
+        from the next event on.
+    """
+    get_order_book(stream_name.split('@')[0]).reset()
+
+
+register_stream_handler('depth', _handle_depth_message)
+register_reconnect_handler('depth', _handle_depth_reconnect)
+
+
+def subscribe_order_book(multiplexer: StreamMultiplexer, symbol: str,
+                         speed: str = '100ms', timeout: float = None) -> OrderBook:
+    """
+    Description:
+        Adds the depth diff stream of a symbol to the multiplexer, the book
+        loads its snapshot once the first diff event arrives.
+    Args:
+        multiplexer (StreamMultiplexer): multiplexer carrying the stream
+        symbol (str): symbol of the order book
+        speed (str, optional): update speed, '100ms' or '1000ms' (defaults
+        to '100ms')
+        timeout (float, optional): seconds to wait for the book to sync
+        (defaults to not waiting)
+    Returns:
+        OrderBook: order book of the symbol
+    """
+    book = get_order_book(symbol)
+    multiplexer.add_streams([depth_stream_name(symbol, speed)])
+    if timeout:
+        book.synced.wait(timeout)
+    return book
+
+
+def unsubscribe_order_book(multiplexer: StreamMultiplexer, symbol: str,
+                           speed: str = '100ms'):
+    """
+    Description:
+        Removes the depth diff stream of a symbol from the multiplexer and
+        drops its order book.
+    """
+    multiplexer.remove_streams([depth_stream_name(symbol, speed)])
+    with _order_books_lock:
+        book = _order_books.pop(symbol.upper(), None)
+    if book is not None:
+        book.reset()
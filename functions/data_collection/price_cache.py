@@ -0,0 +1,205 @@
+#!/usr/bin/python3
+#
+# price_cache.py: contains the in memory best bid/ask of every symbol, fed by
+# the bookTicker streams, with batched REST refreshes for stale prices.
+#
+# Andrew Bishop
+# 2026/10/18
+#
+
+# modules imported
+import json
+import logging
+import threading
+import time
+from typing import Dict, Iterable, NamedTuple
+
+import binance
+import requests
+
+from functions.data_collection.data_collection import binance_client
+from functions.data_collection.stream_multiplexer import StreamMultiplexer, register_stream_handler
+
+logger = logging.getLogger("main")
+
+
+# ----------------------------------constants-----------------------------------
+
+# seconds a streamed price stays fresh, bookTicker updates on every change of
+# the best bid/ask so quiet symbols can go a few seconds without one
+PRICE_MAX_AGE = 10
+
+# bookTicker stream of every symbol, busy (every best bid/ask change of the
+# whole market) so symbol streams are preferred for small universes
+ALL_MARKET_BOOK_TICKER = '!bookTicker'
+
+
+# -----------------------------------classes------------------------------------
+
+class Quote(NamedTuple):
+    """
+    Description:
+        Best bid/ask of a symbol and when it was received.
+    """
+    bid: float
+    bid_qty: float
+    ask: float
+    ask_qty: float
+    updated: float  # time.monotonic() of the update
+
+    @property
+    def mid(self) -> float:
+        return (self.bid + self.ask) / 2
+
+    def age(self) -> float:
+        return time.monotonic() - self.updated
+
+
+# ----------------------------------functions-----------------------------------
+
+# symbol to its latest quote, quotes are replaced (never mutated) so they are
+# read without a lock
+_quotes: Dict[str, Quote] = {}
+
+# held while stale prices are downloaded so concurrent callers share one request
+_refresh_lock = threading.Lock()
+
+
+def book_ticker_stream_name(symbol: str) -> str:
+    """
+    Description:
+        Returns the combined stream name of a bookTicker stream.
+    """
+    return f"{symbol.lower()}@bookTicker"
+
+
+def _handle_book_ticker(stream_name: str, data: dict):
+    """
+    Description:
+        Stream handler of bookTicker messages.
+    """
+    _quotes[data['s']] = Quote(
+        float(data['b']), float(data['B']), float(data['a']), float(data['A']),
+        time.monotonic())
+
+
+register_stream_handler('bookTicker', _handle_book_ticker)
+
+
+def subscribe_prices(multiplexer: StreamMultiplexer, symbols: Iterable[str] = None):
+    """
+    Description:
+        Streams the best bid/ask of the symbols into the price cache.
+    Args:
+        multiplexer (StreamMultiplexer): multiplexer carrying the streams
+        symbols (Iterable[str], optional): symbols to stream (defaults to the
+        all market stream)
+    """
+    if symbols is None:
+        multiplexer.add_streams([ALL_MARKET_BOOK_TICKER])
+    else:
+        multiplexer.add_streams([book_ticker_stream_name(symbol) for symbol in symbols])
+
+
+def unsubscribe_prices(multiplexer: StreamMultiplexer, symbols: Iterable[str]):
+    """
+    Description:
+        Stops streaming the best bid/ask of the symbols, their cached prices
+        are refreshed over REST when requested.
+    """
+    multiplexer.remove_streams([book_ticker_stream_name(symbol) for symbol in symbols])
+
+
+def refresh_prices(symbols: Iterable[str]):
+    """
+    Description:
+        Downloads the best bid/ask of the symbols in one request.
+    Args:
+        symbols (Iterable[str]): symbols to download
+    """
+    symbols = sorted({symbol.upper() for symbol in symbols})
+    if not symbols:
+        return
+    client = binance_client()
+    if len(symbols) == 1:
+        tickers = [client.get_orderbook_ticker(symbol=symbols[0])]
+    else:
+        tickers = client.get_orderbook_tickers(
+            symbols=json.dumps(symbols, separators=(',', ':')))
+    now = time.monotonic()
+    for ticker in tickers:
+        _quotes[ticker['symbol']] = Quote(
+            float(ticker['bidPrice']), float(ticker['bidQty']),
+            float(ticker['askPrice']), float(ticker['askQty']), now)
+
+
+def get_quotes(symbols: Iterable[str], max_age: float = PRICE_MAX_AGE) -> Dict[str, Quote]:
+    """
+    Description:
+        Returns the best bid/ask of the symbols from memory. Symbols without
+        a quote newer than max_age are downloaded together in one request, if
+        the download fails their stale quotes are returned.
+    Args:
+        symbols (Iterable[str]): symbols to return
+        max_age (float, optional): seconds a quote stays fresh (defaults to
+        PRICE_MAX_AGE)
+    Returns:
+        Dict[str, Quote]: symbol to quote, symbols without any quote are left
+        out
+    Raises:
+        binance.exceptions.BinanceAPIException, requests.exceptions.
+        ConnectionError: if the download fails and a symbol has no quote
+    """
+    symbols = [symbol.upper() for symbol in symbols]
+    quotes = {symbol: _quotes.get(symbol) for symbol in symbols}
+    stale = [symbol for symbol, quote in quotes.items()
+             if (quote is None) or (quote.age() > max_age)]
+    if stale:
+        with _refresh_lock:
+            # another thread may have refreshed them while this one waited
+            stale = [symbol for symbol in stale
+                     if (_quotes.get(symbol) is None) or (_quotes[symbol].age() > max_age)]
+            if stale:
+                try:
+                    refresh_prices(stale)
+                except (binance.exceptions.BinanceAPIException,
+                        requests.exceptions.ConnectionError):
+                    if any(_quotes.get(symbol) is None for symbol in stale):
+                        raise
+                    logger.warning(f"Could not refresh prices of {', '.join(stale)}. "
+                                   f"Using stale prices.", exc_info=True)
+        quotes = {symbol: _quotes.get(symbol) for symbol in symbols}
+    return {symbol: quote for symbol, quote in quotes.items() if quote is not None}
+
+
+def get_quote(symbol: str, max_age: float = PRICE_MAX_AGE) -> Quote:
+    """
+    Description:
+        Returns the best bid/ask of a symbol (see get_quotes).
+    """
+    return get_quotes([symbol], max_age)[symbol.upper()]
+
+
+def current_price(symbol: str, max_age: float = PRICE_MAX_AGE) -> float:
+    """
+    Description:
+        Returns the mid price of a symbol from memory, downloading it only if
+        it is stale.
+    Args:
+        symbol (str): symbol of the price
+        max_age (float, optional): seconds a price stays fresh (defaults to
+        PRICE_MAX_AGE)
+    Returns:
+        float: mid price of the best bid and ask
+    """
+    return get_quote(symbol, max_age).mid
+
+
+def price_age(symbol: str) -> float:
+    """
+    Description:
+        Returns the seconds since the price of a symbol was updated, None if
+        it was never received.
+    """
+    quote = _quotes.get(symbol.upper())
+    return None if (quote is None) else quote.age()
@@ -0,0 +1,180 @@
+#!/usr/bin/python3
+#
+# resampler.py: contains the resampler that builds higher interval klines from
+# a single base interval kline stream.
+#
+# Andrew Bishop
+# 2026/10/18
+#
+
+# modules imported
+from typing import Dict, List, Tuple
+
+from classes.data import KlineInterval
+
+
+# -----------------------------------classes------------------------------------
+
+class _Bucket:
+    """
+    Description:
+        Aggregate of the closed base klines inside one higher interval kline.
+    """
+    __slots__ = ('t', 'o', 'h', 'l', 'c', 'v', 'n', 'empty')
+
+    def __init__(self, t: int):
+        self.t = t
+        self.o = self.h = self.l = self.c = 0.0
+        self.v = self.n = 0.0
+        self.empty = True
+
+    def add(self, o: float, c: float, h: float, l: float, n: float, v: float):
+        if self.empty:
+            self.o, self.h, self.l = o, h, l
+            self.empty = False
+        else:
+            self.h = max(self.h, h)
+            self.l = min(self.l, l)
+        self.c = c
+        self.v += v
+        self.n += n
+
+
+class KlineResampler:
+    """
+    Description:
+        Builds klines of higher intervals (ie. 15m, 1h, 4h) from the klines of
+        one base interval (ie. 1m, 5m). Each base update is O(1) per target
+        interval and the current higher interval kline is written to its
+        buffer on every base update, so it stays as fresh as the base stream.
+    Args:
+        base_interval (str): interval of the subscribed kline stream
+        buffers (Dict[str, KlineBuffer]): target interval to the buffer its
+        klines are written to
+    """
+
+    def __init__(self, base_interval: str, buffers: Dict[str, object]):
+        self.base_interval = base_interval
+        self.base_seconds = KlineInterval.from_string(base_interval).value
+        self.buffers = buffers
+        self.seconds = {}
+        for interval in buffers:
+            seconds = KlineInterval.from_string(interval).value
+            if (seconds <= self.base_seconds) or (seconds % self.base_seconds):
+                raise ValueError(
+                    f"Cannot build {interval} klines from {base_interval} klines.")
+            self.seconds[interval] = seconds
+        self._buckets = {interval: _Bucket(-1) for interval in buffers}
+        self._open = None  # (t, o, c, h, l, n, v) of the open base kline
+        self._last_closed = -1  # open time of the last folded base kline
+
+    def _fold(self, kline: tuple) -> List[str]:
+        """
+        Description:
+            Adds a closed base kline to every target bucket.
+        Returns:
+            List[str]: target intervals whose kline closed with this kline
+        """
+        t, o, c, h, l, n, v = kline
+        self._last_closed = t
+        closed = []
+        for interval, seconds in self.seconds.items():
+            bucket = self._bucket(interval, t)
+            bucket.add(o, c, h, l, n, v)
+            if (t + self.base_seconds) % seconds == 0:
+                closed.append(interval)
+        return closed
+
+    def _bucket(self, interval: str, t: int) -> _Bucket:
+        start = t - t % self.seconds[interval]
+        if self._buckets[interval].t != start:
+            self._buckets[interval] = _Bucket(start)
+        return self._buckets[interval]
+
+    def _publish(self, interval: str):
+        """
+        Description:
+            Writes the current kline of the target interval to its buffer,
+            combining the closed base klines with the open base kline.
+        """
+        if self._open is not None:
+            t, o, c, h, l, n, v = self._open
+            bucket = self._bucket(interval, t)
+            if bucket.empty:
+                self.buffers[interval].update(bucket.t, o, c, h, l, n, v)
+            else:
+                self.buffers[interval].update(
+                    bucket.t, bucket.o, c, max(bucket.h, h),
+                    min(bucket.l, l), bucket.n + n, bucket.v + v)
+        else:
+            bucket = self._buckets[interval]
+            if not bucket.empty:
+                self.buffers[interval].update(
+                    bucket.t, bucket.o, bucket.c, bucket.h, bucket.l,
+                    bucket.n, bucket.v)
+
+    def update(self, t: int, o: float, c: float, h: float, l: float,
+               n: float, v: float, closed: bool = False) -> List[Tuple[str, bool]]:
+        """
+        Description:
+            Applies a base interval kline update and refreshes the current
+            kline of every target interval.
+        Args:
+            t (int): open time of base kline in unix seconds
+            o (float): open price
+            c (float): close price
+            h (float): high price
+            l (float): low price
+            n (float): number of trades
+            v (float): volume
+            closed (bool, optional): True if the base kline is final (the
+            kline 'x' flag) (defaults to False)
+        Returns:
+            List[Tuple[str, bool]]: every updated target interval and whether
+            its kline closed with this update
+        """
+        if t <= self._last_closed:
+            return []  # base kline was already folded
+        closed_intervals = []
+        # a newer base kline means the open one closed without a final update
+        if (self._open is not None) and (t > self._open[0]):
+            previous, self._open = self._open, None
+            closed_intervals = self._fold(previous)
+            for interval in closed_intervals:
+                self._publish(interval)
+        kline = (int(t), o, c, h, l, n, v)
+        if closed:
+            self._open = None
+            closed_intervals += self._fold(kline)
+        else:
+            self._open = kline
+        for interval in self.seconds:
+            self._publish(interval)
+        return [(interval, interval in closed_intervals)
+                for interval in self.seconds]
+
+    def seed(self, klines: Dict[str, list]):
+        """
+        Description:
+            Replays base kline history (all closed except the most recent) so
+            the current higher interval klines start out complete. The history
+            has to reach back to the start of the longest target interval.
+        Args:
+            klines (Dict[str, list]): base kline columns (see
+            binance_klines_to_arrays or KlineBuffer.arrays)
+        """
+        count = len(klines['t'])
+        for index in range(count):
+            self.update(
+                int(klines['t'][index]), float(klines['o'][index]),
+                float(klines['c'][index]), float(klines['h'][index]),
+                float(klines['l'][index]), float(klines['n'][index]),
+                float(klines['v'][index]), closed=(index < count-1))
+
+    def history_length(self) -> int:
+        """
+        Description:
+            Returns the amount of base klines needed to seed the longest
+            target interval.
+        """
+        return max(self.seconds.values()) // self.base_seconds
@@ -0,0 +1,290 @@
+#!/usr/bin/python3
+#
+# stream_health.py: contains the per stream latency histograms, last update
+# ages and the watchdog that restarts stalled streams.
+#
+# Andrew Bishop
+# 2026/10/18
+#
+
+# modules imported
+import bisect
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Set
+
+logger = logging.getLogger("main")
+
+
+# ----------------------------------constants-----------------------------------
+
+# upper bounds (ms) of the latency histogram buckets, the last bucket is open
+LATENCY_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250,
+                      500, 1000, 2500, 5000, 10000)
+
+# seconds without an update before a stream counts as stalled
+STALE_STREAM_AGE = 60
+
+# seconds without an update before a stream of a kind counts as stalled,
+# kinds not listed use STALE_STREAM_AGE. Kline streams send every few seconds
+# even without trades, book and trade streams only send on changes so an
+# illiquid symbol can leave them silent for minutes. None never stalls (ie.
+# the user data stream of an idle account)
+STALE_STREAM_AGES = {
+    'kline': STALE_STREAM_AGE,
+    'bookTicker': 15*60,
+    'depth': 15*60,
+    'aggTrade': 15*60,
+    'userData': None}
+
+# seconds between watchdog checks
+WATCHDOG_INTERVAL = 10
+
+
+# -----------------------------------classes------------------------------------
+
+class LatencyHistogram:
+    """
+    Description:
+        Fixed bucket latency histogram, recording is O(log buckets) and
+        allocation free.
+    """
+
+    def __init__(self, bounds: tuple = LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0]*(len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, ms: float):
+        ms = max(ms, 0.0)  # clock skew can make event lag negative
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, percent: float) -> float:
+        """
+        Description:
+            Returns the upper bound (ms) of the bucket holding the percentile,
+            the largest recorded value for the open bucket.
+        """
+        if not self.count:
+            return 0.0
+        rank = self.count * percent / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.bounds[index] if index < len(self.bounds) else self.max
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'mean': (self.total / self.count) if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'max': self.max}
+
+
+class StreamStats:
+    """
+    Description:
+        Health of one stream: exchange event time to local receive time lag,
+        receive to consumer visible (written to the buffers) lag and the time
+        of the last update.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.event_lag = LatencyHistogram()
+        self.visible_lag = LatencyHistogram()
+        self.messages = 0
+        self.last_update = None  # time.monotonic() of the last message
+
+    def age(self, now: float = None) -> float:
+        """
+        Description:
+            Returns the seconds since the last update, None if none yet.
+        """
+        if self.last_update is None:
+            return None
+        return (time.monotonic() if now is None else now) - self.last_update
+
+
+class StreamWatchdog:
+    """
+    Description:
+        Checks the last update age of the streams carried by a multiplexer
+        and restarts the streams that stalled (a socket that stays open but
+        stops delivering is not caught by thread checks). Each stream kind
+        has its own max age, streams that never received an update are timed
+        from when the watchdog first saw them. Quiet streams (see
+        set_quiet_stream) are not checked.
+    Args:
+        multiplexer (StreamMultiplexer): multiplexer carrying the streams
+        max_age (float, optional): seconds without an update before a stream
+        of a kind not in max_ages is stalled (defaults to STALE_STREAM_AGE)
+        max_ages (Dict[str, float], optional): stream kind to its max age,
+        None to not check the kind (defaults to STALE_STREAM_AGES)
+        on_stale (Callable[[List[str]], None], optional): called with the
+        stalled streams instead of restarting them
+        interval (float, optional): seconds between checks (defaults to
+        WATCHDOG_INTERVAL)
+    """
+
+    def __init__(self, multiplexer, max_age: float = STALE_STREAM_AGE,
+                 on_stale: Callable[[List[str]], None] = None,
+                 interval: float = WATCHDOG_INTERVAL,
+                 max_ages: Dict[str, float] = None):
+        self.multiplexer = multiplexer
+        self.max_age = max_age
+        self.max_ages = STALE_STREAM_AGES if (max_ages is None) else max_ages
+        self.on_stale = on_stale or multiplexer.restart_streams
+        self.interval = interval
+        self.restarts = 0
+        self._since = {}  # stream name to monotonic time it was first seen or restarted
+        self._stop = threading.Event()
+        self.thread = None
+
+    def check(self) -> List[str]:
+        """
+        Description:
+            Returns the stalled streams and hands them to on_stale.
+        """
+        now = time.monotonic()
+        streams = self.multiplexer.streams() - _quiet_streams
+        self._since = {name: self._since.get(name, now) for name in streams}
+        stale = []
+        for name in sorted(streams):
+            max_age = self.max_ages.get(self.multiplexer.stream_kind(name), self.max_age)
+            if max_age is None:
+                continue
+            stats = _stream_stats.get(name)
+            last_update = None if (stats is None) else stats.last_update
+            last = max(self._since[name], last_update or self._since[name])
+            if now - last > max_age:
+                stale.append(name)
+        if stale:
+            logger.warning(f"{len(stale)} streams stalled: "
+                           f"{', '.join(stale[:10])}{' ...' if len(stale) > 10 else ''}")
+            for name in stale:
+                self._since[name] = now  # give the restart time to deliver
+            self.restarts += len(stale)
+            self.on_stale(stale)
+        return stale
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                logger.error("Stream watchdog check failed.", exc_info=True)
+
+    def start(self) -> "StreamWatchdog":
+        if self.thread is None:
+            self.thread = threading.Thread(
+                target=self._run, name="Stream_Watchdog_Thread", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+# ----------------------------------functions-----------------------------------
+
+# stream name to its stats
+_stream_stats: Dict[str, StreamStats] = {}
+
+# streams that only send on activity (ie. user data), replaced instead of
+# mutated so the watchdog reads them unlocked
+_quiet_streams: Set[str] = set()
+_stats_lock = threading.Lock()
+
+
+def get_stream_stats(stream_name: str) -> StreamStats:
+    """
+    Description:
+        Returns the stats of a stream, creating them if needed.
+    """
+    stats = _stream_stats.get(stream_name)
+    if stats is None:
+        with _stats_lock:
+            stats = _stream_stats.setdefault(stream_name, StreamStats())
+    return stats
+
+
+def set_quiet_stream(stream_name: str, quiet: bool = True):
+    """
+    Description:
+        Marks a stream that can go quiet for long without being stalled (ie.
+        a user data stream of an idle account), the watchdog skips it.
+    Args:
+        stream_name (str): combined stream name
+        quiet (bool, optional): False to check the stream again (defaults to
+        True)
+    """
+    global _quiet_streams
+    _quiet_streams = (_quiet_streams | {stream_name}) if quiet else (_quiet_streams - {stream_name})
+
+
+def record_stream_update(stream_name: str, event_ms: int, received: float,
+                         visible_seconds: float):
+    """
+    Description:
+        Records one handled stream message.
+    Args:
+        stream_name (str): name of the stream
+        event_ms (int): exchange event time 'E' in unix ms (None if the
+        stream has no event time, ie. bookTicker)
+        received (float): unix time the message was received
+        visible_seconds (float): seconds from receiving the message until
+        its data was visible to consumers
+    """
+    stats = get_stream_stats(stream_name)
+    with stats.lock:
+        if event_ms is not None:
+            stats.event_lag.record(received*1000 - event_ms)
+        stats.visible_lag.record(visible_seconds*1000)
+        stats.messages += 1
+        stats.last_update = time.monotonic()
+
+
+def stream_age(stream_name: str) -> float:
+    """
+    Description:
+        Returns the seconds since the last update of a stream, None if it
+        has not received any update yet.
+    """
+    stats = _stream_stats.get(stream_name)
+    return None if (stats is None) else stats.age()
+
+
+def stream_health(stream_names: Iterable[str] = None) -> Dict[str, dict]:
+    """
+    Description:
+        Returns the health of every (or the given) stream: last update age,
+        message count and event lag / visible lag summaries (ms).
+    Args:
+        stream_names (Iterable[str], optional): streams to report (defaults
+        to all streams that received a message)
+    Returns:
+        Dict[str, dict]: stream name to 'age', 'messages', 'event_lag' and
+        'visible_lag'
+    """
+    names = list(_stream_stats) if (stream_names is None) else stream_names
+    health = {}
+    for name in names:
+        stats = get_stream_stats(name)
+        with stats.lock:
+            health[name] = {
+                'age': stats.age(),
+                'messages': stats.messages,
+                'event_lag': stats.event_lag.summary(),
+                'visible_lag': stats.visible_lag.summary()}
+    return health
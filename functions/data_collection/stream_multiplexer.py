@@ -0,0 +1,486 @@
+#!/usr/bin/python3
+#
+# stream_multiplexer.py: contains the multiplexer that packs many websocket
+# streams into a few combined stream connections on one event loop.
+#
+# Andrew Bishop
+# 2026/10/18
+#
+
+# modules imported
+import asyncio
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List
+
+import websockets
+
+from functions.data_collection.stream_health import record_stream_update
+from functions.setup.setup import retrieve_stream_url
+
+try:
+    # optional faster json parser
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+logger = logging.getLogger("main")
+
+
+# ----------------------------------constants-----------------------------------
+
+# binance allows up to 1024 streams per connection, stay well below it so a
+# reconnect only has to resubscribe a small part of the universe
+MAX_STREAMS_PER_CONNECTION = 200
+
+# seconds to wait before reconnecting a dropped connection
+RECONNECT_DELAY = 5
+
+# streams backfilled at the same time after a reconnect
+BACKFILL_WORKERS = 8
+
+# kind of user data streams, which are named by their listenKey
+USER_DATA_STREAM = 'userData'
+
+
+# ----------------------------------functions-----------------------------------
+
+# stream kind (ie. 'kline', 'bookTicker') to handler(stream_name, data)
+_stream_handlers: Dict[str, Callable[[str, dict], None]] = {}
+
+# stream kind to handler(stream_name) called after a dropped connection
+# reconnects, before its buffered messages are dispatched
+_reconnect_handlers: Dict[str, Callable[[str], None]] = {}
+
+
+def kline_stream_name(symbol: str, interval: str) -> str:
+    """
+    Description:
+        Returns the combined stream name of a kline stream.
+    Args:
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+    Returns:
+        str: stream name (ie. 'btcusdt@kline_5m')
+    """
+    return f"{symbol.lower()}@kline_{interval}"
+
+
+@lru_cache(maxsize=None)
+def stream_kind(stream_name: str) -> str:
+    """
+    Description:
+        Returns the kind of a stream from its name, without the symbol,
+        interval or update speed (ie. 'btcusdt@kline_5m' -> 'kline',
+        'btcusdt@depth@100ms' -> 'depth', '!bookTicker' -> 'bookTicker', a
+        listenKey -> 'userData').
+    Args:
+        stream_name (str): combined stream name
+    Returns:
+        str: kind of stream
+    """
+    if '@' in stream_name:
+        kind = stream_name.split('@')[1]
+    elif stream_name.startswith('!'):
+        kind = stream_name.lstrip('!')
+    else:
+        return USER_DATA_STREAM
+    return kind.split('_')[0]
+
+
+def register_stream_handler(kind: str, handler: Callable[[str, dict], None]):
+    """
+    Description:
+        Registers the function that handles the messages of one kind of
+        stream.
+    Args:
+        kind (str): kind of stream (see stream_kind)
+        handler (Callable[[str, dict], None]): called with the stream name
+        and the decoded message data
+    """
+    _stream_handlers[kind] = handler
+
+
+def register_reconnect_handler(kind: str, handler: Callable[[str], None]):
+    """
+    Description:
+        Registers the function that catches up one kind of stream after its
+        connection dropped (ie. downloading the klines missed meanwhile).
+    Args:
+        kind (str): kind of stream (see stream_kind)
+        handler (Callable[[str], None]): called with the stream name
+    """
+    _reconnect_handlers[kind] = handler
+
+
+def _catch_up_stream(stream_name: str):
+    handler = _reconnect_handlers.get(stream_kind(stream_name))
+    if handler is None:
+        return
+    try:
+        handler(stream_name)
+    except Exception:
+        logger.error(f"Could not catch up {stream_name} after reconnecting.",
+                     exc_info=True)
+
+
+def catch_up_streams(stream_names: Iterable[str]):
+    """
+    Description:
+        Runs the reconnect handlers of the streams, a few at a time.
+    Args:
+        stream_names (Iterable[str]): combined stream names to catch up
+    """
+    with ThreadPoolExecutor(max_workers=BACKFILL_WORKERS) as pool:
+        list(pool.map(_catch_up_stream, stream_names))
+
+
+# recorder every received frame is written to (see stream_recorder.py)
+_recorder = None
+
+
+def set_stream_recorder(recorder):
+    """
+    Description:
+        Sets the recorder every frame received from the exchange is written
+        to, None to stop recording.
+    Args:
+        recorder (StreamRecorder): recorder of the received frames
+    """
+    global _recorder
+    _recorder = recorder
+
+
+def record_frame(raw, stream_name: str = None, received: float = None):
+    """
+    Description:
+        Writes a received frame to the recorder, if one is set.
+    Args:
+        raw (str | bytes): raw websocket message
+        stream_name (str, optional): stream of a single stream connection,
+        None for combined stream messages
+        received (float, optional): unix time the frame was received
+        (defaults to now)
+    """
+    recorder = _recorder
+    if recorder is not None:
+        recorder.record(raw, stream_name,
+                        None if (received is None) else int(received*1e9))
+
+
+def _handle(stream_name: str, data: dict, received: float, start: float) -> bool:
+    """
+    Description:
+        Passes decoded message data to the handler of its stream kind and
+        records the event lag and visible lag of the stream.
+    """
+    handler = _stream_handlers.get(stream_kind(stream_name))
+    if handler is None:
+        return False
+    handler(stream_name, data)
+    record_stream_update(stream_name, data.get('E'), received,
+                         time.perf_counter() - start)
+    return True
+
+
+def dispatch_stream_data(stream_name: str, raw, received: float = None) -> bool:
+    """
+    Description:
+        Decodes a message of a single stream connection (the data without the
+        combined stream wrapper) and passes it to the handler registered for
+        its stream kind.
+    Args:
+        stream_name (str): name of the stream
+        raw (str | bytes): raw websocket message
+        received (float, optional): unix time the message was received
+        (defaults to now)
+    Returns:
+        bool: True if a handler was found for the message
+    """
+    start = time.perf_counter()
+    received = time.time() if (received is None) else received
+    return _handle(stream_name, loads(raw), received, start)
+
+
+def dispatch_message(raw, received: float = None) -> bool:
+    """
+    Description:
+        Decodes one combined stream message and passes its data to the
+        handler registered for its stream kind.
+    Args:
+        raw (str | bytes): raw websocket message
+        received (float, optional): unix time the message was received
+        (defaults to now)
+    Returns:
+        bool: True if a handler was found for the message
+    """
+    start = time.perf_counter()
+    received = time.time() if (received is None) else received
+    message = loads(raw)
+    stream_name = message.get('stream')
+    if stream_name is None:
+        return False  # subscription responses have no stream
+    return _handle(stream_name, message['data'], received, start)
+
+
+# -----------------------------------classes------------------------------------
+
+class _StreamConnection:
+    """
+    Description:
+        One combined stream connection and the streams it carries.
+    """
+
+    def __init__(self, index: int):
+        self.index = index
+        self.streams = set()
+        self.ws = None
+        self.task = None
+        self.catch_up = set()  # resubscribed streams to catch up, only used on the event loop
+
+
+class StreamMultiplexer:
+    """
+    Description:
+        Runs every websocket stream of the program on a few combined stream
+        connections, all driven by one event loop on one thread. Each decoded
+        message is dispatched to the handler registered for its stream kind.
+    Args:
+        url (str, optional): combined stream url (defaults to the stream url
+        configured in the environment, see retrieve_stream_url)
+        max_streams_per_connection (int, optional): stream cap per connection
+        (defaults to MAX_STREAMS_PER_CONNECTION)
+    """
+
+    def __init__(self, url: str = None,
+                 max_streams_per_connection: int = MAX_STREAMS_PER_CONNECTION):
+        self.url = url or f"{retrieve_stream_url()}/stream"
+        self.max_streams_per_connection = max_streams_per_connection
+        self.connections: List[_StreamConnection] = []
+        self.loop = None
+        self.thread = None
+        self._lock = threading.Lock()
+        self._started = threading.Event()
+        self._request_id = 0
+        self._connection_count = 0
+
+    # ----------------------------------------------------------
+    #                      Helper Functions
+    # ----------------------------------------------------------
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self._started.set()
+        self.loop.run_forever()
+
+    def _connection_url(self, connection: _StreamConnection) -> str:
+        return f"{self.url}?streams={'/'.join(sorted(connection.streams))}"
+
+    async def _run_connection(self, connection: _StreamConnection):
+        """
+        Description:
+            Keeps one combined stream connection open and dispatches its
+            messages, reconnecting when it drops.
+        """
+        reconnect = False
+        while connection.streams:
+            with self._lock:
+                url_streams = set(connection.streams)
+                url = self._connection_url(connection)
+            try:
+                async with websockets.connect(url, max_size=None) as ws:
+                    with self._lock:
+                        connection.ws = ws
+                        # streams changed while connecting
+                        self._send_method(connection, 'SUBSCRIBE',
+                                          sorted(connection.streams - url_streams))
+                        self._send_method(connection, 'UNSUBSCRIBE',
+                                          sorted(url_streams - connection.streams))
+                    logger.info(f"Connected stream connection {connection.index} "
+                                f"({len(connection.streams)} streams).")
+                    if reconnect:
+                        # messages received meanwhile wait in the websocket
+                        # until the missed data is spliced in
+                        await self.loop.run_in_executor(
+                            None, catch_up_streams, sorted(url_streams & connection.streams))
+                    async for raw in ws:
+                        if connection.catch_up:
+                            # resubscribed streams are caught up before any
+                            # message is dispatched, like after a reconnect
+                            stream_names = sorted(connection.catch_up & connection.streams)
+                            connection.catch_up.clear()
+                            await self.loop.run_in_executor(None, catch_up_streams, stream_names)
+                        try:
+                            received = time.time()
+                            record_frame(raw, received=received)
+                            dispatch_message(raw, received)
+                        except Exception:
+                            logger.error(f"Could not handle stream message on "
+                                         f"connection {connection.index}.", exc_info=True)
+            except (websockets.exceptions.WebSocketException, OSError):
+                logger.warning(f"Stream connection {connection.index} dropped. "
+                               f"Reconnecting in {RECONNECT_DELAY}s.", exc_info=True)
+            finally:
+                connection.ws = None
+            reconnect = True
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    def _start_connection(self, connection: _StreamConnection):
+        connection.task = asyncio.run_coroutine_threadsafe(
+            self._run_connection(connection), self.loop)
+
+    def _method_request(self, method: str, stream_names: List[str]) -> str:
+        self._request_id += 1
+        return json.dumps({
+            'method': method,
+            'params': stream_names,
+            'id': self._request_id})
+
+    def _send_method(self, connection: _StreamConnection, method: str,
+                     stream_names: List[str]):
+        """
+        Description:
+            Sends a SUBSCRIBE/UNSUBSCRIBE request on an open connection. If
+            the connection is not open the streams are picked up (or left
+            out) when it reconnects.
+        """
+        ws = connection.ws
+        if (ws is None) or (not stream_names):
+            return
+        asyncio.run_coroutine_threadsafe(
+            ws.send(self._method_request(method, stream_names)), self.loop)
+
+    async def _resubscribe(self, connection: _StreamConnection, ws,
+                           stream_names: List[str], unsubscribe: str, subscribe: str):
+        """
+        Description:
+            Unsubscribes and subscribes streams again on an open connection
+            and marks them to be caught up before its next message.
+        """
+        await ws.send(unsubscribe)
+        await ws.send(subscribe)
+        connection.catch_up.update(stream_names)
+
+    def _close_connection(self, connection: _StreamConnection):
+        """
+        Description:
+            Closes a connection that no longer carries any streams.
+        """
+        self.connections.remove(connection)
+        if connection.ws is not None:
+            asyncio.run_coroutine_threadsafe(connection.ws.close(), self.loop)
+        elif connection.task is not None:
+            connection.task.cancel()
+
+    # ----------------------------------------------------------
+    #                     Main Functions
+    # ----------------------------------------------------------
+
+    def start(self) -> threading.Thread:
+        """
+        Description:
+            Starts the event loop thread that runs every connection.
+        Returns:
+            threading.Thread: event loop thread
+        """
+        if self.thread is None:
+            self.loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(
+                target=self._run_loop, name="Stream_Multiplexer_Thread",
+                daemon=True)
+            self.thread.start()
+            self._started.wait()
+        return self.thread
+
+    def is_alive(self) -> bool:
+        return (self.thread is not None) and self.thread.is_alive()
+
+    # kind of a stream carried by the multiplexer (see stream_kind)
+    stream_kind = staticmethod(stream_kind)
+
+    def streams(self) -> set:
+        """
+        Description:
+            Returns the names of all streams carried by the multiplexer.
+        """
+        with self._lock:
+            return set().union(*[c.streams for c in self.connections])
+
+    def add_streams(self, stream_names: Iterable[str]):
+        """
+        Description:
+            Adds streams to the multiplexer. Streams first fill the spare
+            capacity of the existing connections (subscribing on the open
+            connection without reconnecting), the rest are packed into new
+            connections of at most max_streams_per_connection streams.
+        Args:
+            stream_names (Iterable[str]): combined stream names to add
+        """
+        self.start()
+        with self._lock:
+            active = set().union(*[c.streams for c in self.connections])
+            new_streams = [name for name in dict.fromkeys(stream_names)
+                           if name not in active]
+            for connection in self.connections:
+                spare = self.max_streams_per_connection - len(connection.streams)
+                if (spare <= 0) or (not new_streams):
+                    continue
+                added, new_streams = new_streams[:spare], new_streams[spare:]
+                connection.streams.update(added)
+                self._send_method(connection, 'SUBSCRIBE', added)
+            for index in range(0, len(new_streams), self.max_streams_per_connection):
+                connection = _StreamConnection(self._connection_count)
+                self._connection_count += 1
+                connection.streams.update(
+                    new_streams[index:index+self.max_streams_per_connection])
+                self.connections.append(connection)
+                self._start_connection(connection)
+
+    def restart_streams(self, stream_names: Iterable[str]):
+        """
+        Description:
+            Restarts streams (ie. stalled streams) by unsubscribing and
+            subscribing them again on their open connection, the other
+            streams of the connection keep running. The restarted streams are
+            caught up before the next message of their connection is
+            dispatched. Streams of a connection that is not open are caught
+            up when it reconnects.
+        Args:
+            stream_names (Iterable[str]): combined stream names to restart
+        """
+        stream_names = set(stream_names)
+        with self._lock:
+            for connection in self.connections:
+                restarted = sorted(connection.streams & stream_names)
+                if (not restarted) or (connection.ws is None):
+                    continue
+                logger.info(f"Resubscribing {len(restarted)} streams on stream "
+                            f"connection {connection.index}.")
+                asyncio.run_coroutine_threadsafe(self._resubscribe(
+                    connection, connection.ws, restarted,
+                    self._method_request('UNSUBSCRIBE', restarted),
+                    self._method_request('SUBSCRIBE', restarted)), self.loop)
+
+    def remove_streams(self, stream_names: Iterable[str]):
+        """
+        Description:
+            Removes streams from the multiplexer by unsubscribing them on their
+            open connection. Connections left without streams are closed.
+        Args:
+            stream_names (Iterable[str]): combined stream names to remove
+        """
+        stream_names = set(stream_names)
+        with self._lock:
+            for connection in list(self.connections):
+                removed = sorted(connection.streams & stream_names)
+                if not removed:
+                    continue
+                connection.streams.difference_update(removed)
+                if connection.streams:
+                    self._send_method(connection, 'UNSUBSCRIBE', removed)
+                else:
+                    self._close_connection(connection)
@@ -0,0 +1,178 @@
+#!/usr/bin/python3
+#
+# stream_recorder.py: contains the recorder that writes the raw websocket
+# frames received by the feed to an append-only log, and the replay that
+# feeds a log back through the same ingest path.
+#
+# Andrew Bishop
+# 2026/10/18
+#
+
+# modules imported
+import gzip
+import os
+import struct
+import threading
+import time
+from typing import Dict, Iterator, Tuple
+
+from functions.data_collection.stream_multiplexer import dispatch_message, dispatch_stream_data, \
+    set_stream_recorder
+
+
+# ----------------------------------constants-----------------------------------
+
+LOG_MAGIC = b'WSLOG001'
+
+# receive time in unix nanoseconds, stream name length, frame length
+RECORD_HEADER = struct.Struct('<qHI')
+
+# seconds between flushes of the log file
+FLUSH_INTERVAL = 1
+
+
+# ----------------------------------functions-----------------------------------
+
+def _open_log(path: str, mode: str):
+    """
+    Description:
+        Opens a stream log, gzip compressed if the path ends with '.gz'.
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+def read_stream_log(path: str) -> Iterator[Tuple[int, str, bytes]]:
+    """
+    Description:
+        Yields the frames of a stream log in the order they were received.
+    Args:
+        path (str): file path of the log
+    Returns:
+        Iterator[Tuple[int, str, bytes]]: receive time in unix nanoseconds,
+        stream name (None for combined stream messages) and raw frame
+    """
+    with _open_log(path, 'rb') as f:
+        if f.read(len(LOG_MAGIC)) != LOG_MAGIC:
+            raise ValueError(f"{path} is not a stream log.")
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return  # end of log (or a record cut off by a crash)
+            received, name_length, frame_length = RECORD_HEADER.unpack(header)
+            stream_name = f.read(name_length).decode() if name_length else None
+            frame = f.read(frame_length)
+            if len(frame) < frame_length:
+                return
+            yield received, stream_name, frame
+
+
+def replay_stream_log(path: str, speed: float = 1.0) -> Dict[str, float]:
+    """
+    Description:
+        Feeds a stream log back through the stream handlers (the same ingest
+        path as the live feed), keeping the recorded gaps between frames
+        divided by speed.
+    Args:
+        path (str): file path of the log
+        speed (float, optional): replay speed, 1 for real time, N for N times
+        faster and None for as fast as possible (defaults to 1)
+    Returns:
+        Dict[str, float]: 'frames' replayed, frames 'handled' by a stream
+        handler and 'seconds' taken
+    """
+    frames = handled = 0
+    start = time.monotonic()
+    first_received = None
+    for received, stream_name, frame in read_stream_log(path):
+        if speed:
+            if first_received is None:
+                first_received = received
+            delay = start + (received - first_received)/1e9/speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        # keep the recorded receive time so event lags match the recording
+        if stream_name is None:
+            handled += dispatch_message(frame, received/1e9)
+        else:
+            handled += dispatch_stream_data(stream_name, frame, received/1e9)
+        frames += 1
+    return {
+        'frames': frames,
+        'handled': handled,
+        'seconds': time.monotonic() - start}
+
+
+# -----------------------------------classes------------------------------------
+
+class StreamRecorder:
+    """
+    Description:
+        Appends raw websocket frames (kline, bookTicker, aggTrade, ...) with
+        their receive time to a compact binary log. Logs ending with '.gz' are
+        gzip compressed. Use start() to record every frame the feed receives.
+    Args:
+        path (str): file path of the log
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        new_log = (not os.path.isfile(path)) or (os.path.getsize(path) == 0)
+        self._file = _open_log(path, 'ab')
+        if new_log:
+            self._file.write(LOG_MAGIC)
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self.frames = 0
+
+    def __enter__(self) -> "StreamRecorder":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def record(self, raw, stream_name: str = None, received: int = None):
+        """
+        Description:
+            Appends one frame to the log.
+        Args:
+            raw (str | bytes): raw websocket message
+            stream_name (str, optional): stream of a single stream connection,
+            None for combined stream messages
+            received (int, optional): receive time in unix nanoseconds
+            (defaults to now)
+        """
+        received = time.time_ns() if (received is None) else received
+        frame = raw.encode() if isinstance(raw, str) else raw
+        name = stream_name.encode() if stream_name else b''
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(RECORD_HEADER.pack(received, len(name), len(frame)))
+            self._file.write(name)
+            self._file.write(frame)
+            self.frames += 1
+            if time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+                self._file.flush()
+                self._last_flush = time.monotonic()
+
+    def start(self) -> "StreamRecorder":
+        """
+        Description:
+            Records every frame received by the feed from now on.
+        """
+        set_stream_recorder(self)
+        return self
+
+    def close(self):
+        """
+        Description:
+            Stops recording and closes the log.
+        """
+        set_stream_recorder(None)
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,137 @@
+#!/usr/bin/python3
+#
+# subscription_manager.py: contains the manager that keeps the multiplexed
+# kline streams in line with the trading universe as it changes.
+#
+# Andrew Bishop
+# 2026/10/18
+#
+
+# modules imported
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Tuple
+
+from functions.data_collection.stream_multiplexer import StreamMultiplexer
+from functions.data_collection.websocket_func import subscribe_klines, unsubscribe_klines
+
+logger = logging.getLogger("main")
+
+
+# -----------------------------------classes------------------------------------
+
+class SubscriptionManager:
+    """
+    Description:
+        Diffs the desired trading universe against the active kline
+        subscriptions and adds or drops streams on the running multiplexer
+        connections, without restarting any connection.
+
+        By default a new symbol is initialized and subscribed in the
+        background (read its klines with update_klines and lock(symbol)). Pass
+        on_add to do it some other way, for example by starting a strategy
+        thread that subscribes its own klines. on_remove is called before a
+        symbol is unsubscribed, if it returns False the symbol stays
+        subscribed and is removed on a later sync (ie. while a trade is
+        still open).
+    Args:
+        multiplexer (StreamMultiplexer): multiplexer carrying the streams
+        interval (str): interval of the subscribed kline streams
+        limit (int, optional): klines held per stream (defaults to 500)
+        resample_intervals (List[str], optional): higher intervals built from
+        the stream (defaults to ())
+        on_add (Callable[[str], None], optional): called for every new symbol
+        on_remove (Callable[[str], bool], optional): called for every symbol
+        that left the universe
+    """
+
+    def __init__(self, multiplexer: StreamMultiplexer, interval: str,
+                 limit: int = 500, resample_intervals: List[str] = (),
+                 on_add: Callable[[str], None] = None,
+                 on_remove: Callable[[str], bool] = None):
+        self.multiplexer = multiplexer
+        self.interval = interval
+        self.limit = limit
+        self.resample_intervals = resample_intervals
+        self.on_add = on_add or self.subscribe
+        self.on_remove = on_remove
+        self.active = set()
+        self._removing = set()
+        self._locks = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=8, thread_name_prefix="Subscription")
+
+    def lock(self, symbol: str) -> threading.Lock:
+        """
+        Description:
+            Returns the lock held while the klines of a symbol are initialized.
+        """
+        return self._locks.setdefault(symbol.upper(), threading.Lock())
+
+    def subscribe(self, symbol: str):
+        """
+        Description:
+            Initializes and subscribes the klines of a symbol in the
+            background.
+        Args:
+            symbol (str): symbol to subscribe
+        """
+        self._executor.submit(
+            subscribe_klines, self.multiplexer, symbol, self.interval,
+            self.lock(symbol), self.limit,
+            resample_intervals=self.resample_intervals)
+
+    def remove(self, symbol: str) -> bool:
+        """
+        Description:
+            Unsubscribes one symbol, leaving every other symbol as it is (ie.
+            the symbol of a strategy thread that died).
+        Args:
+            symbol (str): symbol to unsubscribe
+        Returns:
+            bool: True if it was unsubscribed, False if on_remove kept it
+            subscribed until a later sync
+        """
+        symbol = symbol.upper()
+        if symbol not in self.active:
+            return False
+        if (self.on_remove is not None) and (self.on_remove(symbol) is False):
+            self._removing.add(symbol)
+            return False
+        unsubscribe_klines(self.multiplexer, symbol, self.interval)
+        self.active.discard(symbol)
+        self._removing.discard(symbol)
+        return True
+
+    def sync(self, symbols: Iterable[str]) -> Tuple[List[str], List[str]]:
+        """
+        Description:
+            Subscribes the symbols that joined the universe and unsubscribes
+            the symbols that left it.
+        Args:
+            symbols (Iterable[str]): desired trading universe
+        Returns:
+            Tuple[List[str], List[str]]: added symbols and removed symbols
+        """
+        desired = {symbol.upper() for symbol in symbols}
+        added, removed = [], []
+
+        for symbol in sorted(self.active - desired):
+            if self.remove(symbol):
+                removed.append(symbol)
+
+        # symbols that came back before their removal finished
+        for symbol in sorted(desired & self._removing):
+            self._removing.discard(symbol)
+            self.on_add(symbol)
+
+        for symbol in sorted(desired - self.active):
+            self.on_add(symbol)
+            self.active.add(symbol)
+            added.append(symbol)
+
+        if added or removed:
+            logger.info(f"Universe updated. Added: {added}, Removed: {removed}, "
+                        f"Active: {len(self.active)}")
+        return added, removed
@@ -19,8 +19,18 @@ import threading
 
 from functions.setup.setup import *
 from functions.data_collection.data_collection import *
+from functions.data_collection.kline_buffer import KlineBuffer, get_kline_buffer, register_kline_buffer, \
+    klines_to_arrays
+from functions.data_collection.kline_events import publish_candle
+from functions.data_collection.resampler import KlineResampler
+from functions.data_collection.stream_health import STALE_STREAM_AGE
+from functions.data_collection.stream_multiplexer import StreamMultiplexer, kline_stream_name, \
+    register_stream_handler, register_reconnect_handler, dispatch_stream_data, record_frame
 
 from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger("main")
 
 
 # ----------------------------------functions-----------------------------------
@@ -28,24 +38,97 @@ from dataclasses import dataclass
 # TODO add check so that websocket disconnects and reconnects after 24h
 
 
-def _format_kline(kline: dict) -> pd.DataFrame:
+# kline resamplers of the subscribed streams, keys are (SYMBOL, base interval)
+_resamplers: Dict[Tuple[str, str], KlineResampler] = {}
+
+# open time (unix seconds) of the last closed kline of every stream, keys are
+# (SYMBOL, interval)
+_last_closed: Dict[Tuple[str, str], int] = {}
+
+
+def _ingest_kline(symbol: str, interval: str, kline: dict) -> bool:
     """
     Description:
-        Converts kline from dict to dataframe.
+        Writes a websocket kline into the kline buffer in place and updates
+        the klines resampled from it.
     Args:
-        kline (dict): dictionary of kline to be formatted
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+        kline (dict): 'k' dictionary of the websocket kline message
     Return:
-        (pd.DataFrame): formatted kline dataframe
+        (bool): True if a new candle was opened, False otherwise
     """
-    return pd.DataFrame(data={
-        't': [int(kline['t']/1000)],
-        'o': [float(kline['o'])],
-        'c': [float(kline['c'])],
-        'h': [float(kline['h'])],
-        'l': [float(kline['l'])],
-        'n': [float(kline['n'])],
-        'v': [float(kline['v'])],
-    }).set_index("t")
+    # only the needed fields are converted, straight into the buffer columns
+    values = (
+        kline['t']//1000,
+        float(kline['o']),
+        float(kline['c']),
+        float(kline['h']),
+        float(kline['l']),
+        float(kline['n']),
+        float(kline['v']))
+    closed = kline['x']
+    opened = get_kline_buffer(symbol, interval).update(*values)
+    key = (symbol.upper(), interval)
+    resampler = _resamplers.get(key)
+    if resampler is not None:
+        for target, target_closed in resampler.update(*values, closed=closed):
+            publish_candle(symbol, target, values[0], target_closed)
+    if closed:
+        _last_closed[key] = values[0]
+    publish_candle(symbol, interval, values[0], closed)
+    return opened
+
+
+def backfill_klines(symbol: str, interval: str) -> int:
+    """
+    Description:
+        Downloads only the klines a stream missed since its last closed kline
+        (ie. while reconnecting) and splices them into the kline buffer and
+        the klines resampled from it. Klines already in the buffer are
+        overwritten with the downloaded values, so overlapping updates from
+        the stream are not duplicated.
+    Args:
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+    Return:
+        (int): number of klines downloaded
+    """
+    key = (symbol.upper(), interval)
+    buffer = get_kline_buffer(symbol, interval)
+    seconds = interval_seconds(interval)
+    last_closed = _last_closed.get(key)
+    if last_closed is None:
+        last_time = buffer.last_time()
+        if last_time is None:
+            return 0
+        # the last buffered kline may not have been closed
+        last_closed = last_time - seconds
+    open_time = last_closed_open_time(interval)
+    # a gap longer than the buffer only needs the klines that fit in it
+    start = max(last_closed + seconds, open_time - (buffer.capacity-1)*seconds)
+    klines = klines_to_arrays(
+        fetch_klines_range(symbol, interval, start, open_time + seconds))
+
+    resampler = _resamplers.get(key)
+    for index in range(len(klines['t'])):
+        values = (
+            int(klines['t'][index]),
+            float(klines['o'][index]),
+            float(klines['c'][index]),
+            float(klines['h'][index]),
+            float(klines['l'][index]),
+            float(klines['n'][index]),
+            float(klines['v'][index]))
+        buffer.update(*values)
+        closed = values[0] < open_time
+        if resampler is not None:
+            for target, target_closed in resampler.update(*values, closed=closed):
+                publish_candle(symbol, target, values[0], target_closed)
+        if closed:
+            _last_closed[key] = values[0]
+        publish_candle(symbol, interval, values[0], closed)
+    return len(klines['t'])
 
 
 async def _connect_async_websocket(symbol: str, interval: str, file_lock: threading.Lock):
@@ -55,31 +138,22 @@ async def _connect_async_websocket(symbol: str, interval: str, file_lock: thread
     Args:
         symbol (str): symbol of klines
         interval (str): interval of klines
-        file_lock (threading.Lock): threading lock to avoid thread collisions when data from file is accessed
-        limit (int): Defaults to 500. number of klines to download in file
+        file_lock (threading.Lock): threading lock held while the klines are initialized
     """
-    data_path = os.path.join(
-        "data", "live_data", f"{interval}", f"{symbol.upper()}_{interval}.csv")
-    ws_path = f"wss://stream.binance.com:9443/ws/{symbol.lower()}@kline_{interval}"
+    stream_name = kline_stream_name(symbol, interval)
+    ws_path = f"{retrieve_stream_url()}/ws/{stream_name}"
     async with websockets.connect(ws_path) as ws:
         while True:
             try:
-                current_kline = _format_kline(json.loads(await ws.recv())['k'])
-
-                file_lock.acquire()
-                klines = pd.read_csv(data_path).set_index("t")  # load existing klines
-                file_lock.release()
-
-                if klines.index[-1] != current_kline.index[-1]:  # if new candle has opened
-                    klines = klines.iloc[1:, :]  # remove first candle
-                else:  # update existing candle
-                    klines = klines.iloc[:-1, :]  # remove last candle
-                # update with newest candle
-                klines = klines.append(current_kline)
-
-                file_lock.acquire()
-                klines.to_csv(data_path)
-                file_lock.release()
+                try:
+                    raw = await asyncio.wait_for(ws.recv(), timeout=STALE_STREAM_AGE)
+                except asyncio.TimeoutError:
+                    # open socket stopped delivering, end the thread so it gets restarted
+                    logger.warning(f"{stream_name} stalled for over {STALE_STREAM_AGE}s. Closing websocket.")
+                    return
+                received = time.time()
+                record_frame(raw, stream_name, received)
+                dispatch_stream_data(stream_name, raw, received)
 
                 # reset stream after 24h
                 time_now = datetime.utcfromtimestamp(
@@ -92,24 +166,180 @@ async def _connect_async_websocket(symbol: str, interval: str, file_lock: thread
                 time.sleep(20)
 
 
-def _init_websocket_klines(symbol: str, interval: str, file_lock: threading.Lock, limit: int = 500) -> None:
+def _init_kline_buffer(symbol: str, interval: str, limit: int, shared: bool):
+    """
+    Description:
+        Returns the kline buffer of the symbol/interval, replacing it with a
+        memory mapped store when the klines are shared with other processes.
+    """
+    buffer = get_kline_buffer(symbol, interval, capacity=limit)
+    if shared and not isinstance(buffer, KlineStore):
+        buffer = open_kline_store(symbol, interval, capacity=limit)
+        register_kline_buffer(symbol, interval, buffer)
+    return buffer
+
+
+def init_klines(symbol: str, interval: str, limit: int = 500, shared: bool = False, resample_intervals: List[str] = ()) -> None:
+    """
+    Description:
+        Downloads the klines a stream needs before it is connected into the kline buffers and sets up the resampler of the higher intervals. If the buffers are already filled (ie. daily reset or reconnect) only the klines missed since the last closed kline are downloaded.
+    Args:
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+        limit (int): Defaults to 500. number of klines to download into the buffer
+        shared (bool): Defaults to False. True to write the klines to a memory mapped store other processes can read
+        resample_intervals (List[str]): Defaults to (). higher intervals built locally from this stream instead of their own websockets
+    """
+    buffer = _init_kline_buffer(symbol, interval, limit, shared)
+    # reconnecting stream only needs the klines it missed
+    resampled = (not resample_intervals) or ((symbol.upper(), interval) in _resamplers)
+    if (len(buffer) >= min(limit, buffer.capacity)) and resampled:
+        backfill_klines(symbol, interval)
+        return
+    if resample_intervals:
+        target_buffers = {}
+        for target in resample_intervals:
+            target_buffers[target] = _init_kline_buffer(symbol, target, limit, shared)
+            target_buffers[target].load(download_recent_klines(symbol, target, limit))
+        resampler = KlineResampler(interval, target_buffers)
+        # seed with enough base klines to rebuild the open higher klines
+        klines = download_recent_klines(symbol, interval, max(limit, resampler.history_length()+1))
+        resampler.seed(klines_to_arrays(klines))
+        _resamplers[(symbol.upper(), interval)] = resampler
+    else:
+        klines = download_recent_klines(symbol, interval, limit)
+    buffer.load(klines)
+
+
+def _init_websocket_klines(symbol: str, interval: str, file_lock: threading.Lock, limit: int = 500, shared: bool = False, resample_intervals: List[str] = (), ready: threading.Event = None) -> None:
     """
     Description:
         Initiates all the kline data necessary before connecting to the socket stream. Specifically downloads the last 500 candles
     Args:
         symbol (str): symbol of klines
         interval (str): interval of klines
-        file_lock (threading.Lock): threading lock to avoid thread collisions when data from file is accessed
-        limit (int): Defaults to 500. number of klines to download in file
+        file_lock (threading.Lock): threading lock held while the klines are initialized
+        limit (int): Defaults to 500. number of klines to download into the buffer
+        shared (bool): Defaults to False. True to write the klines to a memory mapped store other processes can read
+        resample_intervals (List[str]): Defaults to (). higher intervals built locally from this stream instead of their own websockets
+        ready (threading.Event): Defaults to None. set once the klines are initialized
     """
-    init_coin(symbol, interval)
-    data_path = os.path.join("data", "live_data", f"{interval}", f"{symbol.upper()}_{interval}.csv")
     file_lock.acquire()
-    download_recent_klines(symbol, interval, limit).to_csv(data_path)
-    file_lock.release()
+    try:
+        init_klines(symbol, interval, limit, shared, resample_intervals)
+    finally:
+        file_lock.release()
+        if ready is not None:
+            ready.set()
     asyncio.run(_connect_async_websocket(symbol, interval, file_lock))
 
 
+def _handle_kline_message(stream_name: str, data: dict):
+    """
+    Description:
+        Handles a kline message of a combined stream connection.
+    Args:
+        stream_name (str): name of the stream
+        data (dict): kline event of the message
+    """
+    _ingest_kline(data['s'], data['k']['i'], data['k'])
+
+
+def _handle_kline_reconnect(stream_name: str):
+    """
+    Description:
+        Backfills the klines a kline stream missed while its combined stream
+        connection was down.
+    Args:
+        stream_name (str): name of the stream (ie. 'btcusdt@kline_5m')
+    """
+    symbol, kind = stream_name.split('@')
+    backfill_klines(symbol.upper(), kind[len('kline_'):])
+
+
+register_stream_handler('kline', _handle_kline_message)
+register_reconnect_handler('kline', _handle_kline_reconnect)
+
+
+def subscribe_klines(multiplexer: StreamMultiplexer, symbol: str, interval: str, file_lock: threading.Lock, limit: int = 500, shared: bool = False, resample_intervals: List[str] = ()) -> None:
+    """
+    Description:
+        Initiates the klines of a symbol/interval and adds its kline stream to the multiplexer instead of starting a websocket thread for it.
+    Args:
+        multiplexer (StreamMultiplexer): multiplexer carrying the stream
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+        file_lock (threading.Lock): threading lock held while the klines are initialized
+        limit (int): Defaults to 500. number of klines held in the buffer
+        shared (bool): Defaults to False. True to write the klines to a memory mapped store other processes can read
+        resample_intervals (List[str]): Defaults to (). higher intervals built locally from this stream, read them with update_klines and the same file_lock
+    """
+    stream_name = kline_stream_name(symbol, interval)
+    if stream_name in multiplexer.streams():
+        return
+    file_lock.acquire()
+    try:
+        init_klines(symbol, interval, limit, shared, resample_intervals)
+    finally:
+        file_lock.release()
+    multiplexer.add_streams([stream_name])
+
+
+def unsubscribe_klines(multiplexer: StreamMultiplexer, symbol: str, interval: str) -> None:
+    """
+    Description:
+        Removes the kline stream of a symbol/interval from the multiplexer and stops updating the klines resampled from it.
+    Args:
+        multiplexer (StreamMultiplexer): multiplexer carrying the stream
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+    """
+    multiplexer.remove_streams([kline_stream_name(symbol, interval)])
+    _resamplers.pop((symbol.upper(), interval), None)
+
+
+def connect_websocket(symbol: str, interval: str, file_lock: threading.Lock, limit: int = 500, shared: bool = False, resample_intervals: List[str] = ()) -> threading.Thread:
+    """
+    Description:
+        Creates a new thread for the websocket and creates connection.
+    Args:
+        symbol (str): symbol of klines
+        interval (str): interval of klines
+        file_lock (threading.Lock): threading lock held while the klines are initialized
+        limit (int): Defaults to 500. number of klines held in the buffer
+        shared (bool): Defaults to False. True to write the klines to a memory mapped store other processes can read
+        resample_intervals (List[str]): Defaults to (). higher intervals built locally from this stream, read them with update_klines and the same file_lock
+    Return:
+        (threading.Thread): thread that is used for websocket connection
+    """
+    ready = threading.Event()
+    websocket_thread = threading.Thread(
+        target=_init_websocket_klines,
+        args=[symbol, interval, file_lock, limit, shared, resample_intervals, ready],
+        daemon=True)
+    websocket_thread.name = f"{symbol}_{interval}_Websocket_Thread"
+    websocket_thread.start()
+    ready.wait()
+    return websocket_thread
+
+
+def update_klines(symbol: str, interval: str, file_lock: threading.Lock) -> pd.DataFrame:
+    """
+    Description:
+        Returns a consistent snapshot of the klines held in memory for the
+        symbol/interval.
+    Args:
+        symbol (str): symbol of kline data
+        interval (str): interval of kline data
+        file_lock (threading.Lock): threading lock held while the klines are initialized
+    Returns:
+        pd.DataFrame: dataframe with most recent updated klines
+    """
+    while file_lock.locked():
+        time.sleep(0.25)
+    return get_kline_buffer(symbol, interval).snapshot()
+
+
 @dataclass
 class LiveKlines:
     """
@@ -134,48 +364,17 @@ class LiveKlines:
         """
         Description:
             Creates a new thread for the websocket and creates connection.
-        Args:
-            symbol (str): symbol of klines
-            interval (str): interval of klines
-            file_lock (threading.Lock): threading lock to avoid thread collisions when data from file is accessed
-            limit (int): Defaults to 500. number of klines to download in file
         Return:
             (threading.Thread): thread that is used for websocket connection
         """
         print("connecting webscoket")
-        websocket_thread = threading.Thread(target=_init_websocket_klines, 
-            args=[
-                self.symbol, 
-                self.interval, 
-                self.file_lock, 
-                self.limit], 
-            daemon=True)
-        websocket_thread.start()
-        time.sleep(3)
-        while self.file_lock.locked():
-            time.sleep(0.25)
-        websocket_thread.name = f"{self.symbol}_{self.interval}_Websocket_Thread"
-        return websocket_thread
+        return connect_websocket(self.symbol, self.interval, self.file_lock, self.limit)
 
     def update_klines(self) -> pd.DataFrame:
         """
         Description:
-            Reads csv file for klines in thread safe manner.
-        Args:
-            symbol (str): symbol of kline data
-            interval (str): interval of kline data
-            file_lock (threading.Lock): thread safe lock of data file
+            Returns a consistent snapshot of the klines held in memory.
         Returns:
             pd.DataFrame: dataframe with most recent updated klines
         """
-        data_path = os.path.join("data", "live_data", self.interval, f"{self.symbol.upper()}_{self.interval}.csv")
-        self.file_lock.acquire()
-        while True:
-            try:
-                klines = pd.read_csv(data_path)
-                break
-            except OSError:
-                time.sleep(20)
-        self.file_lock.release()
-        return klines
-
+        return update_klines(self.symbol, self.interval, self.file_lock)
@@ -10,6 +10,7 @@ from datetime import datetime
 import time
 import sys
 import os
+import numpy as np
 import pandas as pd
 from pprint import pprint, pformat
 import csv
@@ -78,20 +79,33 @@ def klines_dict_to_df(klines):
 def get_timestamp():
     return int(time.time()*1000)
 
+#PARAM klines(list): raw candles returned by the binance REST api
+#RETURN (dict): numpy arrays of the t, o, c, h, l, n and v columns, converted 
+# in one pass without building a DataFrame
+def binance_klines_to_arrays(klines):
+    if not len(klines):
+        return {
+            't': np.zeros(0, dtype=np.int64),
+            **{column: np.zeros(0, dtype=np.float64) for column in 'ochlnv'}}
+    raw = np.asarray(klines, dtype=object)
+    prices = raw[:, 1:6].astype(np.float64)
+    return {
+        't': raw[:, 0].astype(np.int64) // 1000,
+        'o': prices[:, 0],
+        'c': prices[:, 3],
+        'h': prices[:, 1],
+        'l': prices[:, 2],
+        'n': raw[:, 8].astype(np.float64),
+        'v': prices[:, 4],
+    }
+
 #PARAM klines: candles to be formated from dictionary to DataFrame
 #RETURN (DataFrame): DataFrame of formatted candles
 def format_binance_klines(klines):
-    formatted_klines = []
-    for kline in klines:
-        formatted_klines.append({})
-        formatted_klines[-1]['t'] = int(kline[0]/1000)
-        formatted_klines[-1]['o'] = float(kline[1])
-        formatted_klines[-1]['h'] = float(kline[2])
-        formatted_klines[-1]['l'] = float(kline[3])
-        formatted_klines[-1]['c'] = float(kline[4])
-        formatted_klines[-1]['v'] = float(kline[5])
-        formatted_klines[-1]['n'] = float(kline[8])
-    return klines_dict_to_df(formatted_klines)
+    arrays = binance_klines_to_arrays(klines)
+    return pd.DataFrame(
+        {column: arrays[column] for column in ['o','c','h','l','n','v']},
+        index=pd.Index(arrays['t'], name='t'))
 
 #PARAM string(str): string to be padded with whitespace
 #PARAM padding(float=0.3): percentage of terminal width to use for padding
@@ -186,6 +200,26 @@ def retrieve_method_type():
     return os.environ["MethodType"]
 
 
+def retrieve_api_url() -> str:
+    """
+    Retrieves the Binance REST base url from environment (ie. a local 
+    stand-in server), defaults to the real exchange.
+
+    :return str: REST base url without a trailing slash
+    """
+    return (os.environ.get("BINANCE_API_URL") or "https://api.binance.com").rstrip('/')
+
+
+def retrieve_stream_url() -> str:
+    """
+    Retrieves the Binance websocket base url from environment (ie. a local 
+    stand-in server), defaults to the real exchange.
+
+    :return str: websocket base url without a trailing slash
+    """
+    return (os.environ.get("BINANCE_STREAM_URL") or "wss://stream.binance.com:9443").rstrip('/')
+
+
 def retrieve_keys() -> Tuple[str, str]:
     """
     Retrieves specified API keys from environment.
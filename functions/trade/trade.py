@@ -9,25 +9,70 @@
 
 
 from pprint import pprint, pformat
-import datetime
+from datetime import datetime
 import os
 import threading
+import time
 import logging
-from random import randint
+
+from api.general_api import API
+from functions.data_collection.exchange_info import exchange_info_cache, symbol_filters
+from functions.data_collection.price_cache import current_price
+from functions.setup.setup import convert_time, retrieve_api_url, retrieve_keys
+from functions.trade.user_data import OPEN_STATUSES, account_balances, account_state, \
+    tracked_order, wait_for_order
+
+logger = logging.getLogger("main")
+
+
+# ----------------------------------constants-----------------------------------
+
+# seconds an order that was not filled when placed is waited for to be
+# filled, cancelled or expired
+ORDER_CONFIRM_TIMEOUT = 10
 
 
 # ----------------------------------functions-----------------------------------
 
-# PARAM
-# RETURN
+def send_signed_request(http_method: str, url_path: str, payload: dict = None) -> dict:
+    """
+    Description:
+        Sends a signed API request with the configured keys.
+    """
+    return API(*retrieve_keys(), retrieve_api_url()).send_signed_request(
+        http_method, url_path, payload)
+
+
+# PARAM payload(dict): order request attributes
+# RETURN (dict): order receipt, once the order is filled, cancelled or expired
+# (or ORDER_CONFIRM_TIMEOUT passed), with 'confirmLatencyMs' from submitting
+# to confirming it
 def request_order(payload={}):
-    order_request = send_signed_request('POST', '/api/v3/order', payload)
+    # a FULL response holds the fills of orders that fill when placed (ie.
+    # market orders), other orders are waited for on their fill event
+    payload = dict(payload, newOrderRespType='FULL')
     try:
         now = convert_time(time.time())
         logger.info(
             f"Creating {payload['symbol'].upper()} {payload['type'].replace('_', ' ')} {payload['side'].upper()} order at {now} ({normalize_time(now)}).")
     except KeyError:
         logger.info("Creating Purchase Order")
+    submitted = time.perf_counter()
+    order_request = send_signed_request('POST', '/api/v3/order', payload)
+    if 'orderId' in order_request:
+        # the order is live from here on, so a failed confirmation returns
+        # the placement receipt instead of losing the order
+        try:
+            account_state.apply_order(order_request)
+            if order_request['status'] in OPEN_STATUSES:
+                order_request = dict(order_request, **wait_for_order(
+                    order_request['symbol'], order_request['orderId'], ORDER_CONFIRM_TIMEOUT))
+        except Exception:
+            logger.error(f"Could not confirm {order_request.get('symbol')} order "
+                         f"{order_request['orderId']}.", exc_info=True)
+        order_request['confirmLatencyMs'] = round((time.perf_counter() - submitted)*1000, 3)
+        logger.info(f"{order_request.get('symbol')} order {order_request['orderId']} "
+                    f"{order_request.get('status')} in {order_request['confirmLatencyMs']}ms.")
     return order_request
 
 # PARAM symbol(str): symbol of coin to buy
@@ -46,7 +91,6 @@ def buy_trade(symbol: str, quote_quantity: float = 0, quantity: float = 0):
         'quantity':     desired_quantity,
     }
     trade_receipt = request_order(buy_payload)
-    time.sleep(5)
     with open('logs/orders.txt', 'a') as f:
         f.write(f"TIME: {convert_time(time.time())} - \
             {normalize_time(convert_time(time.time()))}\n$ ======== BUY ORDER \
@@ -81,7 +125,6 @@ def sell_trade(symbol: str, quote_quantity: float = 0, quantity: float = 0):
         'quantity':     desired_quantity,
     }
     trade_receipt = request_order(sell_payload)
-    time.sleep(5)
     with open(os.path.join('logs', 'orders.txt'), 'a') as f:
         f.write(f"TIME: {convert_time(time.time())} - \
             {normalize_time(convert_time(time.time()))}\n$ ======== SELL \
@@ -102,38 +145,35 @@ def sell_trade(symbol: str, quote_quantity: float = 0, quantity: float = 0):
 
 def get_profit_quantity(symbol, buy_quantity):
     # need to do this because there is 0.1% fee on trade
+    filters = symbol_filters(symbol)
     profit_quantity = buy_quantity*(1 - (0.1/100))
-    profit_quantity -= profit_quantity % trade_step_size(symbol)
-    precision = int(trade_precision(symbol))
-    return round(profit_quantity, precision-1)
+    profit_quantity -= profit_quantity % filters.step_size
+    return round(profit_quantity, filters.base_asset_precision-1)
 
 
+# symbol filters are read from the exchange info cache, which is kept in
+# memory and refreshed in the background
 def trade_precision(symbol):
-    return exchange_information(symbol=symbol)['baseAssetPrecision']
+    return symbol_filters(symbol).base_asset_precision
 
 
 def trade_step_size(symbol):
-    filters = exchange_information(symbol=symbol)['filters']
-    for item in filters:
-        if 'stepSize' in item.keys():
-            return float(item['stepSize'])
+    return symbol_filters(symbol).step_size
 
 
 def trade_min_max_quantity(symbol):
-    filters = exchange_information(symbol=symbol)['filters']
-    for item in filters:
-        if 'stepSize' in item.keys():
-            return float(item['minQty']), float(item['maxQty'])
+    filters = symbol_filters(symbol)
+    return filters.min_qty, filters.max_qty
 
 
 def exchange_information(symbol=-1):
-    response = send_public_request('/api/v3/exchangeInfo')
     if symbol == -1:
-        return response
+        return exchange_info_cache.exchange_info()
     else:
-        for item in response['symbols']:
-            if item['symbol'] == symbol:
-                return item
+        try:
+            return exchange_info_cache.symbol_info(symbol)
+        except KeyError:
+            return None
 
 
 def get_hardcoded_quantity(symbol, trade_quote_qty):
@@ -149,16 +189,8 @@ def get_hardcoded_quantity(symbol, trade_quote_qty):
 
 
 def get_current_price(symbol):
-    response = send_public_request('/api/v3/ticker/price', {"symbol": symbol})
-    try:
-        current_price = float(response["price"])
-    except KeyError:
-        logger.warning(
-            f"Key Error: Could not retrieve current price. Retrying in 60s.\n{pformat(response)}")
-        time.sleep(randint(30, 90))
-        return get_current_price(symbol)
-    else:
-        return current_price
+    # served from the bookTicker price cache, REST only when stale
+    return current_price(symbol)
 
 
 def get_payment_symbol(symbol):
@@ -172,12 +204,13 @@ def get_payment_symbol(symbol):
 
 
 def validate_quantity(symbol, quantity):
-    minQty, maxQty = trade_min_max_quantity(symbol)
-    step = trade_step_size(symbol)
+    filters = symbol_filters(symbol)
+    minQty, maxQty = filters.min_qty, filters.max_qty
+    step = filters.step_size
     quantity -= quantity % float(step)
     current_price = get_current_price(symbol)
-    minNotional = get_minimum_notional(symbol)
-    precision = int(trade_precision(symbol))
+    minNotional = filters.min_notional
+    precision = filters.base_asset_precision
     if quantity > float(maxQty):
         logger.info(f"Using maximum quantity {maxQty}.")
         return maxQty
@@ -198,11 +231,7 @@ def validate_quantity(symbol, quantity):
 
 
 def get_minimum_notional(symbol):
-    filters = exchange_information(symbol=symbol)['filters']
-    for filter in filters:
-        if filter['filterType'] == 'MIN_NOTIONAL':
-            minNotional = filter['minNotional']
-    return float(minNotional)
+    return symbol_filters(symbol).min_notional
 
 
 def get_minimum_cut(symbol):
@@ -213,13 +242,18 @@ def get_minimum_cut(symbol):
     return minimum_cut
 
 
+def account_info(symbols=None):
+    # free balances, from the user data stream while it is running
+    return {asset: balance.free for asset, balance in account_balances(symbols).items()}
+
+
+def get_order(symbol, orderId):
+    # tracked by the user data stream, REST only for orders it has not seen
+    return tracked_order(symbol, orderId)
+
+
 def last_order_quantity(symbol, orderId):
-    while True:
-        try:
-            quantity = float(get_order(symbol, orderId)['executedQty'])
-            return quantity
-        except KeyError:
-            logger.error(f"Could not find last order quantity.", exc_info=True)
+    return float(get_order(symbol, orderId)['executedQty'])
 
 
 def my_trades(symbol: str) -> list:
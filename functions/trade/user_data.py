@@ -0,0 +1,473 @@
+#!/usr/bin/python3
+#
+# user_data.py: contains the in memory account state (balances, orders and
+# fills) kept up to date by the user data stream, with REST only used for the
+# snapshot and resyncs.
+#
+# Andrew Bishop
+# 2026/10/18
+#
+
+# modules imported
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple
+
+import binance
+import requests
+
+from functions.data_collection.data_collection import binance_client
+from functions.data_collection.stream_health import set_quiet_stream
+from functions.data_collection.stream_multiplexer import StreamMultiplexer, USER_DATA_STREAM, \
+    register_reconnect_handler, register_stream_handler
+
+logger = logging.getLogger("main")
+
+
+# ----------------------------------constants-----------------------------------
+
+# seconds between listenKey keepalives, the exchange drops a key after an
+# hour without one
+LISTEN_KEY_KEEPALIVE = 30*60
+
+# statuses of orders that can still fill
+OPEN_STATUSES = ('PENDING_NEW', 'NEW', 'PARTIALLY_FILLED')
+
+# closed orders kept in memory per symbol
+ORDER_HISTORY = 500
+
+# seconds between order downloads while waiting for an order without the
+# user data stream
+ORDER_POLL_INTERVAL = 0.25
+
+
+# -----------------------------------classes------------------------------------
+
+class Balance(NamedTuple):
+    """
+    Description:
+        Free and locked balance of an asset.
+    """
+    free: float
+    locked: float
+
+    @property
+    def total(self) -> float:
+        return self.free + self.locked
+
+
+class AccountState:
+    """
+    Description:
+        Balances, orders and fills of the account in memory. Orders are kept
+        in the REST order format (with their 'fills' added) by symbol and
+        orderId. Balances and orders are replaced (never mutated) on updates
+        so they are read without a lock, updates older than the state are
+        dropped so a snapshot and the stream can be applied in any order.
+    """
+
+    def __init__(self):
+        self.balances: Dict[str, Balance] = {}
+        self.balances_updated = 0  # ms of the last balance update
+        self.live = False  # True while a user data stream keeps it up to date
+        self.condition = threading.Condition()  # notified on every order update
+        self._orders: Dict[str, Dict[int, dict]] = {}  # symbol to orderId to order
+        self._closed: Dict[str, deque] = {}  # symbol to its closed orderIds
+
+    # ----------------------------------------------------------
+    #                          Updates
+    # ----------------------------------------------------------
+
+    def apply_account(self, account: dict):
+        """
+        Description:
+            Replaces the balances with a /api/v3/account snapshot.
+        """
+        with self.condition:
+            if account['updateTime'] < self.balances_updated:
+                return
+            self.balances = {item['asset']: Balance(float(item['free']), float(item['locked']))
+                             for item in account['balances']}
+            self.balances_updated = account['updateTime']
+
+    def apply_position(self, event: dict):
+        """
+        Description:
+            Applies an outboundAccountPosition event (the balances of the
+            assets that changed).
+        """
+        with self.condition:
+            if event['u'] < self.balances_updated:
+                return
+            balances = dict(self.balances)
+            for item in event['B']:
+                balances[item['a']] = Balance(float(item['f']), float(item['l']))
+            self.balances = balances
+            self.balances_updated = event['u']
+
+    @staticmethod
+    def _is_older(stored: dict, executed_qty: str, status: str) -> bool:
+        # fills only grow and closed orders never open again
+        if stored is None:
+            return False
+        return (float(stored['executedQty']) > float(executed_qty)) or \
+            ((stored['status'] not in OPEN_STATUSES) and (status in OPEN_STATUSES))
+
+    def _store_order(self, order: dict):
+        symbol, order_id = order['symbol'], order['orderId']
+        orders = self._orders.setdefault(symbol, {})
+        orders[order_id] = order
+        if order['status'] not in OPEN_STATUSES:
+            closed = self._closed.setdefault(symbol, deque())
+            if order_id not in closed:
+                closed.append(order_id)
+            while len(closed) > ORDER_HISTORY:
+                orders.pop(closed.popleft(), None)
+        self.condition.notify_all()
+
+    def apply_order(self, order: dict):
+        """
+        Description:
+            Applies an order in the REST format (ie. /api/v3/order or an
+            order response), unless the stored order already got further.
+        """
+        with self.condition:
+            stored = self.order(order['symbol'], order['orderId'])
+            if self._is_older(stored, order['executedQty'], order['status']):
+                return
+            order = dict(order)
+            order.setdefault('updateTime', order.get('transactTime', 0))
+            if 'fills' not in order:
+                order['fills'] = stored['fills'] if (stored is not None) else []
+            self._store_order(order)
+
+    def apply_execution_report(self, event: dict):
+        """
+        Description:
+            Applies an executionReport event, adding its fill if it traded.
+        """
+        with self.condition:
+            stored = self.order(event['s'], event['i'])
+            if self._is_older(stored, event['z'], event['X']):
+                return
+            fills = list(stored['fills']) if (stored is not None) else []
+            if (event['x'] == 'TRADE') and \
+                    all(fill['tradeId'] != event['t'] for fill in fills):
+                fills.append({
+                    'price': event['L'],
+                    'qty': event['l'],
+                    'commission': event['n'],
+                    'commissionAsset': event['N'],
+                    'tradeId': event['t']})
+            self._store_order({
+                'symbol': event['s'],
+                'orderId': event['i'],
+                # cancels report the id of the cancel request in 'c'
+                'clientOrderId': event['C'] if event['C'] else event['c'],
+                'price': event['p'],
+                'origQty': event['q'],
+                'executedQty': event['z'],
+                'cummulativeQuoteQty': event['Z'],
+                'status': event['X'],
+                'timeInForce': event['f'],
+                'type': event['o'],
+                'side': event['S'],
+                'time': event['O'],
+                'updateTime': event['T'],
+                'fills': fills})
+
+    # ----------------------------------------------------------
+    #                          Queries
+    # ----------------------------------------------------------
+
+    def balance(self, asset: str) -> Balance:
+        """
+        Description:
+            Returns the balance of an asset, zero if the account has none.
+        """
+        return self.balances.get(asset.upper(), Balance(0.0, 0.0))
+
+    def order(self, symbol: str, order_id: int) -> dict:
+        """
+        Description:
+            Returns a tracked order, None if it is not tracked.
+        """
+        return self._orders.get(symbol.upper(), {}).get(int(order_id))
+
+    def open_orders(self, symbol: str = None) -> List[dict]:
+        """
+        Description:
+            Returns the open orders of a symbol, or of every symbol.
+        """
+        symbols = [symbol.upper()] if symbol else list(self._orders)
+        return [order for name in symbols for order in list(self._orders.get(name, {}).values())
+                if order['status'] in OPEN_STATUSES]
+
+    def fills(self, symbol: str, order_id: int) -> List[dict]:
+        """
+        Description:
+            Returns the fills of a tracked order, empty if it is not tracked.
+        """
+        order = self.order(symbol, order_id)
+        return [] if (order is None) else order['fills']
+
+    def wait_for_order(self, symbol: str, order_id: int, timeout: float = None) -> dict:
+        """
+        Description:
+            Blocks until a tracked order is filled, cancelled, rejected or
+            expired.
+        Args:
+            symbol (str): symbol of the order
+            order_id (int): id of the order
+            timeout (float, optional): seconds to wait at most (defaults to
+            None, no limit)
+        Returns:
+            dict: the order, still open if the timeout passed, None if it was
+            never tracked
+        """
+        def closed():
+            order = self.order(symbol, order_id)
+            return (order is not None) and (order['status'] not in OPEN_STATUSES)
+
+        with self.condition:
+            self.condition.wait_for(closed, timeout)
+        return self.order(symbol, order_id)
+
+
+class UserDataStream:
+    """
+    Description:
+        Keeps the account state up to date from the user data stream of the
+        account, carried by a multiplexer. The listenKey is kept alive by a
+        background thread and renewed if the exchange drops it, the account
+        is resynced over REST after the stream (re)connects.
+    Args:
+        multiplexer (StreamMultiplexer): multiplexer carrying the stream
+        keepalive (float, optional): seconds between listenKey keepalives
+        (defaults to LISTEN_KEY_KEEPALIVE)
+    """
+
+    def __init__(self, multiplexer: StreamMultiplexer, keepalive: float = LISTEN_KEY_KEEPALIVE):
+        self.multiplexer = multiplexer
+        self.keepalive = keepalive
+        self.listen_key = None
+        self.renewals = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.thread = None
+
+    def _subscribe(self, listen_key: str):
+        self.listen_key = listen_key
+        set_quiet_stream(listen_key)
+        self.multiplexer.add_streams([listen_key])
+
+    def _unsubscribe(self, listen_key: str):
+        self.multiplexer.remove_streams([listen_key])
+        set_quiet_stream(listen_key, False)
+
+    def start(self) -> "UserDataStream":
+        """
+        Description:
+            Subscribes the user data stream, loads the account snapshot and
+            starts the keepalive thread.
+        """
+        global _user_data_stream
+        with self._lock:
+            if self.thread is not None:
+                return self
+            _user_data_stream = self
+            self._subscribe(binance_client().stream_get_listen_key())
+            # snapshot after subscribing so no update falls between the two
+            resync_account()
+            account_state.live = True
+            self.thread = threading.Thread(
+                target=self._keepalive_forever, name="User_Data_Thread", daemon=True)
+            self.thread.start()
+        return self
+
+    def renew(self):
+        """
+        Description:
+            Gets a listenKey again (the exchange hands out the live key, or a
+            new one if it dropped the old one) and resyncs the account if the
+            key changed.
+        """
+        with self._lock:
+            if self._stop.is_set():
+                return
+            listen_key = binance_client().stream_get_listen_key()
+            if listen_key == self.listen_key:
+                return
+            logger.info("Renewed the user data stream listenKey.")
+            self._unsubscribe(self.listen_key)
+            self._subscribe(listen_key)
+            self.renewals += 1
+        resync_account()
+
+    def _keepalive_forever(self):
+        while not self._stop.wait(self.keepalive):
+            try:
+                binance_client().stream_keepalive(self.listen_key)
+            except binance.exceptions.BinanceAPIException:
+                logger.warning("User data stream keepalive failed. Renewing listenKey.", exc_info=True)
+                try:
+                    self.renew()
+                except (binance.exceptions.BinanceAPIException,
+                        requests.exceptions.ConnectionError):
+                    logger.error("Could not renew the user data stream listenKey.", exc_info=True)
+            except requests.exceptions.ConnectionError:
+                logger.warning("User data stream keepalive failed.", exc_info=True)
+
+    def stop(self):
+        """
+        Description:
+            Removes the stream, closes the listenKey and goes back to REST for
+            the account state.
+        """
+        global _user_data_stream
+        with self._lock:
+            self._stop.set()
+            account_state.live = False
+            if _user_data_stream is self:
+                _user_data_stream = None
+            if self.listen_key is None:
+                return
+            self._unsubscribe(self.listen_key)
+            try:
+                binance_client().stream_close(self.listen_key)
+            except (binance.exceptions.BinanceAPIException,
+                    requests.exceptions.ConnectionError):
+                logger.warning("Could not close the user data stream listenKey.", exc_info=True)
+
+
+# ----------------------------------functions-----------------------------------
+
+# account state shared by the whole process
+account_state = AccountState()
+
+# running user data stream, renewed from the stream handler
+_user_data_stream: UserDataStream = None
+
+
+def refresh_balances():
+    """
+    Description:
+        Downloads the balances of the account.
+    """
+    account_state.apply_account(binance_client().get_account())
+
+
+def refresh_order(symbol: str, order_id: int) -> dict:
+    """
+    Description:
+        Downloads an order and returns it as tracked.
+    """
+    account_state.apply_order(binance_client().get_order(symbol=symbol.upper(), orderId=int(order_id)))
+    return account_state.order(symbol, order_id)
+
+
+def resync_account():
+    """
+    Description:
+        Downloads the balances and open orders of the account. Tracked
+        orders that are no longer open closed while the stream was down and
+        are downloaded again for their final state.
+    """
+    refresh_balances()
+    open_orders = binance_client().get_open_orders()
+    for order in open_orders:
+        account_state.apply_order(order)
+    still_open = {(order['symbol'], order['orderId']) for order in open_orders}
+    for order in account_state.open_orders():
+        if (order['symbol'], order['orderId']) not in still_open:
+            refresh_order(order['symbol'], order['orderId'])
+
+
+def _handle_user_data(stream_name: str, data: dict):
+    """
+    Description:
+        Stream handler of user data messages.
+    """
+    event = data.get('e')
+    if event == 'executionReport':
+        account_state.apply_execution_report(data)
+    elif event == 'outboundAccountPosition':
+        account_state.apply_position(data)
+    elif (event == 'listenKeyExpired') and (_user_data_stream is not None):
+        # renewing makes REST requests, so not on the stream event loop
+        threading.Thread(target=_user_data_stream.renew, daemon=True).start()
+
+
+def _catch_up_user_data(stream_name: str):
+    if (_user_data_stream is not None) and (stream_name == _user_data_stream.listen_key):
+        resync_account()
+
+
+register_stream_handler(USER_DATA_STREAM, _handle_user_data)
+register_reconnect_handler(USER_DATA_STREAM, _catch_up_user_data)
+
+
+def account_balances(assets: Iterable[str] = None) -> Dict[str, Balance]:
+    """
+    Description:
+        Returns the balances of the account from memory while the user data
+        stream is running, otherwise they are downloaded first.
+    Args:
+        assets (Iterable[str], optional): assets to return (defaults to every
+        asset)
+    Returns:
+        Dict[str, Balance]: asset to its balance
+    """
+    if not account_state.live:
+        refresh_balances()
+    balances = account_state.balances
+    if assets is None:
+        return dict(balances)
+    return {asset: balances[asset] for asset in assets if asset in balances}
+
+
+def tracked_order(symbol: str, order_id: int) -> dict:
+    """
+    Description:
+        Returns an order from memory, downloading it if it is not tracked or
+        could have changed unseen (open while the user data stream is not
+        running).
+    Args:
+        symbol (str): symbol of the order
+        order_id (int): id of the order
+    Returns:
+        dict: order in the REST format with its fills
+    """
+    order = account_state.order(symbol, order_id)
+    if (order is None) or ((not account_state.live) and (order['status'] in OPEN_STATUSES)):
+        order = refresh_order(symbol, order_id)
+    return order
+
+
+def wait_for_order(symbol: str, order_id: int, timeout: float) -> dict:
+    """
+    Description:
+        Blocks until an order is filled, cancelled, rejected or expired, on
+        the fill event of the user data stream while it is running,
+        otherwise (or if the event does not arrive before the timeout) by
+        downloading the order every ORDER_POLL_INTERVAL.
+    Args:
+        symbol (str): symbol of the order
+        order_id (int): id of the order
+        timeout (float): seconds to wait at most
+    Returns:
+        dict: the order, still open if the timeout passed
+    """
+    deadline = time.monotonic() + timeout
+    if account_state.live:
+        order = account_state.wait_for_order(symbol, order_id, timeout)
+        if (order is not None) and (order['status'] not in OPEN_STATUSES):
+            return order
+    # no stream, or its event did not arrive in time
+    order = refresh_order(symbol, order_id)
+    while (order['status'] in OPEN_STATUSES) and (time.monotonic() < deadline):
+        time.sleep(min(ORDER_POLL_INTERVAL, max(deadline - time.monotonic(), 0)))
+        order = refresh_order(symbol, order_id)
+    return order
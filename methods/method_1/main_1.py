@@ -21,6 +21,12 @@ from data_collection import *
 from market import *
 from trade import *
 from parameters import *
+from functions.data_collection.bar_builder import subscribe_bars, unsubscribe_bars
+from functions.data_collection.data_collection import download_many_to_csv
+from functions.data_collection.kline_events import wait_for_candle
+from functions.data_collection.price_cache import current_price as current_price_f, \
+    subscribe_prices, unsubscribe_prices
+from functions.data_collection.stream_multiplexer import StreamMultiplexer
 
 
 #------------------------------------TODOs-------------------------------------
@@ -51,6 +57,12 @@ from parameters import *
 #TODO: make function for main string formatting and printing (code already 
 # exists)
 
+#----------------------------------constants-----------------------------------
+
+# bars the open trades are followed on
+TRADE_BAR = '5s'
+
+
 #----------------------------------functions-----------------------------------
 
 def trade_loop_1(
@@ -58,7 +70,8 @@ def trade_loop_1(
     symbol: str, 
     interval: str, 
     paper_flag: bool,
-    stop_loss: float):
+    stop_loss: float,
+    multiplexer: StreamMultiplexer):
     """
     Description: 
         Initiates a trade cycle (buys & waits til sold) for the specified 
@@ -69,55 +82,76 @@ def trade_loop_1(
         interval (str): symbol of currency to trade
         paper_flag (bool): interval of klines to be used for analysis 
         stop_loss (float): to indicate whether to use real or paper money
+        multiplexer (StreamMultiplexer): multiplexer carrying the trade and 
+        price streams of the trade
     Return: 
         None
     """
-    if (not paper_flag):
-        buy_id, sell_quantity = buy_trade(symbol, 15) #buy in
+    # stream the best bid/ask of the trade so prices come from memory
+    subscribe_prices(multiplexer, [symbol])
+    try:
+        if (not paper_flag):
+            buy_id, sell_quantity = buy_trade(symbol, 15) #buy in
     
-    buy_price = current_price_f(symbol)
-    print(f"{GREY}BUY PRICE{WHITE}: {buy_price}") if (not cron_flag) else None
-    start_time = time.time()
-    print(f"Start: {get_time(start_time-8*3600)} - {start_time}\n") if \
-        (not cron_flag) else None
+        buy_price = current_price_f(symbol)
+        print(f"{GREY}BUY PRICE{WHITE}: {buy_price}") if (not cron_flag) else None
+        start_time = time.time()
+        print(f"Start: {get_time(start_time-8*3600)} - {start_time}\n") if \
+            (not cron_flag) else None
 
-    max_price = buy_price
-    stop_price = buy_price*(1-stop_loss)
+        max_price = buy_price
+        stop_price = buy_price*(1-stop_loss)
     
-    while True:
-        try:
-            klines = download_to_csv(symbol, interval)
-            current_price = klines.iloc[-1]['c']
-            current_high = klines.iloc[-1]['h']
+        # follow the trade on 5s bars built from its trades so the stop loss 
+        # reacts within seconds instead of waiting for the 1m klines
+        bars = subscribe_bars(multiplexer, symbol, [TRADE_BAR], limit=5)
+        kline_version = None
+    
+        while True:
+            try:
+                klines = bars[TRADE_BAR].snapshot()
+                if not len(klines): # no trades since subscribing
+                    kline_version = wait_for_candle(
+                        symbol, TRADE_BAR, since=kline_version, timeout=30)
+                    continue
+                current_price = klines.iloc[-1]['c']
+                current_high = klines.iloc[-1]['h']
             
-            max_price = max(max_price, current_high)
+                max_price = max(max_price, current_high)
             
-            if (current_price < stop_price): # if below stop loss take losses
-                if (not paper_flag):
-                    sell_trade(symbol, quantity=sell_quantity)
-                sell_price = current_price_f(symbol)
-                profit = get_profit(buy_price, sell_price, paper=paper_flag)
-                profit_color = GREEN if profit > 0 else RED
-                print(f"{profit_color}CRITERIA ACHIEVED{WHITE} selling " + \
-                    f"{symbol}.") if (not cron_flag) else None
-                print(f"{GREY}SELL PRICE{WHITE}: {sell_price}") if \
-                    (not cron_flag) else None
-                end_time = time.time()
-                print(f"End: {get_time(end_time-8*3600)} - {end_time}\n", \
-                      end='\r') if (not cron_flag) else None
-                print(f"{profit_color}PROFIT{WHITE}: {profit}%\n") if \
-                    (not cron_flag) else None
-                break
+                if (current_price < stop_price): # if below stop loss take losses
+                    if (not paper_flag):
+                        sell_trade(symbol, quantity=sell_quantity)
+                    sell_price = current_price_f(symbol)
+                    profit = get_profit(buy_price, sell_price, paper=paper_flag)
+                    profit_color = GREEN if profit > 0 else RED
+                    print(f"{profit_color}CRITERIA ACHIEVED{WHITE} selling " + \
+                        f"{symbol}.") if (not cron_flag) else None
+                    print(f"{GREY}SELL PRICE{WHITE}: {sell_price}") if \
+                        (not cron_flag) else None
+                    end_time = time.time()
+                    print(f"End: {get_time(end_time-8*3600)} - {end_time}\n", \
+                          end='\r') if (not cron_flag) else None
+                    print(f"{profit_color}PROFIT{WHITE}: {profit}%\n") if \
+                        (not cron_flag) else None
+                    break
             
-            #top value - 'stop_loss' percent of buy in price
-            stop_price = max_price - buy_price*stop_loss
-            time.sleep(30)
+                #top value - 'stop_loss' percent of buy in price
+                stop_price = max_price - buy_price*stop_loss
+                kline_version = wait_for_candle(
+                    symbol, TRADE_BAR, since=kline_version, timeout=30)
             
-        #incase loss of network during trade
-        except (requests.ConnectionError, requests.Timeout) as exception:
-            lost_connection_sleep(60, 1 if (len(sys.argv) > 1) else \
-                os.get_terminal_size().columns) #sleep for 60 seconds
+            #incase loss of network during trade
+            except (requests.ConnectionError, requests.Timeout) as exception:
+                lost_connection_sleep(60, 1 if (len(sys.argv) > 1) else \
+                    os.get_terminal_size().columns) #sleep for 60 seconds
         
+    finally:
+        # the streams and bar builder are shared, so they are released
+        # however the trade ends
+        unsubscribe_bars(multiplexer, symbol)
+        unsubscribe_prices(multiplexer, [symbol])
+
     lock_1_flag = False
     lock_2_flag = False
     while True:
@@ -186,6 +220,9 @@ def run_method_1(
         'current_trades': threading.Lock(),
         'profits_file': threading.Lock(),
     }
+    #aggTrade and bookTicker streams of the active trades, which feed their
+    # bar builders and the price cache
+    multiplexer = StreamMultiplexer()
     
     print(f"{GREY}STARTING PROGRAM{WHITE}\nBuy-in Gain: {buy_in_gain}%\n" + 
         f"Paper: {paper_flag}\n") if (not cron_flag) else None
@@ -209,9 +246,12 @@ def run_method_1(
                     top_coins.drop(coin)
             del current_trades_copy
             
+            #download the candles of every coin concurrently
+            coin_klines = download_many_to_csv(top_coins.index, interval, 5)
             for coin in top_coins.index:
-                init_coin(coin, interval) #if new coin, create file for data
-                klines = download_to_csv(coin, interval, 5) #download candles
+                if coin not in coin_klines: #download failed, retry next scan
+                    continue
+                klines = coin_klines[coin]
                 
                 last_klines = klines.tail(5) #only analyze last 5 candles
                 for index in range(1,5):
@@ -242,7 +282,8 @@ def run_method_1(
                                         coin,
                                         interval,
                                         paper_flag,
-                                        buy_in_gain/risk_reward_ratio]),
+                                        buy_in_gain/risk_reward_ratio,
+                                        multiplexer]),
                                 symbol=coin)
                             
                             break
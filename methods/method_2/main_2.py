@@ -15,12 +15,21 @@ import os
 import logging
 from multiprocessing import Pool
 from pprint import pprint, pformat
+from typing import Callable, Iterable
 
 from helper_functions.data_collection import *
 from helper_functions.market import *
 from helper_functions.trade import *
 from helper_functions.analysis import *
 from helper_functions.websocket_func import *
+from functions.data_collection.exchange_info import exchange_info_cache
+from functions.data_collection.kline_events import wait_for_candle
+from functions.data_collection.order_book import subscribe_order_book, unsubscribe_order_book
+from functions.data_collection.price_cache import subscribe_prices, unsubscribe_prices
+from functions.data_collection.stream_health import StreamWatchdog, stream_health
+from functions.data_collection.stream_recorder import StreamRecorder
+from functions.data_collection.subscription_manager import SubscriptionManager
+from functions.trade.user_data import UserDataStream
 from constants.parameters import *
 from methods.method_2.method_2_backtest import *
 from methods.method_2.method_2_classes import *
@@ -80,68 +89,120 @@ logger = logging.getLogger("main")
 
 # TODO: for log profits, send Trade (class/dataclass) with all attributes instead of 10 arguments alone
 
-# TODO: add check to see if there are any new coins in top gainers that can have new threads created for them
-
 # TODO: add stop loss check to see if it is outside one standard deviation of the last hour, if so, make that the stop loss
 
 # TODO: add dynamic stop loss that changes to maximum - stop loss percent and changes as price changes
 
 #----------------------------------functions-----------------------------------
 
-def main(symbols, trade_quote_qty: float=None):
+def main(symbols, trade_quote_qty: float=None, universe: Callable[[], Iterable[str]]=None, refresh_time: int=5*60):
     """
     Description:
-        Starts all the threads for the main function of method 2.
+        Starts all the threads for the main function of method 2. If universe 
+        is given the traded symbols follow it, new symbols (ie. new top 
+        gainers) get a thread and a stream on the running connections and 
+        symbols that left it are dropped once they have no active trade.
     Args:
         symbols (list): symbols to trade in main.
         trade_quote_qty (float, optional): amount of money (USD) to risk on each trade. Defaults to None.
+        universe (Callable[[], Iterable[str]], optional): returns the symbols 
+        that should be traded (ie. lambda: top_volume_gainers(limit=50).index). 
+        Defaults to None (trade symbols only).
+        refresh_time (int, optional): seconds between universe updates. Defaults to 5*60.
     """
     threading.current_thread.name = "MAIN-Thread"
-    threads_list = []
+    threads = {}
+    stop_events = {}
     
     # delete old live data
     delete_old_data()
     # dictionary of all locks
     method_lock = MethodLock(unlimited=(("unlimited" in sys.argv) and not ("real" in sys.argv)))
+    # all kline streams share a few combined stream connections
+    multiplexer = StreamMultiplexer()
+    multiplexer.start()
+    # restart streams whose socket stays open but stops delivering
+    watchdog = StreamWatchdog(multiplexer).start()
+    # load the symbol filters used to validate orders before the first trade
+    exchange_info_cache.start()
+    # balances and orders are kept in memory from the user data stream
+    if "real" in sys.argv:
+        UserDataStream(multiplexer).start()
+    # record every received frame so the session can be replayed
+    if "record" in sys.argv:
+        StreamRecorder(os.path.join("data", "recordings", f"{datetime.utcnow().strftime('%Y-%m-%d_%H%M%S')}.log.gz")).start()
+    
+    def tradeable(symbols):
+        tradeable_symbols = []
+        for symbol in symbols:
+            if not (symbol.endswith("USDT") or symbol.endswith("BNB")):
+                logger.debug(f"Skipping {symbol}.")
+                continue
+            tradeable_symbols.append(symbol)
+        return tradeable_symbols
+    
+    def start_thread(symbol):
+        # symbol came back before its thread stopped
+        if (symbol in threads) and threads[symbol].is_alive():
+            stop_events[symbol].clear()
+            return
+        stop_events[symbol] = threading.Event()
+        threads[symbol] = threading.Thread(target=live_method_2, args=[symbol, trade_quote_qty, method_lock, multiplexer, stop_events[symbol]], daemon=True)
+        threads[symbol].name = f"{symbol}-Thread"
+        threads[symbol].start()
+        logger.debug(f"Starting {threads[symbol].name}.")
+    
+    def stop_thread(symbol):
+        # the thread stops once it has no active trade, until then its stream is kept
+        stop_events[symbol].set()
+        if threads[symbol].is_alive():
+            return False
+        del threads[symbol], stop_events[symbol]
+        return True
+    
+    manager = SubscriptionManager(multiplexer, "5m", on_add=start_thread, on_remove=stop_thread)
     
-    symbols = list(symbols)
+    symbols = tradeable(symbols)
     if "real" in sys.argv:
         logger.critical("Starting REAL trading program.")
     elif "unlimited" in sys.argv:
         logger.critical("Starting UNLIMITED trading program.")
     logger.info(f"Number of Coins Listed: {len(symbols)}")
     
-    for symbol in symbols:
-        if not (symbol.endswith("USDT") or symbol.endswith("BNB")):
-            logger.debug(f"Skipping {symbol}.")
-            symbols.remove(symbol)
-            continue
-        threads_list += [threading.Thread(target=live_method_2, args=[symbol, trade_quote_qty, method_lock], daemon=True)]
-        threads_list[-1].name = f"{symbol}-Thread"
-        threads_list[-1].start()
-        logger.debug(f"Starting {threads_list[-1].name}.")
-        time.sleep(2)
+    manager.sync(symbols)
+    last_refresh = time.time()
     
     time.sleep(30)
-    thread_count = threading.active_count()
     while True:
-        current_count = threading.active_count()
         time_now = datetime.utcfromtimestamp(time.time()-7*3600).strftime('%H:%M')
-        if current_count != thread_count:
-            for t in threads_list:
-                if not t.is_alive():
-                    logger.warning(f"{t.name} is not responding. Active Thread Count: {threading.active_count()}")
-                    threads_list.remove(t)
-                    break
-        elif (":59" in time_now) or (":00" in time_now):
+        if universe and (time.time() - last_refresh >= refresh_time):
+            try:
+                manager.sync(tradeable(universe()))
+            except requests.exceptions.ConnectionError:
+                logger.warning(f"Could Not Update Universe.", exc_info=True)
+            last_refresh = time.time()
+        for symbol, t in list(threads.items()):
+            if (not t.is_alive()) and (not stop_events[symbol].is_set()):
+                logger.warning(f"{t.name} is not responding. Active Thread Count: {threading.active_count()}")
+                manager.remove(symbol)
+        if (":59" in time_now) or (":00" in time_now):
             logger.info(f"Hourly Update. Thread Count: {threading.active_count()}")
+            health = stream_health(multiplexer.streams())
+            if health:
+                oldest = max(health, key=lambda name: health[name]['age'] or 0)
+                worst = max(health, key=lambda name: health[name]['event_lag']['p99'])
+                logger.info(f"Stream Health. Oldest: {oldest} {round(health[oldest]['age'] or 0,1)}s - "
+                            f"Worst p99 Lag: {worst} {health[worst]['event_lag']['p99']}ms - "
+                            f"Restarts: {watchdog.restarts}")
                     
-        time.sleep(2*60)
+        time.sleep(min(2*60, refresh_time) if universe else 2*60)
 
 def live_method_2(
         symbol: str, 
         trade_quote_qty: float, 
-        method_lock: MethodLock):
+        method_lock: MethodLock,
+        multiplexer: StreamMultiplexer = None,
+        stop_event: threading.Event = None):
     """
     Description:
         Runs method 2 with live candles. To sell entire balance on each trade 
@@ -151,6 +212,10 @@ def live_method_2(
         symbol (str): coin to trade
         trade_quote_qty (float): amount of money to trade per trade
         locks (list): list of all threading locks
+        multiplexer (StreamMultiplexer, optional): multiplexer carrying the 
+        kline stream, if None the stream gets its own websocket thread
+        stop_event (threading.Event, optional): set to stop the thread once 
+        it has no active trade
         logger (logging.Logger): 
     Raises:
         e: any error during main event loop.
@@ -170,26 +235,33 @@ def live_method_2(
     # minimum profit % for trade
     min_profit = 0.6
     
-    # lock for accessing kline data files
-    data_lock_1h = threading.Lock()
+    # maximum estimated slippage % of the buy order
+    max_slippage = 0.25
+    
+    # lock held while the kline data is initialized
     data_lock_5m = threading.Lock()
     
-    # connect 1h and 5m websockets
-    data_thread_1h = connect_websocket(symbol, "1h", data_lock_1h, limit=high_w)
-    data_thread_5m = connect_websocket(symbol, "5m", data_lock_5m, limit=high_w)
+    # connect 5m websocket, 1h klines are built locally from the 5m stream
+    if multiplexer:
+        subscribe_klines(multiplexer, symbol, "5m", data_lock_5m, limit=high_w, resample_intervals=["1h"])
+    else:
+        data_thread_5m = connect_websocket(symbol, "5m", data_lock_5m, limit=high_w, resample_intervals=["1h"])
+    
+    # local order book for pre-trade slippage estimates
+    order_book = subscribe_order_book(multiplexer, symbol) if multiplexer else None
+    # stream the best bid/ask so buy prices come from memory
+    if multiplexer:
+        subscribe_prices(multiplexer, [symbol])
     
     # init payment symbol
     payment_symbol = get_payment_symbol(symbol)
     
-    time.sleep(5)
-    
-    while data_lock_1h.locked() or data_lock_5m.locked():
-        time.sleep(1)
-    
     # indicates whether trade is active in the current thread (locally)
     trade_active = False
     # indicates whether the program is just starting
     init_flag = True 
+    # last seen 5m candle event
+    kline_version = None
     
     # start backtest loop
     try:
@@ -201,13 +273,17 @@ def live_method_2(
             # ================================================================
             # ================================================================
         
-            # allow stream to reset after 24h
+            # symbol left the trading universe
+            if stop_event and stop_event.is_set() and (not trade_active):
+                logger.info(f"{symbol} left the trading universe. Stopping thread.")
+                return
+        
+            # allow stream to reset after 24h (multiplexed streams reconnect on their own)
             time_now = datetime.utcfromtimestamp(time.time()-7*3600).strftime('%H:%M')
-            if time_now == "11:30":
+            if (time_now == "11:30") and (not multiplexer):
                 # lock here to prevent all new websockets from being started at the same time
                 method_lock.profit_file.acquire()
-                data_thread_1h = connect_websocket(symbol, "1h", data_lock_1h, limit=high_w)
-                data_thread_5m = connect_websocket(symbol, "5m", data_lock_5m, limit=high_w)        
+                data_thread_5m = connect_websocket(symbol, "5m", data_lock_5m, limit=high_w, resample_intervals=["1h"])
                 time.sleep(10)
                 method_lock.profit_file.release()
             
@@ -216,13 +292,10 @@ def live_method_2(
             # profit split ratio
             profit_split_ratio = 0
             
-            # if data threads die, restart them
-            if not data_thread_1h.is_alive():
-                logger.info(f"Restarting {symbol}/1h Websocket.")
-                data_thread_1h = connect_websocket(symbol, "1h", data_lock_1h, limit=high_w)
-            if not data_thread_5m.is_alive():
+            # if data thread dies, restart it
+            if (not multiplexer) and (not data_thread_5m.is_alive()):
                 logger.info(f"Restarting {symbol}/5m Websocket.")
-                data_thread_5m = connect_websocket(symbol, "5m", data_lock_5m, limit=high_w)
+                data_thread_5m = connect_websocket(symbol, "5m", data_lock_5m, limit=high_w, resample_intervals=["1h"])
                   
             # restart loop if there is a trade currently running on different thread
             if method_lock.active_trade.locked() and (not trade_active):
@@ -230,7 +303,8 @@ def live_method_2(
                 continue
                   
             if (not init_flag):
-                time.sleep(2)
+                # wake up on the next 5m candle update instead of polling
+                kline_version = wait_for_candle(symbol, "5m", since=kline_version, timeout=60)
             else:
                 init_flag = False #continue to next line for first iteration
                 
@@ -244,7 +318,7 @@ def live_method_2(
             # (dont need 1h for active_trade)
             while True and (not trade_active):
                 try:
-                    long_klines = update_klines(symbol, "1h", data_lock_1h)
+                    long_klines = update_klines(symbol, "1h", data_lock_5m)
                 except requests.exceptions.ConnectionError:
                     logger.warning(f"Could Not Download 1h {symbol}.")
                     time.sleep(15)
@@ -320,6 +394,12 @@ def live_method_2(
                 if not (rough_percent_profit*100 > min_profit):
                     logger.debug(f"Recieved: {round(rough_percent_profit*100, 4)} is not greater than Required: {min_profit}. Stopped at Criteria 5.")
                     continue
+                # Criteria 7: order book must fill the buy within max slippage (skipped until the book is synced)
+                if trade_quote_qty and order_book and order_book.is_synced():
+                    slippage = order_book.estimated_slippage(trade_quote_qty)
+                    if (slippage is None) or (slippage*100 > max_slippage):
+                        logger.debug(f"Estimated Slippage: {slippage if slippage is None else round(slippage*100, 4)} is greater than Allowed: {max_slippage}. Stopped at Criteria 7.")
+                        continue
                 
                 # run percent_profit through shaper function
                 percent_profit = 0.5 / 100
@@ -333,6 +413,7 @@ def live_method_2(
                 
                 # if using real money for trade
                 if real_money:
+                    # read from memory, kept up to date by the user data stream
                     balance = account_balance(payment_symbol)
                     # 12 is smallest possible trade if not specified
                     min_balance = 12 if (not trade_quote_qty) else trade_quote_qty
@@ -409,7 +490,6 @@ def live_method_2(
                         # sell out of trade (stop loss)
                         sell_id = sell_trade(symbol=symbol, quantity=profit_quantity)[0]
                         logger.info(f"SELL ID: {sell_id}")
-                        time.sleep(10)
                         
                     method_lock.active_trade.release()
                     trade_active = False
@@ -466,7 +546,6 @@ def live_method_2(
                         # sell out of trade (take profit)
                         sell_id = sell_trade(symbol=symbol, quantity=profit_quantity)[0]
                         logger.info(f"SELL ID: {sell_id}")
-                        time.sleep(10)
 
                     method_lock.active_trade.release()
                     trade_active = False
@@ -515,4 +594,8 @@ def live_method_2(
         logger.error(f"Exception raised in thread. Thread Count: {threading.active_count()}", exc_info=True)
         if real_money:
             pync.notify(threading.current_thread().name, title="ERROR")
-        raise e
\ No newline at end of file
+        raise e
+    finally:
+        if multiplexer:
+            unsubscribe_order_book(multiplexer, symbol)
+            unsubscribe_prices(multiplexer, [symbol])
\ No newline at end of file
@@ -5,6 +5,7 @@ import logging
 import sys
 
 from helper_functions.websocket_func import *
+from classes.data import KlineInterval
 
 
 class MethodLock:
@@ -27,20 +28,27 @@ class FakeLock:
 class DataThread:
     """Local data thread for a single token."""
     symbol: str #symbol of token to trade
-    intervals: list #list of intervals of websocket streams to start
+    intervals: list #list of intervals of klines, only the smallest interval gets a websocket stream and the rest are resampled from it
     limit: int #amount of klines per kline stream
-    locks: dict=None #list of all locks for each interval websocket stream, keys are interval, values are thread locks
+    locks: dict=None #list of all locks for each interval, keys are interval, values are thread locks (all intervals share the base stream lock)
     streams: dict=None #list of all websocket stream threads for each interval websocket stream, keys are interval, values are websocket threads
     
+    @property
+    def base_interval(self):
+        """Interval of the websocket stream the other intervals are built from."""
+        return min(self.intervals, key=lambda interval: KlineInterval.from_string(interval).value)
+    
     def create_locks(self):
-        """Initiate all thread locks for websocket threads."""
+        """Initiate the thread lock of the base websocket stream."""
+        base_lock = threading.Lock()
         for interval in self.intervals:
-            self.locks[interval] = threading.Lock()
+            self.locks[interval] = base_lock
     
     def reset_websockets(self):
-        """Start all websocket threads."""
-        for interval in self.intervals:
-            self.streams[interval] = connect_websocket(self.symbol, interval, self.locks[interval], self.limit)
+        """Start the base websocket thread."""
+        base = self.base_interval
+        resample_intervals = [interval for interval in self.intervals if interval != base]
+        self.streams[base] = connect_websocket(self.symbol, base, self.locks[base], self.limit, resample_intervals=resample_intervals)
     
     def connect_websockets(self):
         """Initializes all locks and websocket threads to start program."""
@@ -49,18 +57,14 @@ class DataThread:
     
     def wait_for_start(self):
         """Waits until all websocket threads have begun."""
-        while True:
-            for lock in self.locks:
-                if not lock.locked():
-                    break
+        while self.locks[self.base_interval].locked():
             time.sleep(1)
             
     def check_stream_status(self):
-        """Checks websocket streams and restarts if died.""" #TODO during daily timer, thread could break resulting in double threads going at same time
-        for interval in self.intervals:
-            if not self.streams[interval].is_alive():
-                logger.info(f"Restarting {self.symbol}/{interval} Websocket.")
-                self.streams[interval] = connect_websocket(self.symbol, "1h", self.locks[interval], self.limit)
+        """Checks websocket stream and restarts if died.""" #TODO during daily timer, thread could break resulting in double threads going at same time
+        if not self.streams[self.base_interval].is_alive():
+            logger.info(f"Restarting {self.symbol}/{self.base_interval} Websocket.")
+            self.reset_websockets()
             
 @dataclass(frozen=True)
 class Parameters: # containing all the trade information for the whole program on all threads
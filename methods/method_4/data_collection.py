@@ -4,7 +4,8 @@
 from binance.client import Client
 import pandas as pd
 
-from functions.setup.setup import retrieve_keys
+from functions.setup.setup import binance_klines_to_arrays
+from functions.data_collection.data_collection import binance_client
 from classes.config import MethodType
 
 from dataclasses import dataclass
@@ -13,19 +14,22 @@ from typing import Callable
 
 def get_recent_klines(symbol: str, window: int=200):
 
-    bc = Client(*retrieve_keys())
+    bc = binance_client()
 
     data = bc.get_historical_klines(symbol, Client.KLINE_INTERVAL_1MINUTE, "200 minute ago UTC")
 
-    data_columns = ["Time", "Open", "High", "Low", "Close", "Volume", "CloseTime", "QuoteAssetVolume", "NumberOfTrades", "TakerBuyBaseVolume", "TakerBuyQuoteVolume", "NA"]
-    klines = pd.DataFrame(data, columns=data_columns)
-
-    klines = klines.drop("NA", axis=1)
-
-    irrelevant_columns = ["CloseTime", "QuoteAssetVolume", "TakerBuyBaseVolume", "TakerBuyQuoteVolume"]
-    klines = klines.drop(irrelevant_columns, axis=1)
-
-    klines = klines.astype(float)
+    arrays = binance_klines_to_arrays(data)
+    # open times stay in ms floats like the raw rows, the arrays hold seconds
+    klines = pd.DataFrame({
+        "Time": (arrays['t']*1000).astype(float),
+        "Open": arrays['o'],
+        "High": arrays['h'],
+        "Low": arrays['l'],
+        "Close": arrays['c'],
+        "Volume": arrays['v'],
+        "NumberOfTrades": arrays['n'],
+    })
+    return klines
 
 
 @dataclass
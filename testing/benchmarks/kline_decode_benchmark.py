@@ -0,0 +1,118 @@
+#!/usr/bin/python3
+#
+# kline_decode_benchmark.py: measures how many websocket kline messages one
+# core can decode and write into the kline buffer.
+#
+# Run from the repository root:
+#   $ python3 -m testing.benchmarks.kline_decode_benchmark
+#
+# Andrew Bishop
+# 2026/10/18
+#
+
+# modules imported
+import argparse
+import json
+import time
+from typing import Callable, List
+
+import pandas as pd
+
+from functions.data_collection import stream_multiplexer
+from functions.data_collection.kline_buffer import get_kline_buffer
+from functions.data_collection.stream_multiplexer import dispatch_message
+
+# importing registers the kline stream handler
+from functions.data_collection import websocket_func  # noqa: F401
+
+
+# ----------------------------------functions-----------------------------------
+
+def make_messages(count: int, symbols: int = 100) -> List[bytes]:
+    """
+    Description:
+        Returns combined stream kline messages spread over a few symbols, with
+        a new candle every 20 updates like a busy 1m stream.
+    """
+    messages = []
+    for index in range(count):
+        symbol = f"SYM{index % symbols}USDT"
+        t = 1_700_000_000_000 + (index // (20*symbols))*60_000
+        price = 100 + (index % 97)/100
+        messages.append(json.dumps({
+            "stream": f"{symbol.lower()}@kline_1m",
+            "data": {
+                "e": "kline", "E": t + 1234, "s": symbol,
+                "k": {
+                    "t": t, "T": t + 59_999, "s": symbol, "i": "1m",
+                    "f": 100, "L": 200, "o": f"{price:.8f}",
+                    "c": f"{price + 0.01:.8f}", "h": f"{price + 0.02:.8f}",
+                    "l": f"{price - 0.02:.8f}", "v": "1000.00000000",
+                    "n": 100, "x": (index % 20) == 19, "q": "1.0000",
+                    "V": "500.00000000", "Q": "0.500", "B": "123456"}}},
+            separators=(',', ':')).encode())
+    return messages
+
+
+def _format_kline(kline: dict) -> pd.DataFrame:
+    """
+    Description:
+        Decode step of the old websocket loop, one dataframe per message.
+    """
+    return pd.DataFrame(data={
+        't': [int(kline['t']/1000)],
+        'o': [float(kline['o'])],
+        'c': [float(kline['c'])],
+        'h': [float(kline['h'])],
+        'l': [float(kline['l'])],
+        'n': [float(kline['n'])],
+        'v': [float(kline['v'])],
+    }).set_index("t")
+
+
+def dataframe_decode(raw: bytes):
+    _format_kline(json.loads(raw)['data']['k'])
+
+
+def measure(name: str, decode: Callable[[bytes], object],
+            messages: List[bytes]) -> float:
+    """
+    Description:
+        Runs decode over every message and prints the messages decoded per
+        second of CPU time on one core.
+    """
+    start = time.process_time()
+    for raw in messages:
+        decode(raw)
+    rate = len(messages) / (time.process_time() - start)
+    print(f"{name:<32}{rate:>14,.0f} msgs/sec/core")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Websocket kline decode benchmark.")
+    parser.add_argument("--messages", type=int, default=200_000)
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages)
+    for index in range(100):
+        get_kline_buffer(f"SYM{index}USDT", "1m", capacity=500)
+
+    print(f"{len(messages):,} kline messages")
+    before = measure("before: json + DataFrame", dataframe_decode,
+                     messages[:max(len(messages)//20, 1)])
+
+    loads = stream_multiplexer.loads
+    stream_multiplexer.loads = json.loads
+    measure("after: json + kline buffer", dispatch_message, messages)
+    stream_multiplexer.loads = loads
+    if loads is not json.loads:
+        after = measure("after: orjson + kline buffer", dispatch_message, messages)
+    else:
+        after = measure("after: kline buffer", dispatch_message, messages)
+    print(f"speed up: {after/before:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
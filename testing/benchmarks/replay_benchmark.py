@@ -0,0 +1,43 @@
+#!/usr/bin/python3
+#
+# replay_benchmark.py: replays a recorded stream log through the live ingest
+# path and reports how fast it was handled, no network needed.
+#
+# Run from the repository root:
+#   $ python3 -m testing.benchmarks.replay_benchmark data/recordings/<log>.log.gz
+#
+# Andrew Bishop
+# 2026/10/18
+#
+
+# modules imported
+import argparse
+import time
+
+from functions.data_collection.stream_recorder import replay_stream_log
+
+# importing registers the kline stream handler
+from functions.data_collection import websocket_func  # noqa: F401
+
+
+# ----------------------------------functions-----------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replays a stream log through the live ingest path.")
+    parser.add_argument("path", help="stream log recorded by StreamRecorder")
+    parser.add_argument("--speed", type=float, default=None,
+                        help="replay speed (defaults to as fast as possible)")
+    args = parser.parse_args()
+
+    cpu_start = time.process_time()
+    stats = replay_stream_log(args.path, speed=args.speed)
+    cpu_seconds = time.process_time() - cpu_start
+    print(f"frames replayed: {stats['frames']:,} ({stats['handled']:,} handled)")
+    print(f"wall time: {stats['seconds']:.2f}s")
+    if cpu_seconds:
+        print(f"{stats['frames']/cpu_seconds:,.0f} frames/sec/core")
+
+
+if __name__ == "__main__":
+    main()
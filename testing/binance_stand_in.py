@@ -0,0 +1,988 @@
+#!/usr/bin/python3
+#
+# binance_stand_in.py: local stand-in for the Binance REST api and websocket
+# streams, used to load test the ingest and order paths without the exchange.
+#
+# Serves the endpoints the bot uses (klines, ticker/24hr, ticker/price,
+# ticker/bookTicker, exchangeInfo, depth, order, openOrders, account,
+# userDataStream, ping, time) and the kline, bookTicker, !bookTicker,
+# aggTrade, depth diff and user data (listenKey) streams on single (/ws/...)
+# and combined (/stream?streams=...) connections, for thousands of simulated
+# symbols.
+#
+# Run from the repository root:
+#   $ python3 -m testing.binance_stand_in --symbols 2000 --tick-rate 4
+# and point the bot at it:
+#   BINANCE_API_URL=http://127.0.0.1:8080
+#   BINANCE_STREAM_URL=ws://127.0.0.1:9443
+#
+# Andrew Bishop
+# 2026/10/18
+#
+
+# modules imported
+import argparse
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import math
+import os
+import socket
+import threading
+import time
+import zlib
+from collections import deque
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+import websockets
+
+
+# ----------------------------------constants-----------------------------------
+
+QUOTE_ASSET = "USDT"
+
+NAMED_SYMBOLS = ["BTCUSDT", "ETHUSDT", "BNBUSDT", "SOLUSDT", "XRPUSDT",
+                 "ADAUSDT", "DOGEUSDT", "LTCUSDT", "DOTUSDT", "LINKUSDT"]
+
+INTERVAL_SECONDS = {
+    "1m": 60, "3m": 3*60, "5m": 5*60, "15m": 15*60, "30m": 30*60,
+    "1h": 3600, "2h": 2*3600, "4h": 4*3600, "6h": 6*3600, "8h": 8*3600,
+    "12h": 12*3600, "1d": 86400, "3d": 3*86400, "1w": 7*86400}
+
+# request weight of every endpoint (with, without symbol)
+ENDPOINT_WEIGHTS = {
+    "/api/v3/ping": (1, 1),
+    "/api/v3/time": (1, 1),
+    "/api/v3/klines": (2, 2),
+    "/api/v3/ticker/24hr": (2, 80),
+    "/api/v3/ticker/price": (2, 4),
+    "/api/v3/ticker/bookTicker": (2, 4),
+    "/api/v3/exchangeInfo": (20, 20),
+    "/api/v3/depth": (5, 5),
+    "/api/v3/order": (4, 4),
+    "/api/v3/openOrders": (6, 80),
+    "/api/v3/account": (20, 20),
+    "/api/v3/userDataStream": (2, 2),
+}
+
+SIGNED_ENDPOINTS = {"/api/v3/order", "/api/v3/openOrders", "/api/v3/account"}
+
+# seconds a listenKey lives without a keepalive
+LISTEN_KEY_TTL = 60*60
+
+# account events kept for user data streams that fell behind
+ACCOUNT_EVENT_HISTORY = 10000
+
+# order book update ids per second and price levels per side
+DEPTH_UPDATES_PER_SECOND = 10
+DEPTH_LEVELS = 100
+
+
+# -----------------------------------classes------------------------------------
+
+class StandInError(Exception):
+    """
+    Description:
+        Error answered with the Binance error body {"code": .., "msg": ..}.
+    """
+
+    def __init__(self, status: int, code: int, msg: str, headers: Dict[str, str] = None):
+        super().__init__(msg)
+        self.status = status
+        self.code = code
+        self.msg = msg
+        self.headers = headers or {}
+
+
+class StandInMarket:
+    """
+    Description:
+        Deterministic simulated market. Every price is a function of symbol
+        and time, so klines of any range are generated on request and
+        thousands of symbols cost no memory.
+    Args:
+        symbol_count (int): amount of simulated symbols
+    """
+
+    def __init__(self, symbol_count: int):
+        generated = (f"C{index:04d}{QUOTE_ASSET}" for index in itertools.count())
+        self.symbols = (NAMED_SYMBOLS + [
+            symbol for symbol in itertools.islice(generated, symbol_count)])[:symbol_count]
+        self._params = {symbol: self._symbol_params(symbol) for symbol in self.symbols}
+
+    @staticmethod
+    def _hash(text: str) -> float:
+        """
+        Description:
+            Returns a deterministic number in [0, 1) for the text.
+        """
+        return zlib.crc32(text.encode()) / 2**32
+
+    def _symbol_params(self, symbol: str) -> Tuple[float, float, float, float, float]:
+        base_price = 10 ** (self._hash(symbol + "price")*7 - 3)
+        return (base_price,
+                self._hash(symbol + "p1")*2*math.pi,
+                self._hash(symbol + "p2")*2*math.pi,
+                self._hash(symbol + "p3")*2*math.pi,
+                10 ** (self._hash(symbol + "volume")*4 + 2) / base_price**0.5)
+
+    def check_symbol(self, symbol: str):
+        if symbol not in self._params:
+            raise StandInError(400, -1121, "Invalid symbol.")
+
+    def price(self, symbol: str, t: float) -> float:
+        """
+        Description:
+            Returns the price of the symbol at unix time t (seconds).
+        """
+        base_price, p1, p2, p3, _ = self._params[symbol]
+        noise = self._hash(f"{symbol}{int(t*4)}")*2 - 1
+        return base_price * (1
+                             + 0.03*math.sin(2*math.pi*t/(86400/7) + p1)
+                             + 0.01*math.sin(2*math.pi*t/3600 + p2)
+                             + 0.002*math.sin(2*math.pi*t/61 + p3)
+                             + 0.0005*noise)
+
+    def tick_size(self, symbol: str) -> float:
+        return 10 ** (math.floor(math.log10(self._params[symbol][0])) - 4)
+
+    def step_size(self, symbol: str) -> float:
+        return 10 ** max(-8, min(0, math.floor(math.log10(1/self._params[symbol][0]))))
+
+    def kline(self, symbol: str, interval: str, open_ms: int, now: float) -> list:
+        """
+        Description:
+            Returns one kline in the REST format (open time in ms first).
+        """
+        seconds = INTERVAL_SECONDS[interval]
+        start = open_ms / 1000
+        end = min(start + seconds, now)
+        samples = [self.price(symbol, start + (end - start)*index/7)
+                   for index in range(8)]
+        volume_rate = self._params[symbol][4]
+        volume = volume_rate * (end - start) / 60 * (0.5 + self._hash(f"{symbol}{open_ms}v"))
+        trades = int(volume_rate**0.5 * (end - start) / 60) + 1
+        quote_volume = volume * samples[-1]
+        return [
+            open_ms,
+            f"{samples[0]:.8f}",
+            f"{max(samples):.8f}",
+            f"{min(samples):.8f}",
+            f"{samples[-1]:.8f}",
+            f"{volume:.8f}",
+            open_ms + seconds*1000 - 1,
+            f"{quote_volume:.8f}",
+            trades,
+            f"{volume/2:.8f}",
+            f"{quote_volume/2:.8f}",
+            "0"]
+
+    def klines(self, symbol: str, interval: str, limit: int = 500,
+               start_ms: int = None, end_ms: int = None) -> List[list]:
+        """
+        Description:
+            Returns klines like /api/v3/klines: open time >= start_ms and
+            <= end_ms, at most limit klines, never past the open kline.
+        """
+        if interval not in INTERVAL_SECONDS:
+            raise StandInError(400, -1120, "Invalid interval.")
+        now = time.time()
+        step = INTERVAL_SECONDS[interval]*1000
+        now_ms = int(now*1000)
+        last = now_ms - now_ms % step
+        if end_ms is not None:
+            last = min(last, end_ms - end_ms % step)
+        if start_ms is not None:
+            first = -(-start_ms // step) * step
+            last = min(last, first + (limit-1)*step)
+        else:
+            first = last - (limit-1)*step
+        return [self.kline(symbol, interval, open_ms, now)
+                for open_ms in range(first, last+1, step)]
+
+    def ticker_24hr(self, symbol: str) -> dict:
+        now = time.time()
+        samples = [self.price(symbol, now - 86400 + 3600*index) for index in range(25)]
+        samples[-1] = self.price(symbol, now)
+        open_price, last_price = samples[0], samples[-1]
+        volume = self._params[symbol][4] * 24 * 60
+        return {
+            "symbol": symbol,
+            "priceChange": f"{last_price - open_price:.8f}",
+            "priceChangePercent": f"{(last_price/open_price - 1)*100:.3f}",
+            "weightedAvgPrice": f"{sum(samples)/len(samples):.8f}",
+            "prevClosePrice": f"{open_price:.8f}",
+            "lastPrice": f"{last_price:.8f}",
+            "lastQty": "1.00000000",
+            "bidPrice": f"{last_price*0.9999:.8f}",
+            "bidQty": "10.00000000",
+            "askPrice": f"{last_price*1.0001:.8f}",
+            "askQty": "10.00000000",
+            "openPrice": f"{open_price:.8f}",
+            "highPrice": f"{max(samples):.8f}",
+            "lowPrice": f"{min(samples):.8f}",
+            "volume": f"{volume:.8f}",
+            "quoteVolume": f"{volume*last_price:.8f}",
+            "openTime": int((now - 86400)*1000),
+            "closeTime": int(now*1000),
+            "firstId": 0,
+            "lastId": int(volume),
+            "count": int(volume)}
+
+    def book_ticker(self, symbol: str) -> dict:
+        price = self.price(symbol, time.time())
+        return {
+            "symbol": symbol,
+            "bidPrice": f"{price*0.9999:.8f}", "bidQty": "10.00000000",
+            "askPrice": f"{price*1.0001:.8f}", "askQty": "10.00000000"}
+
+    def _depth_grid(self, symbol: str, book_id: int) -> Tuple[float, int]:
+        """
+        Description:
+            Returns the level spacing and the level index of the mid price of
+            the book at update id book_id.
+        """
+        spacing = self.tick_size(symbol)*10
+        return spacing, round(self.price(symbol, book_id/DEPTH_UPDATES_PER_SECOND)/spacing)
+
+    def _depth_level(self, symbol: str, index: int, book_id: int, spacing: float) -> list:
+        quantity = self._params[symbol][4]/20 * (0.5 + self._hash(
+            f"{symbol}{index}{book_id // DEPTH_UPDATES_PER_SECOND}"))
+        return [f"{index*spacing:.8f}", f"{quantity:.8f}"]
+
+    def depth(self, symbol: str, limit: int = 100, book_id: int = None) -> dict:
+        """
+        Description:
+            Returns the order book like /api/v3/depth. The book only changes
+            with its update id, which counts DEPTH_UPDATES_PER_SECOND, so
+            snapshots and diff streams always agree.
+        """
+        book_id = int(time.time()*DEPTH_UPDATES_PER_SECOND) if (book_id is None) else book_id
+        spacing, mid = self._depth_grid(symbol, book_id)
+        levels = range(1, min(limit, DEPTH_LEVELS) + 1)
+        return {
+            "lastUpdateId": book_id,
+            "bids": [self._depth_level(symbol, mid - index, book_id, spacing) for index in levels],
+            "asks": [self._depth_level(symbol, mid + index, book_id, spacing) for index in levels]}
+
+    def depth_diff(self, symbol: str, first_id: int, last_id: int) -> Tuple[list, list]:
+        """
+        Description:
+            Returns the bid and ask levels that changed between update ids
+            first_id and last_id, with the levels that were emptied set to 0.
+        """
+        spacing, mid = self._depth_grid(symbol, last_id)
+        mids = [self._depth_grid(symbol, book_id)[1]
+                for book_id in range(first_id, last_id + 1)]
+        low, high = min(mids) - DEPTH_LEVELS, max(mids) + DEPTH_LEVELS
+        bids, asks = [], []
+        for index in range(low, high + 1):
+            level = self._depth_level(symbol, index, last_id, spacing)
+            if index < mid - DEPTH_LEVELS or index >= mid:
+                bids.append([level[0], "0.00000000"])
+            else:
+                bids.append(level)
+            if index > mid + DEPTH_LEVELS or index <= mid:
+                asks.append([level[0], "0.00000000"])
+            else:
+                asks.append(level)
+        return bids, asks
+
+    def symbol_info(self, symbol: str) -> dict:
+        return {
+            "symbol": symbol,
+            "status": "TRADING",
+            "baseAsset": symbol[:-len(QUOTE_ASSET)],
+            "baseAssetPrecision": 8,
+            "quoteAsset": QUOTE_ASSET,
+            "quotePrecision": 8,
+            "quoteAssetPrecision": 8,
+            "orderTypes": ["MARKET"],
+            "isSpotTradingAllowed": True,
+            "filters": [
+                {"filterType": "PRICE_FILTER",
+                 "minPrice": f"{self.tick_size(symbol):.8f}",
+                 "maxPrice": "1000000.00000000",
+                 "tickSize": f"{self.tick_size(symbol):.8f}"},
+                {"filterType": "LOT_SIZE",
+                 "minQty": f"{self.step_size(symbol):.8f}",
+                 "maxQty": "90000000.00000000",
+                 "stepSize": f"{self.step_size(symbol):.8f}"},
+                {"filterType": "MIN_NOTIONAL",
+                 "minNotional": "10.00000000",
+                 "applyToMarket": True,
+                 "avgPriceMins": 5},
+                {"filterType": "NOTIONAL",
+                 "minNotional": "10.00000000",
+                 "applyMinToMarket": True,
+                 "maxNotional": "9000000.00000000",
+                 "applyMaxToMarket": False,
+                 "avgPriceMins": 5}]}
+
+
+class WeightLimiter:
+    """
+    Description:
+        Fixed one minute request weight window like the exchange, answering
+        429 once the limit is hit and 418 (banned) to clients that keep
+        sending requests after it.
+    Args:
+        weight_limit (int): request weight allowed per minute
+        order_limit (int): orders allowed per 10 seconds
+        ban_after (int): 429 responses in a window before banning
+        ban_seconds (int): seconds a ban lasts
+    """
+
+    def __init__(self, weight_limit: int, order_limit: int,
+                 ban_after: int = 5, ban_seconds: int = 120):
+        self.weight_limit = weight_limit
+        self.order_limit = order_limit
+        self.ban_after = ban_after
+        self.ban_seconds = ban_seconds
+        self._lock = threading.Lock()
+        self._minute = self._weight = self._rejected = 0
+        self._order_window = self._orders = self._orders_day = 0
+        self._banned_until = 0
+
+    def acquire(self, weight: int, order: bool) -> Dict[str, str]:
+        """
+        Description:
+            Records a request and returns its usage headers.
+        Raises:
+            StandInError: 429 or 418 if the request is over the limits
+        """
+        now = time.time()
+        with self._lock:
+            if now < self._banned_until:
+                retry = int(self._banned_until - now) + 1
+                raise StandInError(418, -1003, "Way too many requests; IP banned.",
+                                   {"Retry-After": str(retry)})
+            minute = int(now // 60)
+            if minute != self._minute:
+                self._minute, self._weight, self._rejected = minute, 0, 0
+            window = int(now // 10)
+            if window != self._order_window:
+                self._order_window, self._orders = window, 0
+            headers = {}
+            if self._weight + weight > self.weight_limit:
+                self._rejected += 1
+                if self._rejected > self.ban_after:
+                    self._banned_until = now + self.ban_seconds
+                retry = 60 - int(now % 60)
+                raise StandInError(
+                    429, -1003, "Too much request weight used; please use WebSocket Streams for live updates.",
+                    {"Retry-After": str(retry), "X-MBX-USED-WEIGHT-1M": str(self._weight)})
+            if order:
+                if self._orders + 1 > self.order_limit:
+                    retry = 10 - int(now % 10)
+                    raise StandInError(
+                        429, -1015, "Too many new orders.",
+                        {"Retry-After": str(retry), "X-MBX-ORDER-COUNT-10S": str(self._orders)})
+                self._orders += 1
+                self._orders_day += 1
+                headers["X-MBX-ORDER-COUNT-10S"] = str(self._orders)
+                headers["X-MBX-ORDER-COUNT-1D"] = str(self._orders_day)
+            self._weight += weight
+            headers["X-MBX-USED-WEIGHT-1M"] = str(self._weight)
+            return headers
+
+
+class StandInAccount:
+    """
+    Description:
+        Paper account of the stand-in, market orders fill immediately at the
+        simulated price.
+    Args:
+        market (StandInMarket): simulated market
+        quote_balance (float): starting balance of the quote asset
+    """
+
+    def __init__(self, market: StandInMarket, quote_balance: float):
+        self.market = market
+        self.balances: Dict[str, float] = {QUOTE_ASSET: quote_balance}
+        self.orders: Dict[int, dict] = {}
+        self.events = deque(maxlen=ACCOUNT_EVENT_HISTORY)  # user data events
+        self.event_count = 0  # events recorded since the start
+        self.update_time = int(time.time()*1000)
+        self._ids = itertools.count(1)
+        self._trade_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _record_events(self, order: dict, changed_assets: List[str]):
+        """
+        Description:
+            Records the executionReport events of a filled market order and
+            the outboundAccountPosition of the balances it changed.
+        """
+        now_ms = order["transactTime"]
+        fill = order["fills"][0]
+        report = {
+            "e": "executionReport", "E": now_ms, "s": order["symbol"],
+            "c": order["clientOrderId"], "S": order["side"], "o": "MARKET",
+            "f": "GTC", "q": order["origQty"], "p": "0.00000000",
+            "P": "0.00000000", "F": "0.00000000", "g": -1, "C": "",
+            "x": "NEW", "X": "NEW", "r": "NONE", "i": order["orderId"],
+            "l": "0.00000000", "z": "0.00000000", "L": "0.00000000",
+            "n": "0", "N": None, "T": now_ms, "t": -1, "I": order["orderId"]*2,
+            "w": True, "m": False, "M": False, "O": now_ms,
+            "Z": "0.00000000", "Y": "0.00000000", "Q": "0.00000000"}
+        trade = dict(report, **{
+            "x": "TRADE", "X": "FILLED", "l": fill["qty"], "z": order["executedQty"],
+            "L": fill["price"], "n": fill["commission"], "N": fill["commissionAsset"],
+            "t": fill["tradeId"], "I": order["orderId"]*2 + 1, "w": False,
+            "Z": order["cummulativeQuoteQty"], "Y": order["cummulativeQuoteQty"]})
+        position = {
+            "e": "outboundAccountPosition", "E": now_ms, "u": now_ms,
+            "B": [{"a": asset, "f": f"{self.balances.get(asset, 0):.8f}", "l": "0.00000000"}
+                  for asset in changed_assets]}
+        self.events.extend([report, trade, position])
+        self.event_count += 3
+        self.update_time = now_ms
+
+    def events_since(self, count: int) -> Tuple[List[dict], int]:
+        """
+        Description:
+            Returns the user data events recorded after the first count events
+            and the new count.
+        """
+        with self._lock:
+            missed = self.event_count - count
+            events = list(self.events)[-missed:] if missed > 0 else []
+            return events, self.event_count
+
+    @staticmethod
+    def _round_down(value: float, step: float) -> float:
+        return math.floor(value/step + 1e-9) * step
+
+    def place_order(self, params: Dict[str, str]) -> dict:
+        symbol = params.get("symbol", "")
+        self.market.check_symbol(symbol)
+        side = params.get("side")
+        if side not in ("BUY", "SELL"):
+            raise StandInError(400, -1102, "Mandatory parameter 'side' was not sent, was empty/null, or malformed.")
+        if params.get("type") != "MARKET":
+            raise StandInError(400, -1116, "Invalid orderType.")
+
+        price = self.market.price(symbol, time.time())
+        step = self.market.step_size(symbol)
+        if "quantity" in params:
+            quantity = self._round_down(float(params["quantity"]), step)
+        elif "quoteOrderQty" in params:
+            quantity = self._round_down(float(params["quoteOrderQty"]) / price, step)
+        else:
+            raise StandInError(400, -1102, "Mandatory parameter 'quantity' was not sent, was empty/null, or malformed.")
+        quote_quantity = quantity * price
+        if quote_quantity < 10:
+            raise StandInError(400, -1013, "Filter failure: NOTIONAL")
+
+        base_asset = symbol[:-len(QUOTE_ASSET)]
+        commission = quantity * 0.001 if side == "BUY" else quote_quantity * 0.001
+        commission_asset = base_asset if side == "BUY" else QUOTE_ASSET
+        with self._lock:
+            spend_asset, spend = (QUOTE_ASSET, quote_quantity) if side == "BUY" else (base_asset, quantity)
+            if self.balances.get(spend_asset, 0) + 1e-12 < spend:
+                raise StandInError(400, -2010, "Account has insufficient balance for requested action.")
+            self.balances[spend_asset] -= spend
+            if side == "BUY":
+                self.balances[base_asset] = self.balances.get(base_asset, 0) + quantity - commission
+            else:
+                self.balances[QUOTE_ASSET] += quote_quantity - commission
+            order_id = next(self._ids)
+            now_ms = int(time.time()*1000)
+            order = {
+                "symbol": symbol,
+                "orderId": order_id,
+                "orderListId": -1,
+                "clientOrderId": params.get("newClientOrderId", f"standin{order_id}"),
+                "transactTime": now_ms,
+                "price": "0.00000000",
+                "origQty": f"{quantity:.8f}",
+                "executedQty": f"{quantity:.8f}",
+                "cummulativeQuoteQty": f"{quote_quantity:.8f}",
+                "status": "FILLED",
+                "timeInForce": "GTC",
+                "type": "MARKET",
+                "side": side,
+                "fills": [{
+                    "price": f"{price:.8f}",
+                    "qty": f"{quantity:.8f}",
+                    "commission": f"{commission:.8f}",
+                    "commissionAsset": commission_asset,
+                    "tradeId": next(self._trade_ids)}]}
+            self.orders[order_id] = order
+            self._record_events(order, sorted({base_asset, QUOTE_ASSET}))
+
+        response_type = params.get("newOrderRespType", "FULL")
+        if response_type == "ACK":
+            return {key: order[key] for key in
+                    ("symbol", "orderId", "orderListId", "clientOrderId", "transactTime")}
+        if response_type == "RESULT":
+            return {key: value for key, value in order.items() if key != "fills"}
+        return order
+
+    def get_order(self, params: Dict[str, str]) -> dict:
+        self.market.check_symbol(params.get("symbol", ""))
+        order = self.orders.get(int(params.get("orderId", 0)))
+        if order is None or order["symbol"] != params["symbol"]:
+            raise StandInError(400, -2013, "Order does not exist.")
+        result = {key: value for key, value in order.items()
+                  if key not in ("fills", "transactTime")}
+        result.update({"time": order["transactTime"],
+                       "updateTime": order["transactTime"],
+                       "isWorking": True,
+                       "origQuoteOrderQty": "0.00000000"})
+        return result
+
+    def open_orders(self, params: Dict[str, str]) -> List[dict]:
+        # market orders fill when they are placed, so none are ever open
+        if "symbol" in params:
+            self.market.check_symbol(params["symbol"])
+        return []
+
+    def account(self) -> dict:
+        with self._lock:
+            balances = [{"asset": asset, "free": f"{free:.8f}", "locked": "0.00000000"}
+                        for asset, free in sorted(self.balances.items())]
+            update_time = self.update_time
+        return {
+            "makerCommission": 10, "takerCommission": 10,
+            "buyerCommission": 0, "sellerCommission": 0,
+            "canTrade": True, "canWithdraw": True, "canDeposit": True,
+            "updateTime": update_time,
+            "accountType": "SPOT",
+            "balances": balances,
+            "permissions": ["SPOT"]}
+
+
+@dataclass
+class StandInConfig:
+    """
+    Description:
+        Options of the stand-in server.
+    """
+    host: str = "127.0.0.1"
+    port: int = 8080
+    stream_port: int = 9443
+    symbols: int = 1000
+    tick_rate: float = 1.0  # stream updates per second per stream
+    latency_ms: float = 0.0  # added to every REST response
+    stream_latency_ms: float = 0.0  # added to every stream update
+    weight_limit: int = 6000
+    order_limit: int = 50
+    quote_balance: float = 100000.0
+    api_secret: str = None  # verify request signatures if set
+    drop_after: float = 0.0  # close stream connections after seconds (0 = never)
+
+
+class StandInServer:
+    """
+    Description:
+        Runs the REST server and the stream server on background threads.
+    Args:
+        config (StandInConfig): server options
+    """
+
+    def __init__(self, config: StandInConfig):
+        self.config = config
+        self.market = StandInMarket(config.symbols)
+        self.account = StandInAccount(self.market, config.quote_balance)
+        self.limiter = WeightLimiter(config.weight_limit, config.order_limit)
+        self.listen_keys: Dict[str, float] = {}  # listenKey to its expiry time
+        self.http_server = None
+        self.loop = None
+        self._threads = []
+
+    @property
+    def api_url(self) -> str:
+        return f"http://{self.config.host}:{self.http_server.server_address[1]}"
+
+    @property
+    def stream_url(self) -> str:
+        return f"ws://{self.config.host}:{self.config.stream_port}"
+
+    # ----------------------------------------------------------
+    #                        REST api
+    # ----------------------------------------------------------
+
+    def _verify_signature(self, query: str, body: str):
+        params = dict(parse_qsl(query + ("&" if query and body else "") + body))
+        if ("signature" not in params) or ("timestamp" not in params):
+            raise StandInError(400, -1102, "Mandatory parameter 'signature' was not sent, was empty/null, or malformed.")
+        if self.config.api_secret:
+            total = (query + body).replace(f"&signature={params['signature']}", "") \
+                .replace(f"signature={params['signature']}", "")
+            expected = hmac.new(self.config.api_secret.encode(), total.encode(),
+                                hashlib.sha256).hexdigest()
+            if not hmac.compare_digest(expected, params["signature"]):
+                raise StandInError(400, -1022, "Signature for this request is not valid.")
+
+    def handle_request(self, method: str, path: str, query: str, body: str) -> Tuple[int, object, Dict[str, str]]:
+        """
+        Description:
+            Answers one REST request.
+        Returns:
+            Tuple[int, object, Dict[str, str]]: status, json body and headers
+        """
+        params = dict(parse_qsl(query))
+        params.update(parse_qsl(body))
+        if path not in ENDPOINT_WEIGHTS:
+            raise StandInError(404, -1000, f"Unknown endpoint {path}.")
+        with_symbol, without_symbol = ENDPOINT_WEIGHTS[path]
+        weight = with_symbol if ("symbol" in params) else without_symbol
+        if path == "/api/v3/order" and method == "POST":
+            weight = 1
+        if path == "/api/v3/depth":
+            limit = int(params.get("limit", 100))
+            weight = 5 if limit <= 100 else (25 if limit <= 500 else (50 if limit <= 1000 else 250))
+        headers = self.limiter.acquire(weight, order=(path == "/api/v3/order" and method == "POST"))
+        if path in SIGNED_ENDPOINTS:
+            self._verify_signature(query, body)
+
+        market = self.market
+        if path == "/api/v3/ping":
+            return 200, {}, headers
+        if path == "/api/v3/time":
+            return 200, {"serverTime": int(time.time()*1000)}, headers
+        if path == "/api/v3/klines":
+            market.check_symbol(params.get("symbol", ""))
+            limit = min(int(params.get("limit", 500)), 1000)
+            start = int(params["startTime"]) if "startTime" in params else None
+            end = int(params["endTime"]) if "endTime" in params else None
+            return 200, market.klines(params["symbol"], params.get("interval"), limit, start, end), headers
+        if path == "/api/v3/depth":
+            market.check_symbol(params.get("symbol", ""))
+            return 200, market.depth(params["symbol"], min(int(params.get("limit", 100)), 5000)), headers
+        if path in ("/api/v3/ticker/24hr", "/api/v3/ticker/price", "/api/v3/ticker/bookTicker"):
+            if path == "/api/v3/ticker/24hr":
+                ticker = market.ticker_24hr
+            elif path == "/api/v3/ticker/bookTicker":
+                ticker = market.book_ticker
+            else:
+                ticker = lambda symbol: {
+                    "symbol": symbol, "price": f"{market.price(symbol, time.time()):.8f}"}
+            if "symbol" in params:
+                market.check_symbol(params["symbol"])
+                return 200, ticker(params["symbol"]), headers
+            symbols = json.loads(params["symbols"]) if "symbols" in params else market.symbols
+            for symbol in symbols:
+                market.check_symbol(symbol)
+            return 200, [ticker(symbol) for symbol in symbols], headers
+        if path == "/api/v3/exchangeInfo":
+            symbols = [params["symbol"]] if "symbol" in params else \
+                (json.loads(params["symbols"]) if "symbols" in params else market.symbols)
+            for symbol in symbols:
+                market.check_symbol(symbol)
+            return 200, {
+                "timezone": "UTC",
+                "serverTime": int(time.time()*1000),
+                "rateLimits": [
+                    {"rateLimitType": "REQUEST_WEIGHT", "interval": "MINUTE",
+                     "intervalNum": 1, "limit": self.config.weight_limit},
+                    {"rateLimitType": "ORDERS", "interval": "SECOND",
+                     "intervalNum": 10, "limit": self.config.order_limit}],
+                "exchangeFilters": [],
+                "symbols": [market.symbol_info(symbol) for symbol in symbols]}, headers
+        if path == "/api/v3/order":
+            if method == "POST":
+                return 200, self.account.place_order(params), headers
+            return 200, self.account.get_order(params), headers
+        if path == "/api/v3/openOrders":
+            return 200, self.account.open_orders(params), headers
+        if path == "/api/v3/userDataStream":
+            return 200, self.listen_key_request(method, params), headers
+        return 200, self.account.account(), headers
+
+    def listen_key_request(self, method: str, params: Dict[str, str]) -> dict:
+        """
+        Description:
+            Creates (POST), keeps alive (PUT) or closes (DELETE) a listenKey.
+        """
+        now = time.time()
+        if method == "POST":
+            # the exchange hands out the live key again while it is alive
+            live = [key for key, expiry in self.listen_keys.items() if expiry > now]
+            listen_key = live[0] if live else os.urandom(32).hex()
+            self.listen_keys[listen_key] = now + LISTEN_KEY_TTL
+            return {"listenKey": listen_key}
+        listen_key = params.get("listenKey", "")
+        if self.listen_keys.get(listen_key, 0) <= now:
+            raise StandInError(400, -1125, "This listenKey does not exist.")
+        if method == "PUT":
+            self.listen_keys[listen_key] = now + LISTEN_KEY_TTL
+        else:
+            self.listen_keys.pop(listen_key)
+        return {}
+
+    def _handler_class(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body are written separately, without this keep-alive
+            # responses wait on delayed acks
+            disable_nagle_algorithm = True
+
+            def _respond(self, method: str):
+                url = urlsplit(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length).decode() if length else ""
+                if server.config.latency_ms:
+                    time.sleep(server.config.latency_ms/1000)
+                try:
+                    status, content, headers = server.handle_request(method, url.path, url.query, body)
+                except StandInError as e:
+                    status, content, headers = e.status, {"code": e.code, "msg": e.msg}, e.headers
+                except (KeyError, ValueError) as e:
+                    status, content, headers = 400, {"code": -1100, "msg": f"Illegal characters found in parameter; {e}"}, {}
+                payload = json.dumps(content).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json;charset=UTF-8")
+                self.send_header("Content-Length", str(len(payload)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._respond("GET")
+
+            def do_POST(self):
+                self._respond("POST")
+
+            def do_PUT(self):
+                self._respond("PUT")
+
+            def do_DELETE(self):
+                self._respond("DELETE")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    # ----------------------------------------------------------
+    #                        Streams
+    # ----------------------------------------------------------
+
+    def stream_event(self, stream_name: str, now: float, state: dict) -> List[dict]:
+        """
+        Description:
+            Returns the events of one stream for one tick. A kline stream sends
+            the final update of the previous kline when a new one opens.
+        """
+        if stream_name == "!bookTicker":
+            return [event for symbol in self.market.symbols
+                    for event in self.stream_event(f"{symbol.lower()}@bookTicker", now, state)]
+        if stream_name in self.listen_keys:
+            return self._user_data_events(stream_name, now, state)
+        symbol, kind = stream_name.split("@", 1)
+        symbol = symbol.upper()
+        self.market.check_symbol(symbol)
+        event_ms = int(now*1000)
+        price = self.market.price(symbol, now)
+        if kind.startswith("kline_"):
+            interval = kind[len("kline_"):]
+            step = INTERVAL_SECONDS[interval]*1000
+            open_ms = event_ms - event_ms % step
+            events = []
+            previous = state.get(stream_name)
+            if (previous is not None) and (previous < open_ms):
+                events.append(self._kline_event(symbol, interval, previous, now, True))
+            state[stream_name] = open_ms
+            events.append(self._kline_event(symbol, interval, open_ms, now, False))
+            return events
+        if kind == "bookTicker":
+            state[stream_name] = state.get(stream_name, 0) + 1
+            return [{"u": state[stream_name], "s": symbol,
+                     "b": f"{price*0.9999:.8f}", "B": "10.00000000",
+                     "a": f"{price*1.0001:.8f}", "A": "10.00000000"}]
+        if kind == "aggTrade":
+            trade_id = state[stream_name] = state.get(stream_name, 0) + 1
+            return [{"e": "aggTrade", "E": event_ms, "s": symbol, "a": trade_id,
+                     "p": f"{price:.8f}", "q": f"{self.market.step_size(symbol)*10:.8f}",
+                     "f": trade_id, "l": trade_id, "T": event_ms,
+                     "m": bool(trade_id % 2), "M": True}]
+        if kind in ("depth", "depth@100ms", "depth@1000ms"):
+            book_id = int(now*DEPTH_UPDATES_PER_SECOND)
+            first_id = state.get(stream_name, book_id - 1) + 1
+            if first_id > book_id:
+                return []
+            state[stream_name] = book_id
+            # a new stream starts with the current book
+            bids, asks = self.market.depth_diff(symbol, max(first_id, book_id - 10*DEPTH_UPDATES_PER_SECOND), book_id)
+            return [{"e": "depthUpdate", "E": event_ms, "s": symbol,
+                     "U": first_id, "u": book_id, "b": bids, "a": asks}]
+        raise StandInError(400, 2, f"Invalid request: unknown stream {stream_name}")
+
+    def _user_data_events(self, listen_key: str, now: float, state: dict) -> List[dict]:
+        """
+        Description:
+            Returns the account events since the last tick of a user data
+            stream, ending the stream once its listenKey expired.
+        """
+        if state.get(listen_key) == "expired":
+            return []
+        if self.listen_keys[listen_key] <= now:
+            state[listen_key] = "expired"
+            return [{"e": "listenKeyExpired", "E": int(now*1000), "listenKey": listen_key}]
+        events, state[listen_key] = self.account.events_since(
+            state.get(listen_key, self.account.event_count))
+        return events
+
+    def _kline_event(self, symbol: str, interval: str, open_ms: int, now: float, closed: bool) -> dict:
+        kline = self.market.kline(symbol, interval, open_ms, now)
+        return {
+            "e": "kline", "E": int(now*1000), "s": symbol,
+            "k": {"t": kline[0], "T": kline[6], "s": symbol, "i": interval,
+                  "f": 0, "L": kline[8], "o": kline[1], "c": kline[4],
+                  "h": kline[2], "l": kline[3], "v": kline[5], "n": kline[8],
+                  "x": closed, "q": kline[7], "V": kline[9], "Q": kline[10],
+                  "B": "0"}}
+
+    async def _stream_connection(self, ws, path: str = None):
+        path = path or ws.request.path
+        url = urlsplit(path)
+        combined = url.path.startswith("/stream")
+        if combined:
+            streams = set(dict(parse_qsl(url.query)).get("streams", "").split("/")) - {""}
+        else:
+            streams = set(url.path[len("/ws/"):].split("/")) - {""}
+        state = {}
+        started = time.monotonic()
+
+        async def receive():
+            async for raw in ws:
+                request = json.loads(raw)
+                names = request.get("params", [])
+                if request.get("method") == "SUBSCRIBE":
+                    streams.update(names)
+                elif request.get("method") == "UNSUBSCRIBE":
+                    streams.difference_update(names)
+                result = sorted(streams) if request.get("method") == "LIST_SUBSCRIPTIONS" else None
+                await ws.send(json.dumps({"result": result, "id": request.get("id")}))
+
+        receiver = asyncio.ensure_future(receive())
+        try:
+            while not receiver.done():
+                now = time.time()
+                messages = []
+                for stream_name in list(streams):
+                    try:
+                        events = self.stream_event(stream_name, now, state)
+                    except (StandInError, KeyError, ValueError):
+                        continue
+                    messages += [json.dumps({"stream": stream_name, "data": event})
+                                 if combined else json.dumps(event) for event in events]
+                if self.config.stream_latency_ms:
+                    await asyncio.sleep(self.config.stream_latency_ms/1000)
+                for message in messages:
+                    await ws.send(message)
+                if self.config.drop_after and (time.monotonic() - started >= self.config.drop_after):
+                    await ws.close()
+                    return
+                await asyncio.sleep(max(0.0, 1/self.config.tick_rate - (time.time() - now)))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            receiver.cancel()
+
+    async def _serve_streams(self):
+        async with websockets.serve(self._stream_connection, self.config.host,
+                                    self.config.stream_port, max_size=None):
+            await asyncio.Future()
+
+    def _run_streams(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._serve_streams())
+        except asyncio.CancelledError:
+            pass
+
+    # ----------------------------------------------------------
+    #                     Main Functions
+    # ----------------------------------------------------------
+
+    def start(self) -> "StandInServer":
+        """
+        Description:
+            Starts the REST and stream servers on daemon threads.
+        """
+        self.http_server = ThreadingHTTPServer(
+            (self.config.host, self.config.port), self._handler_class())
+        self.http_server.daemon_threads = True
+        self._threads = [
+            threading.Thread(target=self.http_server.serve_forever,
+                             name="Stand_In_REST_Thread", daemon=True),
+            threading.Thread(target=self._run_streams,
+                             name="Stand_In_Stream_Thread", daemon=True)]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        if self.http_server is not None:
+            self.http_server.shutdown()
+        if self.loop is not None:
+            for task in asyncio.all_tasks(self.loop):
+                self.loop.call_soon_threadsafe(task.cancel)
+
+
+# ----------------------------------functions-----------------------------------
+
+def free_port(host: str = "127.0.0.1") -> int:
+    """
+    Description:
+        Returns a port nothing listens on, so tests can run a stand-in next
+        to one already running on the default ports.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Local stand-in for the Binance REST api and streams.")
+    defaults = StandInConfig()
+    parser.add_argument("--host", default=defaults.host)
+    parser.add_argument("--port", type=int, default=defaults.port)
+    parser.add_argument("--stream-port", type=int, default=defaults.stream_port)
+    parser.add_argument("--symbols", type=int, default=defaults.symbols,
+                        help="amount of simulated symbols")
+    parser.add_argument("--tick-rate", type=float, default=defaults.tick_rate,
+                        help="stream updates per second per stream")
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms,
+                        help="latency added to every REST response")
+    parser.add_argument("--stream-latency-ms", type=float, default=defaults.stream_latency_ms,
+                        help="latency added to every stream update")
+    parser.add_argument("--weight-limit", type=int, default=defaults.weight_limit,
+                        help="request weight per minute before answering 429")
+    parser.add_argument("--order-limit", type=int, default=defaults.order_limit,
+                        help="orders per 10 seconds before answering 429")
+    parser.add_argument("--quote-balance", type=float, default=defaults.quote_balance)
+    parser.add_argument("--api-secret", default=defaults.api_secret,
+                        help="verify request signatures with this secret")
+    parser.add_argument("--drop-after", type=float, default=defaults.drop_after,
+                        help="close stream connections after this many seconds")
+    args = parser.parse_args()
+
+    server = StandInServer(StandInConfig(**{
+        key: value for key, value in vars(args).items()})).start()
+    print(f"Simulating {len(server.market.symbols)} symbols.")
+    print(f"BINANCE_API_URL={server.api_url}")
+    print(f"BINANCE_STREAM_URL={server.stream_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+#!/usr/bin/python3
+#
+# run_tests.py: runs every test case in testing/testcases.
+#
+# Run from the repository root:
+#   $ python3 -m testing.run_tests
+#
+# Andrew Bishop
+# 2026/10/18
+#
+
+# modules imported
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# ----------------------------------functions-----------------------------------
+
+def main() -> int:
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    # testcases is not a package, so its modules are loaded by name
+    names = [f"testing.testcases.{name[:-3]}"
+             for name in sorted(os.listdir(os.path.join(ROOT, 'testing', 'testcases')))
+             if name.endswith('.py')]
+    suite = unittest.defaultTestLoader.loadTestsFromNames(names)
+    result = unittest.TextTestRunner(verbosity=1).run(suite)
+    return 0 if result.wasSuccessful() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,252 @@
+#!/usr/bin/python3
+#
+# api_tests.py: contains the behaviour tests of the REST clients, streams
+# and rate limiter, run against local stand-in servers.
+#
+# Run from the repository root:
+#   $ python3 -m testing.run_tests
+#
+# Andrew Bishop
+# 2026/10/18
+#
+
+# modules imported
+import asyncio
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+
+from api.async_api import AsyncAPI
+from api.general_api import API
+from api.http_transport import RateLimitedAdapter
+from api.rate_limit import ACCOUNT_LANE, BACKFILL_LANE, MARKET_LANE, ORDER_LANE, \
+    RateLimiter, classify_request, rate_limiter, request_lane
+from functions.data_collection import data_collection
+from functions.data_collection.kline_buffer import get_kline_buffer
+from functions.data_collection.kline_events import wait_for_candle
+from functions.data_collection.stream_multiplexer import StreamMultiplexer, kline_stream_name
+# importing registers the kline stream handler
+from functions.data_collection import websocket_func  # noqa: F401
+from testing.binance_stand_in import StandInConfig, StandInServer, free_port
+
+
+# ----------------------------------functions-----------------------------------
+
+def wait_for_fresh_window():
+    """
+    Description:
+        Waits out the end of the current minute, so a test blocking on the
+        fixed minute window is not released by the window ending.
+    """
+    seconds = time.time() % 60
+    if seconds > 55:
+        time.sleep(60.5 - seconds)
+
+
+def start_acquire(limiter: RateLimiter, *args, **kwargs) -> threading.Thread:
+    """
+    Description:
+        Calls limiter.acquire on a daemon thread.
+    """
+    thread = threading.Thread(target=limiter.acquire, args=args, kwargs=kwargs, daemon=True)
+    thread.start()
+    return thread
+
+
+class StandInCase(unittest.TestCase):
+    """
+    Description:
+        Runs its tests against a local stand-in server on free ports, with
+        the environment pointing the clients at it.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StandInServer(StandInConfig(
+            port=free_port(), stream_port=free_port(), symbols=20, tick_rate=10)).start()
+        cls.environment = mock.patch.dict(os.environ, {
+            'BINANCE_API_URL': cls.server.api_url,
+            'BINANCE_STREAM_URL': cls.server.stream_url,
+            'BINANCE_PAPER_K': 'key',
+            'BINANCE_PAPER_S': 'secret'})
+        cls.environment.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.environment.stop()
+        cls.server.stop()
+
+
+# ------------------------------------tests-------------------------------------
+
+class StandInTests(StandInCase):
+
+    def test_rest_requests_are_served(self):
+        api = API('key', 'secret', self.server.api_url)
+        klines = api.send_public_request(
+            '/api/v3/klines', {'symbol': 'BTCUSDT', 'interval': '1m', 'limit': 5})
+        self.assertEqual(len(klines), 5)
+        account = api.send_signed_request('GET', '/api/v3/account')
+        self.assertIn('balances', account)
+        error = api.send_public_request('/api/v3/ticker/price', {'symbol': 'NOTASYMBOL'})
+        self.assertIn('code', error)
+
+    def test_streamed_klines_are_served_from_memory(self):
+        multiplexer = StreamMultiplexer()
+        stream = kline_stream_name('SOLUSDT', '1m')
+        multiplexer.add_streams([stream])
+        self.addCleanup(multiplexer.remove_streams, [stream])
+        self.assertGreater(wait_for_candle('SOLUSDT', '1m', timeout=5), 0)
+        buffer = get_kline_buffer('SOLUSDT', '1m')
+        klines = data_collection.get_klines('SOLUSDT', 1, '1m')
+        self.assertEqual(list(klines['t']), [buffer.last_time()])
+
+
+class PooledTransportTests(StandInCase):
+
+    def test_python_binance_client_is_shared_and_rate_limited(self):
+        client = data_collection.binance_client()
+        self.assertIs(client, data_collection.binance_client())
+        adapter = client.session.get_adapter(f"{self.server.api_url}/api/v3/ping")
+        self.assertIsInstance(adapter, RateLimitedAdapter)
+        klines = data_collection.download_recent_klines('ETHUSDT', '5m', 10)
+        self.assertEqual(len(klines), 10)
+        self.assertTrue((klines.index.to_series().diff().dropna() == 300).all())
+
+    def test_python_binance_client_pings_through_the_pooled_transport(self):
+        sent = []
+        send = RateLimitedAdapter.send
+
+        def record(adapter, request, *args, **kwargs):
+            sent.append(request.url)
+            return send(adapter, request, *args, **kwargs)
+
+        with mock.patch.object(RateLimitedAdapter, 'send', record):
+            data_collection._shared_client(self.server.api_url, 'ping key', 'secret')
+        self.assertEqual([url.split('?')[0] for url in sent],
+                         [f"{self.server.api_url}/api/v3/ping"])
+
+
+class AsyncClientTests(StandInCase):
+
+    def test_async_client_gathers_concurrent_requests(self):
+        symbols = ['BTCUSDT', 'ETHUSDT', 'BNBUSDT', 'NOTASYMBOL']
+
+        async def gather():
+            async with AsyncAPI('key', 'secret', self.server.api_url) as api:
+                return await api.gather_public_requests(
+                    '/api/v3/ticker/price', [{'symbol': symbol} for symbol in symbols])
+
+        prices = asyncio.run(gather())
+        self.assertEqual([price.get('symbol') for price in prices[:3]], symbols[:3])
+        self.assertIn('code', prices[3])
+
+
+class ClassifyRequestTests(unittest.TestCase):
+
+    def test_orders_go_through_the_order_lane(self):
+        url = "https://api.binance.com/api/v3/order"
+        self.assertEqual(classify_request('POST', url, b"symbol=BTCUSDT&side=BUY"),
+                         (1, 1, ORDER_LANE))
+        self.assertEqual(classify_request('DELETE', f"{url}?symbol=BTCUSDT&orderId=1"),
+                         (1, 0, ORDER_LANE))
+        self.assertEqual(classify_request('GET', f"{url}?symbol=BTCUSDT&orderId=1"),
+                         (4, 0, ACCOUNT_LANE))
+
+    def test_market_weights(self):
+        base = "https://api.binance.com/api/v3"
+        self.assertEqual(classify_request('GET', f"{base}/depth?symbol=BTCUSDT&limit=1000"),
+                         (50, 0, MARKET_LANE))
+        self.assertEqual(classify_request('GET', f"{base}/ticker/24hr"), (80, 0, MARKET_LANE))
+        self.assertEqual(classify_request('GET', f"{base}/ticker/24hr?symbol=BTCUSDT"),
+                         (2, 0, MARKET_LANE))
+
+    def test_request_lane_only_moves_market_requests(self):
+        base = "https://api.binance.com/api/v3"
+        with request_lane(BACKFILL_LANE):
+            self.assertEqual(classify_request('GET', f"{base}/klines?symbol=BTCUSDT"),
+                             (2, 0, BACKFILL_LANE))
+            self.assertEqual(classify_request('GET', f"{base}/account"), (20, 0, ACCOUNT_LANE))
+        self.assertEqual(classify_request('GET', f"{base}/klines?symbol=BTCUSDT"),
+                         (2, 0, MARKET_LANE))
+
+
+class RateLimiterTests(unittest.TestCase):
+
+    def test_lanes_leave_their_reserve_to_earlier_lanes(self):
+        wait_for_fresh_window()
+        limiter = RateLimiter(weight_per_minute=100)
+        self.assertLess(limiter.acquire(70, lane=BACKFILL_LANE), 0.05)
+        backfill = start_acquire(limiter, 1, lane=BACKFILL_LANE)
+        backfill.join(0.2)
+        self.assertTrue(backfill.is_alive())
+        # a waiting backfill never holds back orders or live data
+        self.assertLess(limiter.acquire(1, orders=1, lane=ORDER_LANE), 0.05)
+        self.assertLess(limiter.acquire(10, lane=MARKET_LANE), 0.05)
+        self.assertEqual(limiter.used_weight(), 81)
+
+    def test_retry_after_holds_every_request_and_earlier_lanes_go_first(self):
+        limiter = RateLimiter()
+        limiter.update(429, {'Retry-After': '1'})
+        self.assertGreater(limiter.retry_after(), 0.9)
+        finished = []
+        backfill = threading.Thread(target=lambda: finished.append(
+            (BACKFILL_LANE, limiter.acquire(1, lane=BACKFILL_LANE))))
+        order = threading.Thread(target=lambda: finished.append(
+            (ORDER_LANE, limiter.acquire(1, orders=1, lane=ORDER_LANE))))
+        backfill.start()
+        time.sleep(0.05)
+        order.start()
+        backfill.join(3)
+        order.join(3)
+        self.assertEqual([lane for lane, _ in finished], [ORDER_LANE, BACKFILL_LANE])
+        self.assertTrue(all(waited > 0.85 for _, waited in finished))
+        self.assertEqual(limiter.retry_after(), 0)
+
+    def test_usage_headers_raise_the_window_usage(self):
+        wait_for_fresh_window()
+        limiter = RateLimiter()
+        limiter.update(200, {'x-mbx-used-weight-1m': '95'}, sent=time.time())
+        self.assertEqual(limiter.used_weight(), 95)
+        # a lower report or one of an earlier window does not lower it
+        limiter.update(200, {'X-MBX-USED-WEIGHT-1M': '10'}, sent=time.time())
+        limiter.update(200, {'X-MBX-USED-WEIGHT-1M': '5000'}, sent=time.time() - 120)
+        self.assertEqual(limiter.used_weight(), 95)
+
+    def test_order_count_only_holds_orders(self):
+        wait_for_fresh_window()
+        limiter = RateLimiter(orders_per_10_seconds=2)
+        limiter.acquire(1, orders=1, lane=ORDER_LANE)
+        limiter.acquire(1, orders=1, lane=ORDER_LANE)
+        order = start_acquire(limiter, 1, orders=1, lane=ORDER_LANE)
+        order.join(0.2)
+        if time.time() % 10 < 9.5:
+            self.assertTrue(order.is_alive())
+        self.assertLess(limiter.acquire(1, lane=BACKFILL_LANE), 0.05)
+
+    def test_exchange_limits_replace_the_defaults(self):
+        wait_for_fresh_window()
+        limiter = RateLimiter()
+        limiter.set_limits([{'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'MINUTE',
+                             'intervalNum': 1, 'limit': 10},
+                            {'rateLimitType': 'RAW_REQUESTS', 'interval': 'MINUTE',
+                             'intervalNum': 5, 'limit': 61000}])
+        self.assertLess(limiter.acquire(5, lane=ORDER_LANE), 0.05)
+        request = start_acquire(limiter, 6, lane=ORDER_LANE)
+        request.join(0.2)
+        self.assertTrue(request.is_alive())
+
+
+class SharedLimiterTests(StandInCase):
+
+    def test_rest_requests_sync_the_shared_limiter(self):
+        api = API('key', 'secret', self.server.api_url)
+        api.send_public_request(
+            '/api/v3/klines', {'symbol': 'BTCUSDT', 'interval': '1m', 'limit': 5})
+        api.send_signed_request('GET', '/api/v3/account')
+        self.assertGreaterEqual(rate_limiter.used_weight(), self.server.limiter._weight)
+
+if __name__ == "__main__":
+    unittest.main()
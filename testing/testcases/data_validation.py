@@ -0,0 +1,617 @@
+#!/usr/bin/python3
+#
+# data_validation.py: contains the behaviour tests of the kline, order book
+# and bar data layers.
+#
+# Run from the repository root:
+#   $ python3 -m testing.run_tests
+#
+# Andrew Bishop
+# 2026/10/18
+#
+
+# modules imported
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from functions.data_collection import data_collection, order_book, websocket_func
+from functions.data_collection.bar_builder import BarBuilder
+from functions.data_collection.kline_archive import archive_klines, archived_months, \
+    archived_ranges, merge_ranges, missing_ranges, read_archived_klines
+from functions.data_collection.kline_buffer import KlineBuffer, get_kline_buffer
+from functions.data_collection.kline_events import candle_counters, candle_version, \
+    publish_candle, subscribe_candles, wait_for_candle, wait_for_candle_async
+from functions.data_collection.kline_store import KlineStore
+from functions.data_collection.order_book import OrderBook, resync_order_book
+from functions.data_collection.resampler import KlineResampler
+from functions.data_collection.stream_multiplexer import StreamMultiplexer
+from functions.data_collection.subscription_manager import SubscriptionManager
+from functions.setup.setup import format_binance_klines
+
+
+# ----------------------------------functions-----------------------------------
+
+def binance_klines(start: int, end: int, step: int = 60) -> list:
+    """
+    Description:
+        Returns raw /api/v3/klines rows with start <= open time < end (unix
+        seconds), every price of a kline equal to its open time.
+    """
+    return [[t*1000, str(t), str(t + 2), str(t - 2), str(t + 1), "1.5",
+             (t + step)*1000 - 1, "0", 3, "0", "0", "0"]
+            for t in range(start, end, step)]
+
+
+def kline_values(t: int) -> tuple:
+    """
+    Description:
+        Returns the (t, o, c, h, l, n, v) buffer values of a kline whose every
+        column is its open time.
+    """
+    return (t, float(t), float(t), float(t), float(t), float(t), float(t))
+
+
+class TemporaryDirectoryCase(unittest.TestCase):
+    """
+    Description:
+        Runs each test in an empty working directory, so files written under
+        'data' do not touch the repository.
+    """
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+# ------------------------------------tests-------------------------------------
+
+class KlineBufferTests(unittest.TestCase):
+
+    def test_wraparound_keeps_newest_in_order(self):
+        buffer = KlineBuffer(3)
+        for t in range(60, 360, 60):
+            self.assertTrue(buffer.update(*kline_values(t)))
+        klines = buffer.snapshot()
+        self.assertEqual(len(buffer), 3)
+        self.assertEqual(list(klines['t']), [180, 240, 300])
+        self.assertEqual(list(klines['o']), [180.0, 240.0, 300.0])
+        self.assertEqual(list(buffer.snapshot(2)['t']), [240, 300])
+        self.assertEqual(buffer.last_time(), 300)
+
+    def test_same_open_time_replaces_and_older_is_ignored(self):
+        buffer = KlineBuffer(3)
+        buffer.update(*kline_values(60))
+        self.assertFalse(buffer.update(60, 1.0, 2.0, 3.0, 0.5, 4.0, 5.0))
+        self.assertFalse(buffer.update(*kline_values(0)))
+        klines = buffer.snapshot()
+        self.assertEqual(list(klines['t']), [60])
+        self.assertEqual(klines['c'].iloc[-1], 2.0)
+
+    def test_load_keeps_newest_then_wraps(self):
+        buffer = KlineBuffer(3)
+        buffer.load(format_binance_klines(binance_klines(0, 300)))
+        self.assertEqual(list(buffer.snapshot()['t']), [120, 180, 240])
+        buffer.update(*kline_values(300))
+        buffer.update(*kline_values(360))
+        self.assertEqual(list(buffer.snapshot()['t']), [240, 300, 360])
+
+    def test_snapshot_is_a_copy(self):
+        buffer = KlineBuffer(2)
+        buffer.update(*kline_values(60))
+        klines = buffer.snapshot()
+        klines.loc[0, 'c'] = -1.0
+        self.assertEqual(buffer.snapshot()['c'].iloc[0], 60.0)
+        self.assertEqual(klines.attrs['time_unit'], 's')
+
+
+class KlineStoreTests(TemporaryDirectoryCase):
+
+    def test_reader_sees_writer_across_wraparound(self):
+        store = KlineStore.create(os.path.join('data', 'store.klines'), 3)
+        reader = KlineStore(store.path)
+        for t in range(60, 360, 60):
+            store.update(*kline_values(t))
+        store.update(300, 1.0, 2.0, 3.0, 0.5, 4.0, 5.0)
+        klines = reader.snapshot()
+        self.assertEqual(list(klines['t']), [180, 240, 300])
+        self.assertEqual(klines['c'].iloc[-1], 2.0)
+        # the mirrored rows keep the newest klines contiguous
+        self.assertEqual(list(reader.columns(2)['t']), [240, 300])
+
+    def test_reads_wait_for_a_write_in_progress(self):
+        store = KlineStore.create(os.path.join('data', 'store.klines'), 3)
+        store.update(*kline_values(60))
+        reader = KlineStore(store.path)
+        results = []
+        store._begin_write()
+        thread = threading.Thread(target=lambda: results.append(reader.arrays()))
+        thread.start()
+        thread.join(0.1)
+        self.assertTrue(thread.is_alive())
+        store._end_write()
+        thread.join(1)
+        self.assertEqual(list(results[0]['t']), [60])
+
+    def test_seqlock_reads_are_never_torn(self):
+        store = KlineStore.create(os.path.join('data', 'store.klines'), 64)
+        reader = KlineStore(store.path)
+        done = threading.Event()
+
+        def write():
+            for t in range(1, 20001):
+                store.update(*kline_values(t))
+            done.set()
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        reads = 0
+        while not done.is_set() or not reads:
+            arrays = reader.arrays()
+            reads += 1
+            t = arrays['t']
+            for column in ('o', 'c', 'h', 'l', 'n', 'v'):
+                np.testing.assert_array_equal(arrays[column], t.astype(np.float64))
+            if len(t) > 1:
+                self.assertTrue(np.all(np.diff(t) == 1))
+        thread.join()
+        self.assertEqual(reader.last_time(), 20000)
+
+
+class KlineArchiveTests(TemporaryDirectoryCase):
+
+    def test_merge_ranges(self):
+        self.assertEqual(merge_ranges([(5, 8), (0, 2), (2, 4), (7, 10)]),
+                         [(0, 4), (5, 10)])
+        self.assertEqual(merge_ranges([]), [])
+
+    def test_missing_ranges(self):
+        covered = [(10, 20), (30, 40)]
+        self.assertEqual(missing_ranges(covered, 0, 50), [(0, 10), (20, 30), (40, 50)])
+        self.assertEqual(missing_ranges(covered, 12, 35), [(20, 30)])
+        self.assertEqual(missing_ranges(covered, 10, 20), [])
+        self.assertEqual(missing_ranges([], 5, 9), [(5, 9)])
+        self.assertEqual(missing_ranges(covered, 40, 40), [])
+
+    def test_archive_partitions_by_month_and_merges(self):
+        # 2024-01-31 22:00 to 2024-02-01 02:00 hourly
+        start = 1706738400
+        archive_klines('BTCUSDT', '1h', format_binance_klines(
+            binance_klines(start, start + 4*3600, 3600)))
+        self.assertEqual(archived_months('BTCUSDT', '1h'), ['2024-01', '2024-02'])
+
+        # overlapping klines replace the archived ones, none are duplicated
+        replacement = binance_klines(start + 3600, start + 6*3600, 3600)
+        replacement[0][4] = "1.0"
+        archive_klines('BTCUSDT', '1h', format_binance_klines(replacement))
+        archive_klines('BTCUSDT', '1h', format_binance_klines(replacement))
+        klines = read_archived_klines('BTCUSDT', '1h')
+        self.assertEqual(list(klines['t']), list(range(start, start + 6*3600, 3600)))
+        self.assertEqual(klines['c'].iloc[1], 1.0)
+
+        # the range end is exclusive and crosses the partitions
+        klines = read_archived_klines('BTCUSDT', '1h', start + 3600, start + 4*3600)
+        self.assertEqual(list(klines['t']), [start + 3600, start + 2*3600, start + 3*3600])
+
+    def test_saved_klines_ranges_read_the_archive_newest_first(self):
+        start = 1706738400
+        archive_klines('BTCUSDT', '1h', format_binance_klines(
+            binance_klines(start, start + 6*3600, 3600)))
+        # a range implies the archive, the live csv does not exist
+        klines = data_collection.get_saved_klines(
+            'BTCUSDT', '1h', 2, start=start, end=start + 4*3600)
+        self.assertEqual(list(klines['t']), [start + 2*3600, start + 3*3600])
+        klines = data_collection.get_saved_klines('BTCUSDT', '1h', 3, historical=True)
+        self.assertEqual(list(klines['t']), [start + 3*3600, start + 4*3600, start + 5*3600])
+
+
+class HistoricalSyncTests(TemporaryDirectoryCase):
+
+    def test_sync_only_downloads_missing_ranges(self):
+        requested = []
+
+        def fetch(symbol, interval, start, end):
+            requested.append((start, end))
+            return format_binance_klines(binance_klines(start, end))
+
+        now = 1706738400
+        with mock.patch.object(data_collection, 'fetch_klines_range', fetch), \
+                mock.patch.object(data_collection, 'last_closed_open_time', lambda interval: now):
+            self.assertEqual(data_collection.sync_historical_klines(
+                'ETHUSDT', '1m', now - 600, now - 300), 5)
+            self.assertEqual(data_collection.sync_historical_klines(
+                'ETHUSDT', '1m', now - 900, now + 600), 10)
+            self.assertEqual(data_collection.sync_historical_klines(
+                'ETHUSDT', '1m', now - 900, now), 0)
+        # the open candle is never archived
+        self.assertEqual(requested, [(now - 600, now - 300), (now - 900, now - 600),
+                                     (now - 300, now)])
+        self.assertEqual(archived_ranges('ETHUSDT', '1m'), [(now - 900, now)])
+        self.assertEqual(len(read_archived_klines('ETHUSDT', '1m')), 15)
+
+
+class KlineResamplerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.buffers = {'5m': KlineBuffer(10), '15m': KlineBuffer(10)}
+        self.resampler = KlineResampler('1m', self.buffers)
+        self.start = 1706738400  # a multiple of 15 minutes
+
+    def test_buckets_close_on_their_last_base_kline(self):
+        for index in range(4):
+            t = self.start + index*60
+            updates = dict(self.resampler.update(t, 10.0 + index, 11.0 + index,
+                                                 20.0 + index, 5.0 - index, 1.0, 2.0, closed=True))
+            self.assertEqual(updates, {'5m': False, '15m': False})
+        updates = dict(self.resampler.update(self.start + 240, 14.0, 15.0, 19.0, 4.0,
+                                             1.0, 2.0, closed=True))
+        self.assertEqual(updates, {'5m': True, '15m': False})
+        klines = self.buffers['5m'].snapshot()
+        self.assertEqual(list(klines['t']), [self.start])
+        row = klines.iloc[-1]
+        self.assertEqual((row['o'], row['c'], row['h'], row['l']), (10.0, 15.0, 23.0, 2.0))
+        self.assertEqual((row['n'], row['v']), (5.0, 10.0))
+
+        # the next base kline opens the next bucket
+        self.resampler.update(self.start + 300, 15.0, 16.0, 17.0, 14.0, 1.0, 2.0)
+        self.assertEqual(list(self.buffers['5m'].snapshot()['t']),
+                         [self.start, self.start + 300])
+        self.assertEqual(list(self.buffers['15m'].snapshot()['t']), [self.start])
+
+    def test_open_kline_is_shown_and_folded_once_a_newer_one_arrives(self):
+        self.resampler.update(self.start, 10.0, 11.0, 12.0, 9.0, 1.0, 2.0)
+        self.resampler.update(self.start, 10.0, 13.0, 14.0, 9.0, 2.0, 3.0)
+        row = self.buffers['5m'].snapshot().iloc[-1]
+        self.assertEqual((row['c'], row['h'], row['v']), (13.0, 14.0, 3.0))
+        # the base kline closed without a final update
+        self.resampler.update(self.start + 60, 13.0, 12.0, 13.0, 11.0, 1.0, 1.0)
+        row = self.buffers['5m'].snapshot().iloc[-1]
+        self.assertEqual((row['o'], row['c'], row['h'], row['l'], row['v']),
+                         (10.0, 12.0, 14.0, 9.0, 4.0))
+        # updates of a folded base kline are ignored
+        self.assertEqual(self.resampler.update(self.start, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0), [])
+
+    def test_seed_rebuilds_the_open_bucket(self):
+        arrays = {column: [] for column in 'tochlnv'}
+        for index in range(7):
+            for column, value in zip('tochlnv', kline_values(self.start + index*60)):
+                arrays[column].append(value)
+        self.resampler.seed(arrays)
+        self.assertEqual(list(self.buffers['5m'].snapshot()['t']), [self.start, self.start + 300])
+        row = self.buffers['15m'].snapshot().iloc[-1]
+        self.assertEqual((row['o'], row['c']), (float(self.start), float(self.start + 360)))
+        self.assertEqual(self.resampler.history_length(), 15)
+
+    def test_rejects_targets_that_are_not_multiples(self):
+        with self.assertRaises(ValueError):
+            KlineResampler('5m', {'1m': KlineBuffer(1)})
+
+
+class SubscriptionManagerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.added = []
+        self.open_trades = {'AUSDT'}
+        self.multiplexer = mock.Mock(spec=StreamMultiplexer)
+        self.manager = SubscriptionManager(
+            self.multiplexer, '5m', on_add=self.added.append,
+            on_remove=lambda symbol: symbol not in self.open_trades)
+
+    def removed_streams(self) -> list:
+        return [name for call in self.multiplexer.remove_streams.call_args_list
+                for name in call.args[0]]
+
+    def test_symbols_with_open_trades_are_removed_once_they_close(self):
+        self.assertEqual(self.manager.sync(['ausdt', 'BUSDT']), (['AUSDT', 'BUSDT'], []))
+        self.assertEqual(self.manager.sync(['BUSDT']), ([], []))
+        self.assertEqual(self.manager.active, {'AUSDT', 'BUSDT'})
+        self.open_trades.clear()
+        self.assertEqual(self.manager.sync(['BUSDT']), ([], ['AUSDT']))
+        self.assertEqual(self.removed_streams(), ['ausdt@kline_5m'])
+
+    def test_symbol_back_before_its_removal_finished_is_started_again(self):
+        self.manager.sync(['AUSDT'])
+        self.manager.sync([])
+        self.manager.sync(['AUSDT'])
+        self.assertEqual(self.added, ['AUSDT', 'AUSDT'])
+        self.assertEqual(self.removed_streams(), [])
+
+    def test_removing_one_symbol_leaves_pending_removals_alone(self):
+        self.manager.sync(['AUSDT', 'BUSDT', 'CUSDT'])
+        self.manager.sync(['BUSDT', 'CUSDT'])
+        # the thread of BUSDT died while AUSDT waits for its trade to close
+        self.assertTrue(self.manager.remove('BUSDT'))
+        self.assertEqual(self.added, ['AUSDT', 'BUSDT', 'CUSDT'])
+        self.assertEqual(self.manager.active, {'AUSDT', 'CUSDT'})
+        self.assertEqual(self.removed_streams(), ['busdt@kline_5m'])
+        self.assertFalse(self.manager.remove('AUSDT'))
+        self.assertFalse(self.manager.remove('BUSDT'))
+
+
+class BackfillTests(unittest.TestCase):
+
+    def setUp(self):
+        self.requested = []
+        self.open_time = 1706738400
+
+        def fetch(symbol, interval, start, end):
+            self.requested.append((start, end))
+            return format_binance_klines(binance_klines(start, end))
+
+        patches = [
+            mock.patch.object(websocket_func, 'fetch_klines_range', fetch),
+            mock.patch.object(websocket_func, 'last_closed_open_time',
+                              lambda interval: self.open_time)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def _buffer(self, symbol: str, capacity: int = 500) -> KlineBuffer:
+        self.addCleanup(websocket_func._last_closed.pop, (symbol, '1m'), None)
+        return get_kline_buffer(symbol, '1m', capacity)
+
+    def test_range_starts_after_the_last_closed_kline(self):
+        buffer = self._buffer('BACKFILLAUSDT')
+        buffer.update(*kline_values(self.open_time - 600))
+        websocket_func._last_closed[('BACKFILLAUSDT', '1m')] = self.open_time - 600
+        self.assertEqual(websocket_func.backfill_klines('BACKFILLAUSDT', '1m'), 10)
+        self.assertEqual(self.requested, [(self.open_time - 540, self.open_time + 60)])
+        self.assertEqual(buffer.last_time(), self.open_time)
+        self.assertEqual(websocket_func._last_closed[('BACKFILLAUSDT', '1m')],
+                         self.open_time - 60)
+
+    def test_range_is_clipped_to_the_buffer(self):
+        buffer = self._buffer('BACKFILLBUSDT', capacity=5)
+        buffer.update(*kline_values(self.open_time - 6000))
+        websocket_func._last_closed[('BACKFILLBUSDT', '1m')] = self.open_time - 6000
+        websocket_func.backfill_klines('BACKFILLBUSDT', '1m')
+        self.assertEqual(self.requested, [(self.open_time - 240, self.open_time + 60)])
+
+    def test_unclosed_last_kline_is_downloaded_again(self):
+        buffer = self._buffer('BACKFILLCUSDT')
+        buffer.update(*kline_values(self.open_time - 120))
+        websocket_func.backfill_klines('BACKFILLCUSDT', '1m')
+        self.assertEqual(self.requested, [(self.open_time - 120, self.open_time + 60)])
+
+    def test_empty_buffer_downloads_nothing(self):
+        self._buffer('BACKFILLDUSDT')
+        self.assertEqual(websocket_func.backfill_klines('BACKFILLDUSDT', '1m'), 0)
+        self.assertEqual(self.requested, [])
+
+
+class CandleEventTests(unittest.TestCase):
+
+    def test_closed_only_subscriptions_skip_updates(self):
+        received = []
+        done = threading.Event()
+
+        def callback(event):
+            received.append(event.t)
+            done.set()
+
+        unsubscribe = subscribe_candles('EVENTBUSDT', '1m', callback, closed_only=True)
+        self.addCleanup(unsubscribe)
+        publish_candle('EVENTBUSDT', '1m', 1, False)
+        publish_candle('EVENTBUSDT', '1m', 1, True)
+        self.assertTrue(done.wait(2))
+        self.assertEqual(received, [1])
+
+    def test_waiters_do_not_miss_events_between_waits(self):
+        since = candle_version('EVENTCUSDT', '1m')
+        for t in range(3):
+            publish_candle('EVENTCUSDT', '1m', t, False)
+        self.assertEqual(wait_for_candle('EVENTCUSDT', '1m', since=since, timeout=0), since + 3)
+        # nothing newer, so the wait times out on the same version
+        self.assertEqual(wait_for_candle('EVENTCUSDT', '1m', since=since + 3, timeout=0.01),
+                         since + 3)
+
+    def test_async_waiters_wake_on_the_next_event(self):
+        async def wait():
+            waiter = asyncio.ensure_future(wait_for_candle_async('EVENTEUSDT', '1m'))
+            await asyncio.sleep(0.01)
+            publish_candle('EVENTEUSDT', '1m', 1, False)
+            return await asyncio.wait_for(waiter, 2)
+
+        self.assertEqual(asyncio.run(wait()), candle_version('EVENTEUSDT', '1m'))
+
+    def test_cancelled_async_waiters_do_not_break_publishing(self):
+        received = []
+        done = threading.Event()
+        unsubscribe = subscribe_candles(
+            'EVENTFUSDT', '1m', lambda event: (received.append(event.t), done.set()))
+        self.addCleanup(unsubscribe)
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(asyncio.wait_for(
+                wait_for_candle_async('EVENTFUSDT', '1m', closed_only=True), 0.05))
+        # the loop of the cancelled waiter is closed by now
+        publish_candle('EVENTFUSDT', '1m', 1, True)
+        self.assertTrue(done.wait(2))
+        self.assertEqual(received, [1])
+
+
+class CandleCoalescingTests(unittest.TestCase):
+
+    def test_busy_callback_gets_closed_candles_and_the_latest_update(self):
+        received = []
+        first = threading.Event()
+        release = threading.Event()
+        finished = threading.Event()
+
+        def callback(event):
+            received.append((event.t, event.closed))
+            if len(received) == 1:
+                first.set()
+                release.wait(2)
+            if event.t == 4:
+                finished.set()
+
+        unsubscribe = subscribe_candles('EVENTAUSDT', '1m', callback)
+        self.addCleanup(unsubscribe)
+        publish_candle('EVENTAUSDT', '1m', 1, False)
+        self.assertTrue(first.wait(2))
+        publish_candle('EVENTAUSDT', '1m', 2, False)
+        publish_candle('EVENTAUSDT', '1m', 3, False)
+        publish_candle('EVENTAUSDT', '1m', 3, True)
+        publish_candle('EVENTAUSDT', '1m', 4, False)
+        release.set()
+        self.assertTrue(finished.wait(2))
+        self.assertEqual(received, [(1, False), (3, True), (4, False)])
+        counters = candle_counters('EVENTAUSDT', '1m')
+        self.assertEqual((counters['published'], counters['closed']), (5, 1))
+        self.assertEqual(counters['coalesced'], 2)
+
+    def test_waits_count_the_updates_they_skipped(self):
+        since = candle_version('EVENTDUSDT', '1m')
+        for t in range(3):
+            publish_candle('EVENTDUSDT', '1m', t, False)
+        wait_for_candle('EVENTDUSDT', '1m', since=since, timeout=0)
+        self.assertEqual(candle_counters('EVENTDUSDT', '1m')['coalesced'], 2)
+
+
+class OrderBookTests(unittest.TestCase):
+
+    @staticmethod
+    def snapshot(last_update_id: int) -> dict:
+        return {
+            'lastUpdateId': last_update_id,
+            'bids': [['99.0', '1.0'], ['98.0', '2.0']],
+            'asks': [['101.0', '1.0'], ['102.0', '2.0']]}
+
+    @staticmethod
+    def diff(first: int, last: int, bids: list = (), asks: list = ()) -> dict:
+        return {'e': 'depthUpdate', 's': 'BOOKUSDT', 'U': first, 'u': last,
+                'b': list(bids), 'a': list(asks)}
+
+    def test_buffered_diffs_are_applied_after_the_snapshot(self):
+        book = OrderBook('BOOKUSDT')
+        self.assertFalse(book.apply_event(self.diff(95, 100, bids=[['99.0', '5.0']])))
+        self.assertFalse(book.apply_event(self.diff(101, 105, bids=[['99.5', '1.0']],
+                                                    asks=[['101.0', '0']])))
+        self.assertTrue(book.apply_snapshot(self.snapshot(100)))
+        self.assertTrue(book.is_synced())
+        self.assertEqual(book.last_update_id, 105)
+        # the diff already part of the snapshot is skipped
+        self.assertEqual(book.best_bid(), (99.5, 1.0))
+        self.assertEqual(book._bids[99.0], 1.0)
+        self.assertEqual(book.best_ask(), (102.0, 2.0))
+        self.assertEqual(book.mid_price(), (99.5 + 102.0)/2)
+
+    def test_gap_drops_the_book_until_resynced(self):
+        book = OrderBook('BOOKUSDT')
+        book.apply_snapshot(self.snapshot(100))
+        self.assertTrue(book.apply_event(self.diff(101, 102)))
+        self.assertFalse(book.apply_event(self.diff(110, 111, bids=[['97.0', '1.0']])))
+        self.assertFalse(book.is_synced())
+        self.assertFalse(book.synced.is_set())
+        # a snapshot older than the buffered diff does not line up
+        self.assertFalse(book.apply_snapshot(self.snapshot(105)))
+        self.assertTrue(book.apply_snapshot(self.snapshot(110)))
+        self.assertEqual(book.last_update_id, 111)
+        self.assertEqual(book._bids[97.0], 1.0)
+
+    def test_resync_retries_until_a_snapshot_lines_up(self):
+        book = OrderBook('BOOKUSDT')
+        book.apply_event(self.diff(200, 201))
+        snapshots = iter([self.snapshot(150), self.snapshot(200)])
+        book.resyncing = True
+        with mock.patch.object(order_book, 'fetch_depth_snapshot',
+                               lambda symbol, limit: next(snapshots)):
+            self.assertTrue(resync_order_book(book))
+        self.assertEqual((book.resyncs, book.resyncing, book.last_update_id), (1, False, 201))
+
+    def test_gap_on_the_stream_requests_a_resync(self):
+        book = order_book.get_order_book('BOOKSTREAMUSDT')
+        with mock.patch.object(order_book, 'fetch_depth_snapshot',
+                               lambda symbol, limit: self.snapshot(10)):
+            order_book._handle_depth_message('bookstreamusdt@depth@100ms',
+                                             dict(self.diff(11, 12), s='BOOKSTREAMUSDT'))
+            self.assertTrue(book.synced.wait(2))
+        self.assertEqual(book.last_update_id, 12)
+
+    def test_liquidity_queries(self):
+        book = OrderBook('BOOKUSDT')
+        book.apply_snapshot(self.snapshot(1))
+        # 101 quote fills the first ask, 204 more the second
+        self.assertAlmostEqual(book.expected_fill_price(305.0), 305.0/3)
+        self.assertIsNone(book.expected_fill_price(1000.0))
+        self.assertAlmostEqual(book.expected_fill_price(99.0, side='SELL'), 99.0)
+        self.assertEqual(book.depth_within(1.5), (99.0, 101.0))
+        self.assertEqual(book.depth_within(2), (99.0 + 196.0, 101.0 + 204.0))
+
+
+class BarBuilderTests(unittest.TestCase):
+
+    def builder(self, symbol: str, name: str) -> BarBuilder:
+        time_unit = 's' if name.endswith('s') else 'ms'
+        return BarBuilder(symbol, name, KlineBuffer(10, time_unit))
+
+    def test_time_bars_open_on_multiples_and_close_on_later_trades(self):
+        builder = self.builder('BARAUSDT', '5s')
+        start_ms = 1706738400000
+        builder.add_trade(start_ms + 1000, 10.0, 1.0)
+        builder.add_trade(start_ms + 4999, 12.0, 2.0)
+        builder.add_trade(start_ms + 2000, 8.0, 1.0, trades=3)
+        self.assertEqual(candle_counters('BARAUSDT', '5s')['closed'], 0)
+        builder.add_trade(start_ms + 5000, 11.0, 1.0)
+        self.assertEqual(candle_counters('BARAUSDT', '5s')['closed'], 1)
+        klines = builder.buffer.snapshot()
+        self.assertEqual(list(klines['t']), [start_ms//1000, start_ms//1000 + 5])
+        row = klines.iloc[0]
+        self.assertEqual((row['o'], row['c'], row['h'], row['l'], row['n'], row['v']),
+                         (10.0, 8.0, 12.0, 8.0, 5.0, 4.0))
+        # trades of a closed bar are dropped
+        builder.add_trade(start_ms + 4000, 1.0, 1.0)
+        self.assertEqual(builder.buffer.snapshot()['l'].iloc[0], 8.0)
+
+    def test_time_bars_close_when_their_time_runs_out(self):
+        builder = self.builder('BARBUSDT', '5s')
+        builder.add_trade(1706738401000, 10.0, 1.0)
+        self.assertFalse(builder.flush(now=1706738405.0))
+        self.assertTrue(builder.flush(now=1706738405.5))
+        self.assertEqual(candle_counters('BARBUSDT', '5s')['closed'], 1)
+        self.assertIsNone(builder.t)
+
+    def test_tick_bars_close_every_n_trades(self):
+        builder = self.builder('BARCUSDT', 'tick_3')
+        for index, trade_ms in enumerate([1000, 1000, 1001, 1001, 1002, 1003, 1004]):
+            builder.add_trade(trade_ms, 10.0 + index, 1.0)
+        klines = builder.buffer.snapshot()
+        # the second bar opened in the ms of the first and was bumped
+        self.assertEqual(list(klines['t']), [1000, 1001, 1004])
+        self.assertEqual(list(klines['c']), [12.0, 15.0, 16.0])
+        self.assertEqual(candle_counters('BARCUSDT', 'tick_3')['closed'], 2)
+        self.assertEqual(klines.attrs['time_unit'], 'ms')
+
+    def test_volume_and_dollar_bars_close_with_the_trade_reaching_their_size(self):
+        volume = self.builder('BARDUSDT', 'volume_2')
+        volume.add_trade(1000, 10.0, 1.5)
+        volume.add_trade(2000, 10.0, 1.0)
+        volume.add_trade(3000, 10.0, 0.5)
+        self.assertEqual(list(volume.buffer.snapshot()['v']), [2.5, 0.5])
+
+        dollar = self.builder('BARDUSDT', 'dollar_100')
+        dollar.add_trade(1000, 20.0, 4.0)
+        dollar.add_trade(2000, 30.0, 1.0)
+        dollar.add_trade(3000, 30.0, 1.0)
+        self.assertEqual(list(dollar.buffer.snapshot()['v']), [5.0, 1.0])
+        self.assertEqual(candle_counters('BARDUSDT', 'dollar_100')['closed'], 1)
+
+    def test_buffer_must_use_the_unit_of_the_bar(self):
+        with self.assertRaises(ValueError):
+            BarBuilder('BAREUSDT', 'tick_3', KlineBuffer(10))
+        with self.assertRaises(ValueError):
+            BarBuilder('BAREUSDT', '7s', KlineBuffer(10))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,290 @@
+#!/usr/bin/python3
+#
+# trade_tests.py: contains the behaviour tests of the symbol filters, the
+# account state and of placing orders against the local stand-in server.
+#
+# Run from the repository root:
+#   $ python3 -m testing.run_tests
+#
+# Andrew Bishop
+# 2026/10/18
+#
+
+# modules imported
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+from functions.data_collection import exchange_info
+from functions.data_collection.exchange_info import ExchangeInfoCache, SymbolFilters
+from functions.data_collection.stream_multiplexer import StreamMultiplexer
+from functions.trade import trade, user_data
+from functions.trade.user_data import ORDER_HISTORY, AccountState, Balance, UserDataStream
+from testing.binance_stand_in import StandInConfig, StandInServer, free_port
+
+
+# ----------------------------------functions-----------------------------------
+
+def symbol_info(*filters: dict) -> dict:
+    """
+    Description:
+        Returns an exchangeInfo symbol entry with the given filters.
+    """
+    return {'symbol': 'BTCUSDT', 'status': 'TRADING', 'baseAsset': 'BTC',
+            'quoteAsset': 'USDT', 'baseAssetPrecision': 8, 'filters': list(filters)}
+
+
+def rest_order(order_id: int, status: str = 'NEW', executed: str = '0', **fields) -> dict:
+    """
+    Description:
+        Returns an order in the REST format.
+    """
+    return dict({'symbol': 'BTCUSDT', 'orderId': order_id, 'clientOrderId': f"c{order_id}",
+                 'price': '100', 'origQty': '2', 'executedQty': executed,
+                 'cummulativeQuoteQty': '0', 'status': status, 'timeInForce': 'GTC',
+                 'type': 'LIMIT', 'side': 'BUY', 'transactTime': 1000}, **fields)
+
+
+def execution_report(order_id: int, status: str, executed: str, trade_id: int = -1,
+                     last_qty: str = '0') -> dict:
+    """
+    Description:
+        Returns an executionReport event of a BTCUSDT limit order.
+    """
+    return {'e': 'executionReport', 's': 'BTCUSDT', 'c': f"c{order_id}", 'C': '',
+            'S': 'BUY', 'o': 'LIMIT', 'f': 'GTC', 'q': '2', 'p': '100',
+            'x': 'TRADE' if trade_id >= 0 else 'NEW', 'X': status, 'i': order_id,
+            'l': last_qty, 'z': executed, 'L': '100', 'n': '0.001', 'N': 'BTC',
+            'T': 2000, 't': trade_id, 'O': 1000, 'Z': '0'}
+
+
+class StandInCase(unittest.TestCase):
+    """
+    Description:
+        Runs its tests against a local stand-in server on free ports, with
+        the environment pointing the clients at it.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StandInServer(StandInConfig(
+            port=free_port(), stream_port=free_port(), symbols=20, tick_rate=10)).start()
+        cls.environment = mock.patch.dict(os.environ, {
+            'BINANCE_API_URL': cls.server.api_url,
+            'BINANCE_STREAM_URL': cls.server.stream_url,
+            'BINANCE_PAPER_K': 'key',
+            'BINANCE_PAPER_S': 'secret'})
+        cls.environment.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.environment.stop()
+        cls.server.stop()
+
+
+# ------------------------------------tests-------------------------------------
+
+class SymbolFiltersTests(unittest.TestCase):
+
+    price_filter = {'filterType': 'PRICE_FILTER', 'minPrice': '0.01',
+                    'maxPrice': '1000000', 'tickSize': '0.01'}
+    lot_size = {'filterType': 'LOT_SIZE', 'minQty': '0.00001', 'maxQty': '9000',
+                'stepSize': '0.00001'}
+
+    def test_notional_filter_replaces_min_notional(self):
+        filters = SymbolFilters.from_symbol_info(symbol_info(
+            self.price_filter, self.lot_size,
+            {'filterType': 'NOTIONAL', 'minNotional': '5', 'maxNotional': '9000000'}))
+        self.assertEqual((filters.min_notional, filters.max_notional), (5.0, 9000000.0))
+        self.assertEqual((filters.tick_size, filters.step_size), (0.01, 0.00001))
+
+    def test_min_notional_filter_is_still_read(self):
+        filters = SymbolFilters.from_symbol_info(symbol_info(
+            self.lot_size, {'filterType': 'MIN_NOTIONAL', 'minNotional': '10'}))
+        self.assertEqual((filters.min_notional, filters.max_notional), (10.0, 0.0))
+        self.assertEqual(filters.tick_size, 0.0)
+
+    def test_missing_filters_default_to_zero(self):
+        filters = SymbolFilters.from_symbol_info({'symbol': 'BTCUSDT', 'filters': []})
+        self.assertEqual((filters.status, filters.min_notional, filters.min_qty),
+                         ('TRADING', 0.0, 0.0))
+
+
+class ExchangeInfoCacheTests(StandInCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'exchange_info.json')
+
+    def test_exchange_info_is_persisted_and_reloaded(self):
+        cache = ExchangeInfoCache(self.path)
+        cache.ensure_loaded()
+        self.assertEqual(cache.refreshes, 1)
+        self.assertEqual(cache._filters['BTCUSDT'].min_notional, 10.0)
+        self.assertTrue(os.path.exists(self.path))
+        reloaded = ExchangeInfoCache(self.path)
+        reloaded.ensure_loaded()
+        self.assertEqual(reloaded.refreshes, 0)
+        self.assertEqual(reloaded.updated, cache.updated)
+        self.assertEqual(reloaded._filters['BTCUSDT'], cache._filters['BTCUSDT'])
+
+    def test_persisted_exchange_info_past_its_ttl_is_downloaded(self):
+        ExchangeInfoCache(self.path).ensure_loaded()
+        stale = ExchangeInfoCache(self.path, ttl=0)
+        stale.ensure_loaded()
+        self.assertEqual(stale.refreshes, 1)
+
+
+class ExchangeInfoRefreshTests(unittest.TestCase):
+
+    def test_failed_refreshes_are_retried(self):
+        refreshed = threading.Event()
+        errors = [KeyError('symbols'), requests.exceptions.Timeout(), ValueError()]
+
+        def refresh():
+            if errors:
+                raise errors.pop(0)
+            refreshed.set()
+            threading.Event().wait()  # holds the thread on its last refresh
+
+        cache = ExchangeInfoCache(refresh_interval=0)
+        cache._response, cache.updated = {}, time.time()
+        with mock.patch.object(exchange_info, 'EXCHANGE_INFO_RETRY_INTERVAL', 0.01), \
+                mock.patch.object(cache, 'refresh', refresh), \
+                self.assertLogs('main', 'ERROR') as logs:
+            cache.start()
+            self.assertTrue(refreshed.wait(2))
+        self.assertEqual(len(logs.records), 3)
+        self.assertTrue(cache._thread.is_alive())
+
+
+class AccountStateTests(unittest.TestCase):
+
+    def setUp(self):
+        self.state = AccountState()
+
+    def test_older_order_updates_are_dropped(self):
+        self.state.apply_order(rest_order(1, 'PARTIALLY_FILLED', '1'))
+        self.state.apply_order(rest_order(1, 'NEW', '0'))
+        self.assertEqual(self.state.order('btcusdt', 1)['executedQty'], '1')
+        self.state.apply_order(rest_order(1, 'CANCELED', '1'))
+        # closed orders never open again
+        self.state.apply_order(rest_order(1, 'PARTIALLY_FILLED', '1'))
+        self.assertEqual(self.state.order('BTCUSDT', 1)['status'], 'CANCELED')
+        self.assertEqual(self.state.open_orders(), [])
+
+    def test_rest_updates_keep_the_streamed_fills(self):
+        self.state.apply_execution_report(execution_report(1, 'PARTIALLY_FILLED', '1', 7, '1'))
+        self.state.apply_order(rest_order(1, 'PARTIALLY_FILLED', '1'))
+        order = self.state.order('BTCUSDT', 1)
+        self.assertEqual([fill['tradeId'] for fill in order['fills']], [7])
+        self.assertEqual(order['updateTime'], 1000)
+        self.assertEqual(self.state.open_orders('BTCUSDT'), [order])
+
+    def test_execution_reports_add_each_trade_once(self):
+        self.state.apply_order(rest_order(1))
+        self.state.apply_execution_report(execution_report(1, 'PARTIALLY_FILLED', '1', 7, '1'))
+        self.state.apply_execution_report(execution_report(1, 'PARTIALLY_FILLED', '1', 7, '1'))
+        self.state.apply_execution_report(execution_report(1, 'FILLED', '2', 8, '1'))
+        # a late report of the first fill is older than the state
+        self.state.apply_execution_report(execution_report(1, 'PARTIALLY_FILLED', '1', 7, '1'))
+        order = self.state.order('BTCUSDT', 1)
+        self.assertEqual(order['status'], 'FILLED')
+        self.assertEqual([fill['tradeId'] for fill in self.state.fills('BTCUSDT', 1)], [7, 8])
+
+    def test_closed_orders_are_evicted_oldest_first(self):
+        self.state.apply_order(rest_order(0))
+        for order_id in range(1, ORDER_HISTORY + 2):
+            self.state.apply_order(rest_order(order_id, 'FILLED', '2'))
+        self.assertIsNone(self.state.order('BTCUSDT', 1))
+        self.assertIsNotNone(self.state.order('BTCUSDT', 2))
+        # open orders are never evicted
+        self.assertEqual([order['orderId'] for order in self.state.open_orders()], [0])
+
+    def test_balances_apply_in_update_order(self):
+        self.state.apply_account({'updateTime': 2000, 'balances': [
+            {'asset': 'BTC', 'free': '1', 'locked': '0.5'},
+            {'asset': 'USDT', 'free': '100', 'locked': '0'}]})
+        self.state.apply_position({'u': 1000, 'B': [{'a': 'BTC', 'f': '9', 'l': '0'}]})
+        self.assertEqual(self.state.balance('btc'), Balance(1.0, 0.5))
+        self.assertEqual(self.state.balance('btc').total, 1.5)
+        self.state.apply_position({'u': 3000, 'B': [{'a': 'BTC', 'f': '2', 'l': '0'}]})
+        self.state.apply_account({'updateTime': 2500, 'balances': []})
+        self.assertEqual(self.state.balance('BTC'), Balance(2.0, 0.0))
+        self.assertEqual(self.state.balance('USDT').free, 100.0)
+        self.assertEqual(self.state.balance('ETH'), Balance(0.0, 0.0))
+
+    def test_wait_for_order_returns_on_the_fill(self):
+        self.state.apply_order(rest_order(1))
+        threading.Timer(0.1, self.state.apply_execution_report,
+                        [execution_report(1, 'FILLED', '2', 3, '2')]).start()
+        started = time.monotonic()
+        order = self.state.wait_for_order('BTCUSDT', 1, timeout=5)
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(order['status'], 'FILLED')
+        self.assertEqual(self.state.wait_for_order('BTCUSDT', 2, timeout=0.05), None)
+
+
+class UserDataStreamTests(StandInCase):
+
+    def test_user_data_stream_keeps_the_account_live(self):
+        multiplexer = StreamMultiplexer()
+        stream = UserDataStream(multiplexer).start()
+        try:
+            self.assertTrue(user_data.account_state.live)
+            self.assertGreater(user_data.account_balances(['USDT'])['USDT'].free, 0)
+            # events sent before the stream connects are only seen on a resync
+            deadline = time.monotonic() + 5
+            while not any(connection.ws for connection in multiplexer.connections) and \
+                    (time.monotonic() < deadline):
+                time.sleep(0.05)
+            time.sleep(0.3)
+            receipt = trade.request_order({'symbol': 'BNBUSDT', 'side': 'BUY',
+                                           'type': 'MARKET', 'quoteOrderQty': 1000})
+            deadline = time.monotonic() + 5
+            while (user_data.account_state.balance('BNB').free == 0) and \
+                    (time.monotonic() < deadline):
+                time.sleep(0.05)
+            self.assertAlmostEqual(
+                user_data.account_state.balance('BNB').free,
+                float(receipt['executedQty']) - float(receipt['fills'][0]['commission']))
+        finally:
+            stream.stop()
+        self.assertFalse(user_data.account_state.live)
+
+
+class OrderRequestTests(StandInCase):
+
+    def test_market_order_is_confirmed_from_its_response(self):
+        receipt = trade.request_order({'symbol': 'BTCUSDT', 'side': 'BUY', 'type': 'MARKET',
+                                       'quoteOrderQty': 1000})
+        self.assertEqual(receipt['status'], 'FILLED')
+        self.assertIn('confirmLatencyMs', receipt)
+        tracked = user_data.account_state.order('BTCUSDT', receipt['orderId'])
+        self.assertEqual(tracked['fills'], receipt['fills'])
+
+    def test_rejected_order_returns_the_error(self):
+        receipt = trade.request_order({'symbol': 'BTCUSDT', 'side': 'BUY', 'type': 'MARKET',
+                                       'quoteOrderQty': 1})
+        self.assertEqual(receipt['code'], -1013)
+        self.assertNotIn('confirmLatencyMs', receipt)
+
+    def test_failed_confirmation_returns_the_placed_order(self):
+        state = mock.Mock(spec=AccountState)
+        state.apply_order.side_effect = RuntimeError("confirmation failed")
+        with mock.patch.object(trade, 'account_state', state), \
+                self.assertLogs('main', 'ERROR'):
+            receipt = trade.request_order({'symbol': 'ETHUSDT', 'side': 'BUY',
+                                           'type': 'MARKET', 'quoteOrderQty': 1000})
+        self.assertEqual(receipt['status'], 'FILLED')
+        self.assertIn('confirmLatencyMs', receipt)
+
+if __name__ == "__main__":
+    unittest.main()